@@ -1,12 +1,27 @@
+import contextlib
+import hashlib
+import heapq
+import importlib.metadata
+import io
+import itertools
 import json
+import multiprocessing
 import os
+import queue
 import re
+import shutil
+import sqlite3
 import subprocess
+import sys
+import tempfile
 import threading
 import time
 import uuid
 from collections import deque
-from datetime import date, datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+from xml.etree import ElementTree
 
 import requests
 from flask import Flask, Response, jsonify, redirect, render_template, request, url_for
@@ -18,135 +33,2368 @@ JELLYFIN_URL = "http://192.168.5.39:8096"
 YOUTUBE_PATH = "/mnt/ceph-videos/YouTube/"
 WATCHES_FILE = "/app/data/watches.json"
 ARCHIVES_DIR = "/app/archives"
-WATCHES_LOCK = threading.Lock()
+DOWNLOAD_ARCHIVE_FILE = "/app/data/download-archive.txt"
+QUEUE_FILE = "/app/data/queue.json"
+DB_FILE = "/app/data/downloader.db"
+METADATA_CACHE_DIR = "/app/data/metadata-cache"
+JOB_LOG_DIR = "/app/data/job-logs"
+EJS_CACHE_DIR = "/app/cache/ejs"
+EJS_REFRESH_HOURS = float(os.environ.get("EJS_REFRESH_HOURS", "24"))
+METADATA_CACHE_TTL = int(os.environ.get("METADATA_CACHE_TTL", "3600"))
+METADATA_CACHE_MAX_MB = int(os.environ.get("METADATA_CACHE_MAX_MB", "256"))
+DOWNLOAD_WORKERS = int(os.environ.get("DOWNLOAD_WORKERS", "2"))
+WATCH_WORKERS = int(os.environ.get("WATCH_WORKERS", "2"))
+POSTPROCESS_WORKERS = int(os.environ.get("POSTPROCESS_WORKERS", "2"))
+STAGING_DIR = os.environ.get("STAGING_DIR", "/app/staging")
+STAGING_MIN_FREE_GB = float(os.environ.get("STAGING_MIN_FREE_GB", "20"))
+COMMIT_BUFFER_MB = int(os.environ.get("COMMIT_BUFFER_MB", "16"))
+DEFAULT_PROFILE = os.environ.get("THROUGHPUT_PROFILE", "default")
+FRAGMENT_BUDGET = int(os.environ.get("FRAGMENT_BUDGET", "16"))
+YTDLP_BACKEND = os.environ.get("YTDLP_BACKEND", "subprocess")
+YTDLP_API_PROCESSES = int(os.environ.get("YTDLP_API_PROCESSES", DOWNLOAD_WORKERS + WATCH_WORKERS))
+WATCH_INCREMENTAL = os.environ.get("WATCH_INCREMENTAL", "1") == "1"
+WATCH_FULL_SWEEP_DAYS = float(os.environ.get("WATCH_FULL_SWEEP_DAYS", "7"))
+WATCH_FEED_PRECHECK = os.environ.get("WATCH_FEED_PRECHECK", "1") == "1"
+YOUTUBE_FEED_URL = os.environ.get("YOUTUBE_FEED_URL", "https://www.youtube.com/feeds/videos.xml")
+FEED_TIMEOUT = 10
+WATCH_GROUP_WINDOW = float(os.environ.get("WATCH_GROUP_WINDOW", "900"))
+SCHEDULER_JITTER = float(os.environ.get("SCHEDULER_JITTER", "0.05"))
+SCHEDULER_MAX_SLEEP = 3600
+SSE_HEARTBEAT = 15
+JOB_TTL = int(os.environ.get("JOB_TTL", "3600"))
+MAX_JOBS = int(os.environ.get("MAX_JOBS", "200"))
+PHASE_TIMELINE_MAX = int(os.environ.get("PHASE_TIMELINE_MAX", "200"))
+JOB_LOG_MAX_MB = float(os.environ.get("JOB_LOG_MAX_MB", "32"))
+JOB_LOG_RETENTION_DAYS = float(os.environ.get("JOB_LOG_RETENTION_DAYS", "30"))
+HISTORY_LOG_LINES = 20
+SERVER = os.environ.get("SERVER", "gevent")
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "1000"))
+HTTP_THREADS = int(os.environ.get("HTTP_THREADS", "10"))
+JELLYFIN_SCAN_DELAY = float(os.environ.get("JELLYFIN_SCAN_DELAY", "30"))
+JELLYFIN_SCAN_MAX_DELAY = float(os.environ.get("JELLYFIN_SCAN_MAX_DELAY", "300"))
+JELLYFIN_SCAN_RETRIES = 3
+JELLYFIN_SCAN_BACKOFF = 2
 
 # ── Download job tracking ──────────────────────────────────────
 # Jobs persist in memory; keyed by job_id string.
-# Each job: {"status": "running"|"done"|"error", "progress": 0-100,
-#            "log": deque(maxlen=50), "title": str}
+# Each job: {"status": "queued"|"running"|"done"|"error"|"cancelled",
+#            "progress": 0-100, "log": deque(maxlen=50), "title": str,
+#            "watch_id": str|None}
+# "log_total" counts every line ever appended, so progress streams can
+# tell which lines a client has not seen yet.
 
 _jobs = {}
 _jobs_lock = threading.Lock()
 
-_watch_jobs = {}   # watch_id -> job_id, for currently-running watch jobs
+_TERMINAL_STATUSES = ("done", "error", "cancelled")
+
+# Writers call _notify_job() after changing a job; progress streams block
+# in wait_for_job_change() until the job's version moves past what they sent.
+# _any_job_signal is bumped on every change for the multiplexed /events stream.
+# Streams served from the gevent event loop wait on a gevent async watcher
+# registered in "watchers" instead of the condition (see Serving).
+_job_signals = {}  # job_id -> {"cond": Condition, "version": int, "watchers": set}
+_any_job_signal = {"cond": threading.Condition(), "version": 0, "watchers": set()}
+
+
+def _new_job(status="running", watch_id=None, url=None):
+    return {
+        "status": status,
+        "progress": 0,
+        "log": deque(maxlen=50),
+        "log_total": 0,
+        "title": "",
+        "watch_id": watch_id,
+        "url": url,
+        "bytes": 0,
+        "exit_code": None,
+        "created": time.time(),
+        "started": None,
+        "finished": None,
+    }
+
+
+def _job_signal(job_id):
+    with _jobs_lock:
+        signal = _job_signals.get(job_id)
+        if signal is None:
+            signal = _job_signals[job_id] = {
+                "cond": threading.Condition(), "version": 0, "watchers": set(),
+            }
+        return signal
+
+
+def _bump_signal(signal):
+    with signal["cond"]:
+        signal["version"] += 1
+        signal["cond"].notify_all()
+        for watcher in signal["watchers"]:
+            watcher.send()
+
+
+def _wait_signal(signal, seen_version, timeout):
+    if threading.get_ident() == _green["thread"]:
+        return _wait_signal_green(signal, seen_version, timeout)
+    with signal["cond"]:
+        if signal["cond"].wait_for(lambda: signal["version"] != seen_version, timeout):
+            return signal["version"]
+        return None
+
+
+def _notify_job(job_id):
+    """Wake every progress stream waiting on *job_id*."""
+    _bump_signal(_job_signal(job_id))
+    _bump_signal(_any_job_signal)
+
+
+def _append_log(job_id, line):
+    """Append *line* to the job's log and log file, keeping log_total in step."""
+    job = _jobs[job_id]
+    with _job_signal(job_id)["cond"]:
+        job["log"].append(line)
+        job["log_total"] = job.get("log_total", 0) + 1
+    # Outside the signal lock, which progress streams on the event loop take.
+    _write_job_log(job_id, line)
+
+
+def _log_since(job_id, job, lines_seen):
+    """Return (lines appended after the first *lines_seen*, total line count).
+
+    *job* is the caller's reference, which stays readable after the job
+    is evicted from _jobs. Lines that have already fallen out of the log
+    deque are skipped.
+    """
+    signal = _job_signals.get(job_id)  # gone once evicted, when nothing appends any more
+    with signal["cond"] if signal else contextlib.nullcontext():
+        log = list(job["log"])
+        total = job.get("log_total", len(log))
+    missing = total - lines_seen
+    return (log[-missing:] if missing > 0 else []), total
+
+
+def wait_for_job_change(job_id, seen_version, timeout):
+    """Block until *job_id* changes past *seen_version*.
+
+    Returns the new version, or None if *timeout* seconds pass first.
+    """
+    return _wait_signal(_job_signal(job_id), seen_version, timeout)
+
+
+_watch_jobs = {}   # watch_id -> job_id, for queued or running watch jobs
 _watch_jobs_lock = threading.Lock()
 
-# ── Shared helpers ──────────────────────────────────────────────
+# Watch runs from both the scheduler and the Run button share this pool,
+# so WATCH_WORKERS caps how many channels are being fetched at once.
+_watch_executor = ThreadPoolExecutor(max_workers=WATCH_WORKERS, thread_name_prefix="watch")
+
+
+# ── Job logs ────────────────────────────────────────────────────
+# The log deque only keeps a job's last lines; every line is also
+# appended to the job's log file under JOB_LOG_DIR/<job_id>/. A log is
+# split into JOB_LOG_SEGMENTS segments named after the byte offset they
+# start at, so offsets stay valid as it rotates: once the newest segment
+# is full a new one starts and the oldest is deleted, capping each job
+# at JOB_LOG_MAX_MB. GET /jobs/<job_id>/log serves byte ranges of what
+# is retained. Logs untouched for JOB_LOG_RETENTION_DAYS are removed.
+
+JOB_LOG_SEGMENTS = 4
+JOB_LOG_CHUNK = 64 * 1024          # default bytes per /log response
+JOB_LOG_MAX_CHUNK = 1024 * 1024    # most bytes per /log response
+
+_job_logs = {}   # job_id -> {"file": open segment, "start": its offset, "size": bytes in it}
+_job_log_lock = threading.Lock()
+_job_log_state = {"pruned": 0.0}
+_JOB_ID_RE = re.compile(r"^[\w-]+$")
+
+
+def _job_log_segments(job_id):
+    """Return [(start offset, path)] of a job's log segments, oldest first."""
+    directory = os.path.join(JOB_LOG_DIR, job_id)
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(
+        (int(name[:-4]), os.path.join(directory, name))
+        for name in names if name.endswith(".log") and name[:-4].isdigit()
+    )
+
+
+def _open_job_log(job_id, start=None):
+    """Open the segment starting at *start*, or reopen the newest one."""
+    os.makedirs(os.path.join(JOB_LOG_DIR, job_id), exist_ok=True)
+    segments = _job_log_segments(job_id)
+    size = 0
+    if start is None:
+        start, size = (segments[-1][0], os.path.getsize(segments[-1][1])) if segments else (0, 0)
+    else:
+        for _, path in segments[:max(len(segments) + 1 - JOB_LOG_SEGMENTS, 0)]:
+            os.remove(path)
+    path = os.path.join(JOB_LOG_DIR, job_id, f"{start}.log")
+    log = _job_logs[job_id] = {"file": open(path, "ab"), "start": start, "size": size}
+    return log
+
+
+def _write_job_log(job_id, line):
+    """Append *line* to the job's log file, starting a new segment when full."""
+    data = (line + "\n").encode("utf-8", "replace")
+    with _job_log_lock:
+        try:
+            log = _job_logs.get(job_id) or _open_job_log(job_id)
+            if log["size"] and log["size"] + len(data) > JOB_LOG_MAX_MB * 1024 ** 2 / JOB_LOG_SEGMENTS:
+                log["file"].close()
+                log = _open_job_log(job_id, log["start"] + log["size"])
+            log["file"].write(data)
+            log["file"].flush()
+            log["size"] += len(data)
+        except OSError as e:
+            _job_logs.pop(job_id, None)
+            print(f"[job-log] could not write the log of job {job_id}: {e}", flush=True)
+
+
+def _close_job_log(job_id):
+    """Close a job's log file; a later line reopens it."""
+    with _job_log_lock:
+        log = _job_logs.pop(job_id, None)
+        if log:
+            log["file"].close()
+
+
+def job_log_extent(job_id):
+    """Return (first retained offset, end offset) of a job's log, or None."""
+    segments = _job_log_segments(job_id)
+    if not segments:
+        return None
+    last_start, last_path = segments[-1]
+    return segments[0][0], last_start + os.path.getsize(last_path)
+
+
+def read_job_log(job_id, start, end):
+    """Return bytes [start, end) of a job's log, as far as they are retained."""
+    segments = _job_log_segments(job_id)
+    ends = [seg_start for seg_start, _ in segments[1:]] + [None]
+    chunks = []
+    for (seg_start, path), seg_end in zip(segments, ends):
+        if seg_start >= end:
+            break
+        if seg_end is not None and seg_end <= start:
+            continue
+        try:
+            with open(path, "rb") as f:
+                f.seek(max(start - seg_start, 0))
+                chunks.append(f.read(end - max(start, seg_start)))
+        except FileNotFoundError:  # rotated away meanwhile
+            continue
+    return b"".join(chunks)
+
+
+def _prune_job_logs(now=None):
+    """Delete the logs of jobs not written to for JOB_LOG_RETENTION_DAYS."""
+    now = now or time.time()
+    _job_log_state["pruned"] = now
+    try:
+        job_ids = os.listdir(JOB_LOG_DIR)
+    except FileNotFoundError:
+        return
+    for job_id in job_ids:
+        if job_id in _job_logs:
+            continue
+        directory = os.path.join(JOB_LOG_DIR, job_id)
+        try:
+            paths = [path for _, path in _job_log_segments(job_id)] or [directory]
+            if now - max(map(os.path.getmtime, paths)) > JOB_LOG_RETENTION_DAYS * 86400:
+                shutil.rmtree(directory)
+        except OSError as e:
+            print(f"[job-log] could not prune {directory}: {e}", flush=True)
+
+
+# ── Metrics ─────────────────────────────────────────────────────
+# Counters, gauges and histograms for GET /metrics, in the Prometheus
+# text format. Each metric is declared in _METRICS; values are keyed by
+# metric name and a sorted tuple of label pairs. Queue depths and running
+# jobs are read live when the endpoint is scraped.
+
+_DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+_METRICS = {
+    "downloader_jobs_total": ("counter", "Finished jobs by kind and final status."),
+    "downloader_job_duration_seconds": (
+        "histogram", "Job wall time from start to finish.", _DURATION_BUCKETS),
+    "downloader_downloaded_bytes_total": ("counter", "Bytes downloaded by finished jobs."),
+    "downloader_download_speed_mb_per_s": (
+        "histogram", "Average download-stage speed per job, by throughput profile.",
+        (0.5, 1, 2, 5, 10, 20, 50, 100)),
+    "downloader_ytdlp_exit_codes_total": ("counter", "yt-dlp exit codes by pipeline stage."),
+    "downloader_scheduler_lag_seconds": (
+        "histogram", "How late the scheduler started a watch after it fell due.",
+        (0.1, 0.5, 1, 5, 15, 60, 300, 900)),
+    "downloader_scheduler_last_lag_seconds": ("gauge", "Lag of each watch's latest scheduled start."),
+    "downloader_jellyfin_scan_seconds": (
+        "histogram", "Latency of Jellyfin library update requests.",
+        (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)),
+    "downloader_jellyfin_scan_responses_total": (
+        "counter", "Jellyfin library update responses by HTTP status (or \"error\")."),
+}
+
+_metrics_lock = threading.Lock()
+_metric_values = {}   # (name, labels) -> float, or [bucket counts, sum, count] for histograms
+
+
+def _metric_key(name, labels):
+    if name not in _METRICS:
+        raise KeyError(f"undeclared metric {name}")
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def count_metric(name, value=1, **labels):
+    """Add *value* to a counter."""
+    key = _metric_key(name, labels)
+    with _metrics_lock:
+        _metric_values[key] = _metric_values.get(key, 0) + value
+
+
+def set_metric(name, value, **labels):
+    """Set a gauge."""
+    key = _metric_key(name, labels)
+    with _metrics_lock:
+        _metric_values[key] = value
+
+
+def observe_metric(name, value, **labels):
+    """Record one observation in a histogram."""
+    key = _metric_key(name, labels)
+    buckets = _METRICS[name][2]
+    with _metrics_lock:
+        counts, total, n = _metric_values.get(key) or ([0] * len(buckets), 0, 0)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                counts[i] += 1
+        _metric_values[key] = [counts, total + value, n + 1]
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in pairs) + "}"
+
+
+def _live_gauges():
+    """Return [(name, type, help, [(labels, value)])] read at scrape time."""
+    depths = stage_depths()
+    queued = [((("stage", stage),), d.get("queued", 0)) for stage, d in depths.items()]
+    running = [((("stage", stage),), d["running"]) for stage, d in depths.items()]
+    with _jobs_lock:
+        statuses = [job["status"] for job in _jobs.values()]
+    return [
+        ("downloader_stage_queued", "gauge", "Items waiting in each pipeline stage.", queued),
+        ("downloader_stage_running", "gauge", "Items being worked on in each pipeline stage.", running),
+        ("downloader_running_jobs", "gauge", "Jobs in the running state.",
+         [((), statuses.count("running"))]),
+    ]
+
+
+def render_metrics():
+    """Render every metric in the Prometheus text exposition format."""
+    with _metrics_lock:
+        values = {k: (list(v[0]), v[1], v[2]) if isinstance(v, list) else v
+                  for k, v in _metric_values.items()}
+    lines = []
+    for name, (kind, help_text, *rest) in _METRICS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        for (metric, labels), value in sorted(values.items()):
+            if metric != name:
+                continue
+            if kind != "histogram":
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+                continue
+            counts, total, n = value
+            for bound, count in zip(rest[0], counts):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {n}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {n}")
+    for name, kind, help_text, samples in _live_gauges():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        lines += [f"{name}{_format_labels(labels)} {value}" for labels, value in samples]
+    return "\n".join(lines) + "\n"
+
+
+# ── Shared helpers ──────────────────────────────────────────────
+
+def trigger_jellyfin_scan(paths=None):
+    """Tell Jellyfin that *paths* changed, or rescan the whole YouTube path.
+
+    Retries with exponential backoff on errors and 5xx responses.
+    Returns True if Jellyfin accepted the update.
+    """
+    if paths:
+        updates = [{"Path": p, "UpdateType": "Created"} for p in paths]
+    else:
+        updates = [{"Path": YOUTUBE_PATH, "UpdateType": "scan"}]
+
+    for attempt in range(JELLYFIN_SCAN_RETRIES):
+        if attempt:
+            time.sleep(JELLYFIN_SCAN_BACKOFF * 2 ** (attempt - 1))
+        started = time.monotonic()
+        try:
+            response = _jellyfin_session.post(
+                f"{JELLYFIN_URL}/Library/Media/Updated",
+                headers={
+                    "X-MediaBrowser-Token": JELLYFIN_TOKEN,
+                    "Content-Type": "application/json",
+                },
+                json={"dto": {"Updates": updates}},
+                timeout=5,
+            )
+            observe_metric("downloader_jellyfin_scan_seconds", time.monotonic() - started)
+            count_metric("downloader_jellyfin_scan_responses_total", code=response.status_code)
+            print(
+                f"[jellyfin] HTTP {response.status_code} | bytes={len(response.content)}"
+                f" | paths={len(updates)}",
+                flush=True,
+            )
+            if response.status_code < 500:
+                return response.ok
+        except Exception as e:
+            count_metric("downloader_jellyfin_scan_responses_total", code="error")
+            print(f"[jellyfin] scan failed: {e}", flush=True)
+    return False
+
+
+# ── Jellyfin scan dispatcher ────────────────────────────────────
+# Finished jobs report the directories they wrote to. Requests are
+# debounced for JELLYFIN_SCAN_DELAY seconds (but never held longer than
+# JELLYFIN_SCAN_MAX_DELAY) and sent to Jellyfin as one batched update.
+
+_jellyfin_session = requests.Session()
+_scan_pending = set()
+_scan_window = {}      # "first": monotonic time of the oldest pending request, "flush_at"
+_scan_cond = threading.Condition()
+
+
+def request_jellyfin_scan(paths=None):
+    """Queue *paths* (default: the whole YouTube path) for a coalesced scan."""
+    now = time.monotonic()
+    with _scan_cond:
+        first = _scan_window.setdefault("first", now)
+        _scan_window["flush_at"] = min(now + JELLYFIN_SCAN_DELAY, first + JELLYFIN_SCAN_MAX_DELAY)
+        _scan_pending.update(paths or [YOUTUBE_PATH])
+        _scan_cond.notify()
+
+
+def _collapse_paths(paths):
+    """Sort *paths* and drop any that sit under another path in the set."""
+    result = []
+    for path in sorted({os.path.normpath(p) for p in paths}):
+        if not any(path == kept or path.startswith(kept + os.sep) for kept in result):
+            result.append(path)
+    return result
+
+
+def _take_scan_batch():
+    """Block until the debounce window closes, then return the pending paths."""
+    with _scan_cond:
+        while True:
+            timeout = None
+            if _scan_pending:
+                timeout = _scan_window["flush_at"] - time.monotonic()
+                if timeout <= 0:
+                    break
+            _scan_cond.wait(timeout)
+        batch = _collapse_paths(_scan_pending)
+        _scan_pending.clear()
+        _scan_window.clear()
+        return batch
+
+
+def _scan_dispatcher():
+    while True:
+        batch = _take_scan_batch()
+        if os.path.normpath(YOUTUBE_PATH) in batch:
+            batch = None
+        trigger_jellyfin_scan(batch)
+
+
+def start_scan_dispatcher():
+    threading.Thread(target=_scan_dispatcher, daemon=True).start()
+
+
+# ── SQLite store ────────────────────────────────────────────────
+# Watches and job history live in DB_FILE. Each thread keeps its own
+# connection; WAL mode lets the scheduler, workers and request threads
+# read while another writes.
+
+_db_local = threading.local()
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS watches (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        channel_url TEXT NOT NULL,
+        title_filter TEXT NOT NULL DEFAULT '',
+        title_exclude TEXT NOT NULL DEFAULT '',
+        start_date TEXT NOT NULL,
+        end_date TEXT NOT NULL,
+        interval_hours INTEGER NOT NULL DEFAULT 4,
+        enabled INTEGER NOT NULL DEFAULT 1,
+        last_run TEXT,
+        hwm_video_id TEXT,
+        hwm_date TEXT,
+        last_full_sweep TEXT,
+        feed_seen TEXT,
+        profile TEXT NOT NULL DEFAULT 'default'
+    );
+    CREATE TABLE IF NOT EXISTS job_history (
+        job_id TEXT PRIMARY KEY,
+        watch_id TEXT,
+        url TEXT,
+        title TEXT,
+        status TEXT NOT NULL,
+        exit_code INTEGER,
+        bytes INTEGER,
+        created TEXT,
+        started TEXT,
+        finished TEXT NOT NULL,
+        duration REAL,
+        log_tail TEXT,
+        listed INTEGER,
+        filtered INTEGER,
+        downloaded INTEGER,
+        profile TEXT,
+        mb_per_s REAL,
+        phase_seconds TEXT,
+        timeline TEXT
+    );
+    CREATE INDEX IF NOT EXISTS job_history_finished ON job_history (finished);
+    CREATE INDEX IF NOT EXISTS job_history_watch ON job_history (watch_id, finished);
+    CREATE TABLE IF NOT EXISTS archive (
+        extractor TEXT NOT NULL,
+        video_id TEXT NOT NULL,
+        watch_id TEXT,
+        job_id TEXT,
+        filepath TEXT,
+        downloaded TEXT,
+        PRIMARY KEY (extractor, video_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS channel_ids (
+        url TEXT PRIMARY KEY,
+        channel_id TEXT NOT NULL,
+        resolved TEXT NOT NULL
+    );
+"""
+
+
+def _db():
+    """Return this thread's SQLite connection, creating the schema on first use."""
+    conn = getattr(_db_local, "conn", None)
+    if conn is None or _db_local.path != DB_FILE:
+        conn = sqlite3.connect(DB_FILE, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _ensure_columns(conn, "watches", {**_WATCH_STATE_COLUMNS, **_WATCH_ADDED_COLUMNS})
+        _ensure_columns(conn, "job_history", _HISTORY_ADDED_COLUMNS)
+        _migrate_watches_json(conn)
+        _import_text_archives(conn)
+        _db_local.conn = conn
+        _db_local.path = DB_FILE
+    return conn
+
+
+def _ensure_columns(conn, table, columns):
+    """Add any of *columns* (name -> SQL type) missing from an older *table*."""
+    existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, sql_type in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}")
+
+
+# ── Watches persistence ─────────────────────────────────────────
+
+_WATCH_COLUMNS = (
+    "id", "name", "channel_url", "title_filter", "title_exclude",
+    "start_date", "end_date", "interval_hours", "enabled", "last_run", "profile",
+)
+_WATCH_DEFAULTS = {
+    "title_filter": "", "title_exclude": "", "interval_hours": 4,
+    "enabled": True, "last_run": None, "profile": "default",
+}
+
+# Form fields added after the first release, for older databases.
+_WATCH_ADDED_COLUMNS = {"profile": "TEXT NOT NULL DEFAULT 'default'"}
+
+# Run bookkeeping kept alongside each watch but never set from the form.
+_WATCH_STATE_COLUMNS = {
+    "hwm_video_id": "TEXT",
+    "hwm_date": "TEXT",
+    "last_full_sweep": "TEXT",
+    "feed_seen": "TEXT",
+}
+
+
+def _migrate_watches_json(conn):
+    """One-time import of a legacy watches.json into an empty watches table.
+
+    The file is renamed to watches.json.migrated afterwards. A corrupt file
+    is left in place and nothing is imported.
+    """
+    if not os.path.isfile(WATCHES_FILE):
+        return
+    try:
+        with open(WATCHES_FILE) as f:
+            content = f.read().strip()
+            watches = json.loads(content) if content else []
+    except (json.JSONDecodeError, OSError) as e:
+        print(f"[watches] not migrating {WATCHES_FILE}: {e}", flush=True)
+        return
+
+    # Migrate legacy playlist_url → channel_url
+    for w in watches:
+        if "playlist_url" in w and "channel_url" not in w:
+            w["channel_url"] = w.pop("playlist_url")
+
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if conn.execute("SELECT COUNT(*) FROM watches").fetchone()[0] == 0:
+            for w in watches:
+                _insert_watch(conn, w, "INSERT OR IGNORE")
+    os.replace(WATCHES_FILE, WATCHES_FILE + ".migrated")
+    print(f"[watches] migrated {len(watches)} watches from {WATCHES_FILE}", flush=True)
+
+
+def _insert_watch(conn, watch, verb="INSERT"):
+    row = {**_WATCH_DEFAULTS, **watch}
+    conn.execute(
+        f"{verb} INTO watches ({', '.join(_WATCH_COLUMNS)}) "
+        f"VALUES ({', '.join('?' * len(_WATCH_COLUMNS))})",
+        [row[c] for c in _WATCH_COLUMNS],
+    )
+
+
+def _watch_from_row(row):
+    watch = dict(row)
+    watch["enabled"] = bool(watch["enabled"])
+    return watch
+
+
+def load_watches():
+    rows = _db().execute("SELECT * FROM watches ORDER BY rowid").fetchall()
+    return [_watch_from_row(r) for r in rows]
+
+
+def get_watch(watch_id):
+    row = _db().execute("SELECT * FROM watches WHERE id = ?", (watch_id,)).fetchone()
+    return _watch_from_row(row) if row else None
+
+
+def add_watch(watch):
+    conn = _db()
+    with conn:
+        _insert_watch(conn, watch)
+
+
+def update_watch(watch):
+    """Overwrite every stored field of *watch*. Returns False if it is gone."""
+    fields = [c for c in _WATCH_COLUMNS if c != "id"]
+    row = {**_WATCH_DEFAULTS, **watch}
+    conn = _db()
+    with conn:
+        cur = conn.execute(
+            f"UPDATE watches SET {', '.join(f'{c} = ?' for c in fields)} WHERE id = ?",
+            [row[c] for c in fields] + [watch["id"]],
+        )
+    return cur.rowcount > 0
+
+
+def delete_watch(watch_id):
+    conn = _db()
+    with conn:
+        conn.execute("DELETE FROM watches WHERE id = ?", (watch_id,))
+
+
+def set_watch_state(watch_id, **fields):
+    """Update run bookkeeping columns (see _WATCH_STATE_COLUMNS) for a watch."""
+    unknown = set(fields) - set(_WATCH_STATE_COLUMNS)
+    if unknown:
+        raise ValueError(f"not watch state columns: {sorted(unknown)}")
+    conn = _db()
+    with conn:
+        conn.execute(
+            f"UPDATE watches SET {', '.join(f'{c} = ?' for c in fields)} WHERE id = ?",
+            list(fields.values()) + [watch_id],
+        )
+
+
+def set_last_run(watch_id, last_run):
+    conn = _db()
+    with conn:
+        conn.execute("UPDATE watches SET last_run = ? WHERE id = ?", (last_run, watch_id))
+
+
+def save_watches(watches):
+    """Replace the whole watch list in one transaction."""
+    conn = _db()
+    with conn:
+        conn.execute("DELETE FROM watches")
+        for w in watches:
+            _insert_watch(conn, w)
+
+
+def find_watch(watches, watch_id):
+    return next((w for w in watches if w["id"] == watch_id), None)
+
+
+# ── Download archive ────────────────────────────────────────────
+# Watches and manual downloads share one archive: the archive table,
+# keyed by extractor and video ID. yt-dlp is not given --download-archive;
+# candidates are checked against the table before they are handed to it,
+# and each finished video is reported back through --print-to-file and
+# recorded with the watch or job that fetched it.
+
+_ARCHIVE_COLUMNS = ("extractor", "video_id", "watch_id", "job_id", "filepath", "downloaded")
+_ARCHIVE_TEMPLATE = "after_move:%(extractor_key)s %(id)s %(filepath)s"
+
+
+def has_video(video_id, extractor="youtube"):
+    """Return True if the archive already holds *video_id*."""
+    row = _db().execute(
+        "SELECT 1 FROM archive WHERE extractor = ? AND video_id = ?",
+        (extractor.lower(), video_id),
+    ).fetchone()
+    return row is not None
+
+
+def get_archived(video_id, extractor="youtube"):
+    """Return the archive record for *video_id*, or None."""
+    row = _db().execute(
+        "SELECT * FROM archive WHERE extractor = ? AND video_id = ?",
+        (extractor.lower(), video_id),
+    ).fetchone()
+    return dict(row) if row else None
+
+
+def record_videos(videos, watch_id=None, job_id=None):
+    """Add (extractor, video_id, filepath) tuples to the archive.
+
+    A video that is already archived keeps its original record.
+    """
+    downloaded = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    conn = _db()
+    with conn:
+        conn.executemany(
+            f"INSERT OR IGNORE INTO archive ({', '.join(_ARCHIVE_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(_ARCHIVE_COLUMNS))})",
+            [(extractor.lower(), video_id, watch_id, job_id, filepath, downloaded)
+             for extractor, video_id, filepath in videos],
+        )
+
+
+def _archive_report_file(job_id):
+    """Return a scratch path for yt-dlp to report finished videos to."""
+    return os.path.join(tempfile.gettempdir(), f"archive-{job_id}.txt")
+
+
+def _archive_args(report_file):
+    return ["--print-to-file", _ARCHIVE_TEMPLATE, report_file]
+
+
+def _archive_export_file(job_id):
+    return os.path.join(tempfile.gettempdir(), f"download-archive-{job_id}.txt")
+
+
+def _archive_export_args(job_id):
+    """Return --download-archive arguments for a run the archive was not checked for.
+
+    Runs over a URL that could not be listed, or whose extractor and video
+    ID are only known once yt-dlp extracts it, get the archive table
+    exported as a yt-dlp archive file so yt-dlp skips archived videos
+    itself. _remove_archive_export() deletes it after the run.
+    """
+    path = _archive_export_file(job_id)
+    rows = _db().execute("SELECT extractor, video_id FROM archive").fetchall()
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(f"{extractor} {video_id}\n" for extractor, video_id in rows)
+    return ["--download-archive", path]
+
+
+def _remove_archive_export(job_id):
+    try:
+        os.remove(_archive_export_file(job_id))
+    except FileNotFoundError:
+        pass
+
+
+def _collect_archive_report(report_file, watch_id=None, job_id=None):
+    """Archive the videos yt-dlp reported in *report_file*, then remove it.
+
+    Returns how many videos were reported.
+    """
+    try:
+        with open(report_file, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return 0
+    os.remove(report_file)
+    videos = [line.split(" ", 2) for line in lines if line.count(" ") >= 2]
+    videos = [(extractor, video_id, _final_path(path)) for extractor, video_id, path in videos]
+    record_videos(videos, watch_id=watch_id, job_id=job_id)
+    return len(videos)
+
+
+def _import_text_archives(conn):
+    """One-time import of yt-dlp text archives into the archive table.
+
+    Covers the manual download archive and the per-watch archives in
+    ARCHIVES_DIR; each file is renamed to <name>.migrated afterwards.
+    """
+    sources = [(DOWNLOAD_ARCHIVE_FILE, None)]
+    if os.path.isdir(ARCHIVES_DIR):
+        sources += [
+            (os.path.join(ARCHIVES_DIR, name), name[:-len(".txt")])
+            for name in sorted(os.listdir(ARCHIVES_DIR)) if name.endswith(".txt")
+        ]
+    for path, watch_id in sources:
+        if not os.path.isfile(path):
+            continue
+        try:
+            with open(path, encoding="utf-8") as f:
+                entries = [line.split() for line in f]
+        except OSError as e:
+            print(f"[archive] not importing {path}: {e}", flush=True)
+            continue
+        rows = [(e[0].lower(), e[1], watch_id) for e in entries if len(e) == 2]
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO archive (extractor, video_id, watch_id) VALUES (?, ?, ?)",
+                rows,
+            )
+        try:
+            os.replace(path, path + ".migrated")
+        except FileNotFoundError:
+            pass  # another thread's connection imported it first
+        print(f"[archive] imported {len(rows)} videos from {path}", flush=True)
+
+
+# ── Metadata cache ──────────────────────────────────────────────
+# yt-dlp writes the info dict of every video it extracts into
+# METADATA_CACHE_DIR (--write-info-json). A later download of the same
+# video within METADATA_CACHE_TTL seconds replays that file with
+# --load-info-json instead of extracting again; the TTL has to stay well
+# under the lifetime of YouTube's signed format URLs. Complete playlist
+# and channel listings are cached alongside, keyed by playlist ID or URL.
+# Least recently used files go first once the directory grows past
+# METADATA_CACHE_MAX_MB.
+
+_metadata_stats = {
+    "video_hits": 0, "video_misses": 0,
+    "playlist_hits": 0, "playlist_misses": 0,
+    "evictions": 0,
+}
+_metadata_lock = threading.Lock()
+
+
+def _count_metadata(stat, n=1):
+    with _metadata_lock:
+        _metadata_stats[stat] += n
+
+
+def metadata_cache_stats():
+    """Return hit/miss/eviction counters plus the cache's current size."""
+    with _metadata_lock:
+        stats = dict(_metadata_stats)
+    try:
+        sizes = [e.stat().st_size for e in os.scandir(METADATA_CACHE_DIR) if e.is_file()]
+    except FileNotFoundError:
+        sizes = []
+    stats.update(entries=len(sizes), bytes=sum(sizes))
+    return stats
+
+
+def _fresh_cache_file(path):
+    """Return *path* if it holds a live cache entry, marking it used; else None.
+
+    Expired entries are deleted on the way.
+    """
+    try:
+        created = os.path.getmtime(path)
+    except OSError:
+        return None
+    now = time.time()
+    if now - created >= METADATA_CACHE_TTL:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return None
+    os.utime(path, (now, created))  # atime records the last use, for LRU eviction
+    return path
+
+
+def cached_video_info(video_id, extractor="Youtube"):
+    """Return the path of a fresh cached info dict for a video, or None."""
+    if METADATA_CACHE_TTL <= 0:
+        return None
+    path = _fresh_cache_file(os.path.join(METADATA_CACHE_DIR, f"{extractor}-{video_id}.info.json"))
+    _count_metadata("video_hits" if path else "video_misses")
+    return path
+
+
+def drop_cached_video(video_id, extractor="Youtube"):
+    """Delete a video's cached info dict, e.g. after a run using it failed."""
+    try:
+        os.remove(os.path.join(METADATA_CACHE_DIR, f"{extractor}-{video_id}.info.json"))
+    except FileNotFoundError:
+        pass
+
+
+def _metadata_args():
+    """Return yt-dlp args that save each extracted info dict into the cache."""
+    if METADATA_CACHE_TTL <= 0:
+        return []
+    return [
+        "--write-info-json", "--no-write-playlist-metafiles",
+        "--output", f"infojson:{METADATA_CACHE_DIR}/%(extractor_key)s-%(id)s.%(ext)s",
+    ]
+
+
+def _playlist_cache_path(url):
+    match = _PLAYLIST_ID_RE.search(url)
+    key = match.group(1) if match else hashlib.sha1(url.rstrip("/").encode()).hexdigest()
+    return os.path.join(METADATA_CACHE_DIR, f"playlist-{key}.json")
+
+
+def cached_playlist(url):
+    """Return the cached flat listing of a playlist or channel URL, or None."""
+    if METADATA_CACHE_TTL <= 0:
+        return None
+    path = _fresh_cache_file(_playlist_cache_path(url))
+    _count_metadata("playlist_hits" if path else "playlist_misses")
+    if path is None:
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)["entries"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def cache_playlist(url, entries):
+    """Store the complete flat listing of *url*."""
+    if METADATA_CACHE_TTL <= 0:
+        return
+    os.makedirs(METADATA_CACHE_DIR, exist_ok=True)
+    path = _playlist_cache_path(url)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"url": url, "entries": entries}, f)
+    os.replace(tmp, path)
+    _prune_metadata_cache()
+
+
+def _prune_metadata_cache():
+    """Drop expired entries, then the least recently used past METADATA_CACHE_MAX_MB."""
+    now = time.time()
+    files = []
+    evicted = 0
+    try:
+        entries = list(os.scandir(METADATA_CACHE_DIR))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            st = entry.stat()
+            if now - st.st_mtime >= METADATA_CACHE_TTL:
+                os.remove(entry.path)
+                evicted += 1
+                continue
+        except FileNotFoundError:
+            continue
+        files.append((st.st_atime, st.st_size, entry.path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= METADATA_CACHE_MAX_MB * 1024 ** 2:
+            break
+        try:
+            os.remove(path)
+            evicted += 1
+        except FileNotFoundError:
+            pass
+        total -= size
+    if evicted:
+        _count_metadata("evictions", evicted)
+
+
+# ── Throughput profiles ─────────────────────────────────────────
+# Named download tunings, chosen per watch and per manual download.
+# "fragments" is how many DASH/HLS fragments (or aria2c connections) a
+# job fetches at once. Running jobs share FRAGMENT_BUDGET between them:
+# each job's fragments are cut to its share when the download stage
+# starts, so a busy queue doesn't open hundreds of connections.
+
+THROUGHPUT_PROFILES = {
+    "default": {"fragments": 4, "chunk_size": "10M", "buffer_size": "1M", "downloader": None},
+    "fast": {"fragments": 8, "chunk_size": "10M", "buffer_size": "4M", "downloader": None},
+    "aria2c": {"fragments": 16, "chunk_size": None, "buffer_size": None, "downloader": "aria2c",
+               "downloader_args": "aria2c:-x {fragments} -s {fragments} -k 1M"},
+    "low": {"fragments": 1, "chunk_size": None, "buffer_size": None, "downloader": None},
+}
+
+
+def _profile_name(name):
+    return name if name in THROUGHPUT_PROFILES else DEFAULT_PROFILE
+
+
+def _profile_args(job_id, name):
+    """Return the yt-dlp arguments for a job's throughput profile, scaled to the running jobs."""
+    name = _profile_name(name)
+    profile = THROUGHPUT_PROFILES[name]
+    _jobs[job_id]["profile"] = name
+    with _stage_lock:
+        running = max(_stage_counts["download_running"] + _stage_counts["watch_running"], 1)
+    fragments = max(1, min(profile["fragments"], FRAGMENT_BUDGET // running))
+    if fragments < profile["fragments"]:
+        _append_log(job_id, f"[profile] {name}: {running} downloads running; "
+                            f"using {fragments} of {profile['fragments']} fragments")
+    args = ["--concurrent-fragments", str(fragments)]
+    if profile["chunk_size"]:
+        args += ["--http-chunk-size", profile["chunk_size"]]
+    if profile["buffer_size"]:
+        args += ["--buffer-size", profile["buffer_size"]]
+    if profile["downloader"]:
+        args += ["--downloader", profile["downloader"]]
+        if profile.get("downloader_args"):
+            args += ["--downloader-args", profile["downloader_args"].format(fragments=fragments)]
+    return args
+
+
+def _record_throughput(job_id, seconds):
+    """Store the download stage's average speed on the job, in MB/s."""
+    job = _jobs[job_id]
+    if job.get("bytes") and seconds > 0:
+        job["mb_per_s"] = round(job["bytes"] / 1024 ** 2 / seconds, 2)
+        observe_metric("downloader_download_speed_mb_per_s", job["mb_per_s"],
+                       profile=job.get("profile") or DEFAULT_PROFILE)
+
+
+# ── Background download helpers ────────────────────────────────
+
+_OUTPUT_PATH_RE = re.compile(
+    r'^\[(?:download\] Destination: |Merger\] Merging formats into ")(.+?)"?$'
+)
+
+
+_VIDEO_URL_RE = re.compile(r"youtu(?:\.be/|be\.com/(?:watch\?(?:.*&)?v=|shorts/|live/))([\w-]{11})")
+_LISTABLE_URL_RE = re.compile(r"[?&]list=|youtube\.com/(?:@|channel/|c/|user/|playlist)")
+_VIDEO_ID_RE = re.compile(r"^\[youtube\] ([\w-]{11}): Downloading webpage")
+
+
+def _parse_video_id(line):
+    """Return the YouTube video ID yt-dlp reports starting to extract, if any."""
+    m = _VIDEO_ID_RE.match(line)
+    return m.group(1) if m else None
+
+
+def _parse_output_dir(line):
+    """Return the directory of a file yt-dlp reports writing, if any."""
+    m = _OUTPUT_PATH_RE.match(line)
+    return os.path.dirname(m.group(1)) if m else None
+
+
+def _finish_ytdlp_status(job, returncode, written):
+    """Set a job's final status from yt-dlp's exit code and queue a scan."""
+    if returncode == 0:
+        job["status"] = "done"
+        job["progress"] = 100
+        if written:
+            request_jellyfin_scan(written)
+    else:
+        job["status"] = "error"
+
+
+def _download_targets(job_id, url):
+    """Return (URLs a manual download of *url* still has to fetch, checked).
+
+    Single YouTube videos are looked up in the archive directly; channels
+    and playlists are listed flat and their archived entries dropped.
+    *checked* is False when yt-dlp has to check the archive itself: for
+    other single URLs, and when the listing failed.
+    """
+    if not _LISTABLE_URL_RE.search(url):
+        match = _VIDEO_URL_RE.search(url)
+        if not match:
+            return [url], False
+        if has_video(match.group(1)):
+            _append_log(job_id, f"[archive] {match.group(1)} has already been downloaded")
+            return [], True
+        return [url], True
+    entries = cached_playlist(url)
+    if entries is None:
+        entries = _list_entries(url, job_ids=(job_id,))
+        if entries is None:
+            return [url], False
+        cache_playlist(url, entries)
+    targets = [_entry_url(e) for e in entries if not _entry_archived(e)]
+    _append_log(job_id, f"[archive] {len(entries) - len(targets)} of {len(entries)} "
+                        "videos have already been downloaded")
+    return targets, True
+
+
+# Manual downloads read yt-dlp.conf; its post-processor options live in
+# yt-dlp-postprocess.conf, added for the post-processing stage only.
+_DOWNLOAD_CONFIG = ["--config-locations", "/app/yt-dlp.conf"]
+_POSTPROCESS_CONFIG = _DOWNLOAD_CONFIG + ["--config-locations", "/app/yt-dlp-postprocess.conf"]
+
+
+def _run_download_job(job_id, url):
+    """Run the download stage of a manual download, updating job state as output arrives.
+
+    Returns once the download stage is done; the job finishes when its
+    videos have been post-processed.
+    """
+    job = _jobs[job_id]
+    _job_started(job_id)
+    returncode, written = None, set()
+
+    def finish(returncode, written):
+        try:
+            if returncode is not None:
+                job["exit_code"] = returncode
+            if job["status"] == "running":
+                _finish_ytdlp_status(job, returncode, written)
+        except Exception as e:
+            _append_log(job_id, f"ERROR: {e}")
+            job["status"] = "error"
+        finally:
+            _finish_job(job_id)
+
+    try:
+        targets, checked = _download_targets(job_id, url)
+        if job["status"] == "cancelled":
+            return
+        if not targets:
+            job["progress"] = 100
+            job["status"] = "done"
+            return
+        report_file = _archive_report_file(job_id)
+        staging = _staging_args(job_id)
+        handoff = _start_pipeline(job_id, _POSTPROCESS_CONFIG + staging)
+        args = _DOWNLOAD_CONFIG + staging + _profile_args(job_id, job.get("profile"))
+        if not checked:
+            args += _archive_export_args(job_id)
+        returncode, written = _download_videos(
+            job_id, args + _archive_args(report_file) + handoff, targets
+        )
+        _collect_archive_report(report_file, job_id=job_id)
+    except Exception as e:
+        _append_log(job_id, f"ERROR: {e}")
+        job["status"] = "error"
+    finally:
+        _remove_archive_export(job_id)
+        _finish_pipeline(job_id, returncode, written, finish)
+
+
+def _download_videos(job_id, args, urls):
+    """Run a download stage for *urls*, replaying cached info dicts where fresh.
+
+    Each cached video is a separate --load-info-json run; everything else
+    is extracted in one run. A failed run drops the cache entries it used
+    or wrote, and a video whose replay failed is retried with a fresh
+    extraction. Returns (exit code, directories written to), where the
+    exit code is the first failure, if any.
+    """
+    args = args + _metadata_args()
+    _jobs[job_id]["item_count"] = len(urls)
+    cached = []
+    extract = []
+    for url in urls:
+        match = _VIDEO_URL_RE.search(url)
+        path = cached_video_info(match.group(1)) if match else None
+        if path:
+            cached.append((match.group(1), url, path))
+        else:
+            extract.append(url)
+
+    returncode, written = 0, set()
+    started = time.monotonic()
+
+    def run(targets):
+        code, dirs = _execute_ytdlp(job_id, args + targets)
+        count_metric("downloader_ytdlp_exit_codes_total", stage="download", code=code)
+        written.update(dirs)
+        return code
+
+    for video_id, url, path in cached:
+        if _jobs[job_id]["status"] == "cancelled":
+            break
+        code = run(["--load-info-json", path])
+        if code != 0 and _jobs[job_id]["status"] != "cancelled":
+            drop_cached_video(video_id)
+            _append_log(job_id, f"[cache] replaying {video_id} failed; extracting it again")
+            extract.append(url)
+        elif returncode == 0:
+            returncode = code
+    if extract and _jobs[job_id]["status"] != "cancelled":
+        code = run(extract)
+        if code != 0:
+            for url in extract:
+                match = _VIDEO_URL_RE.search(url)
+                if match:
+                    drop_cached_video(match.group(1))
+        if returncode == 0:
+            returncode = code
+    _record_throughput(job_id, time.monotonic() - started)
+    _prune_metadata_cache()
+    return returncode, written
+
+
+# ── Challenge solver components ─────────────────────────────────
+# yt-dlp solves YouTube's JS challenges with its EJS scripts, which must
+# match the installed yt-dlp. Rather than letting every run fetch them
+# from GitHub (--remote-components ejs:github), the yt-dlp-ejs release
+# pinned by the installed yt-dlp is installed once into
+# EJS_CACHE_DIR/<yt-dlp version>/ and put on each run's import path. The
+# cache is warmed at start-up and re-checked every EJS_REFRESH_HOURS, so
+# an upgraded yt-dlp gets its matching scripts; until a cache is ready,
+# runs fall back to fetching from GitHub.
+
+_ejs_state = {"path": None}   # cached package directory for the current yt-dlp
+_EJS_PACKAGE = "yt-dlp-ejs"
+
+
+def _ejs_requirement():
+    """Return (yt-dlp version, pinned yt-dlp-ejs requirement), or None."""
+    try:
+        version = importlib.metadata.version("yt-dlp")
+        requires = importlib.metadata.requires("yt-dlp") or []
+    except importlib.metadata.PackageNotFoundError:
+        return None
+    for req in requires:
+        requirement = req.split(";")[0].strip()
+        name = re.match(r"[\w.-]*", requirement).group(0)
+        if name.lower().replace("_", "-") == _EJS_PACKAGE:
+            return version, requirement
+    return None
+
+
+def refresh_ejs_cache():
+    """Make sure the EJS scripts pinned by the installed yt-dlp are cached.
+
+    Returns the cache directory in use, or None if there is none yet.
+    Caches for other yt-dlp versions are removed.
+    """
+    pinned = _ejs_requirement()
+    if pinned is None:
+        print("[ejs] installed yt-dlp pins no yt-dlp-ejs release; using remote components", flush=True)
+        return _ejs_state["path"]
+    version, requirement = pinned
+    path = os.path.join(EJS_CACHE_DIR, version)
+    if not os.path.isdir(os.path.join(path, "yt_dlp_ejs")):
+        staging = path + ".tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            result = subprocess.run(  # noqa: S603
+                [sys.executable, "-m", "pip", "install", "--quiet", "--no-deps",
+                 "--target", staging, requirement],
+                capture_output=True, text=True, timeout=300,
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            result = SimpleNamespace(returncode=None, stderr=str(e))
+        if result.returncode != 0:
+            print(f"[ejs] could not cache {requirement}: {result.stderr.strip()}", flush=True)
+            return _ejs_state["path"]
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(staging, path)
+        print(f"[ejs] cached {requirement} for yt-dlp {version}", flush=True)
+    _ejs_state["path"] = path
+    for name in os.listdir(EJS_CACHE_DIR):
+        if name != version:
+            shutil.rmtree(os.path.join(EJS_CACHE_DIR, name), ignore_errors=True)
+    return path
+
+
+def _ejs_args():
+    """Return the yt-dlp args for finding the EJS scripts."""
+    if _ejs_state["path"]:
+        return []
+    return ["--remote-components", "ejs:github"]
+
+
+def _ytdlp_env():
+    """Return the environment for a yt-dlp subprocess, with the EJS cache importable."""
+    path = _ejs_state["path"]
+    if not path:
+        return None
+    existing = os.environ.get("PYTHONPATH")
+    return dict(os.environ, PYTHONPATH=path + (os.pathsep + existing if existing else ""))
+
+
+def _ejs_refresher():
+    while True:
+        try:
+            refresh_ejs_cache()
+        except Exception:
+            import traceback
+            traceback.print_exc()
+        time.sleep(EJS_REFRESH_HOURS * 3600)
+
+
+def start_ejs_refresher():
+    threading.Thread(target=_ejs_refresher, daemon=True).start()
+
+
+# ── Phase timing ────────────────────────────────────────────────
+# Each job records how long it spent in every phase: queued, listing,
+# extract, download, merge, sponsorblock, embed and commit. Phases are
+# read off yt-dlp's "[Tag]" output markers (or the api backend's hooks)
+# per output stream: a stream is in one phase until a line from another
+# phase arrives. Post-processing streams of a job run side by side, so
+# its phase totals can add up to more than its wall time. Totals and the
+# first PHASE_TIMELINE_MAX spans (offsets in seconds from job creation)
+# are kept on the job and in job_history.
+
+_PHASE_TAGS = {
+    "youtube": "extract", "youtube:tab": "extract", "info": "extract",
+    "download": "download", "hlsnative": "download", "dashsegments": "download",
+    "Merger": "merge", "FixupM3u8": "merge", "FixupStretched": "merge",
+    "SponsorBlock": "sponsorblock", "ModifyChapters": "sponsorblock",
+    "EmbedThumbnail": "embed", "EmbedSubtitle": "embed", "Metadata": "embed",
+    "ThumbnailsConvertor": "embed",
+}
+_PHASE_TAG_RE = re.compile(r"^\[([\w:]+)\]")
+_phase_lock = threading.Lock()
+
+
+def _line_phase(line):
+    """Return the phase a line of yt-dlp output belongs to, if it marks one."""
+    m = _PHASE_TAG_RE.match(line)
+    return _PHASE_TAGS.get(m.group(1)) if m else None
+
+
+def _record_phase(job_id, phase, start, end):
+    """Add a span of *phase* (wall-clock start/end) to a job's timing."""
+    job = _jobs[job_id]
+    base = job.get("created") or start
+    with _phase_lock:
+        totals = job.setdefault("phase_seconds", {})
+        totals[phase] = round(totals.get(phase, 0) + end - start, 1)
+        timeline = job.setdefault("timeline", [])
+        if len(timeline) < PHASE_TIMELINE_MAX:
+            timeline.append({"phase": phase, "start": round(start - base, 1),
+                             "end": round(end - base, 1)})
+
+
+def _mark_phase(job_id, clock, phase):
+    """Move one output stream (*clock*) of a job into *phase*."""
+    if clock.get("phase") == phase:
+        return
+    now = time.time()
+    _end_phase(job_id, clock, now)
+    clock["phase"], clock["since"] = phase, now
+
+
+def _end_phase(job_id, clock, now=None):
+    """Close the span of a stream's current phase."""
+    if clock.get("phase") is None:
+        return
+    _record_phase(job_id, clock["phase"], clock["since"], now or time.time())
+    clock["phase"] = None
+
+
+def _job_started(job_id):
+    """Mark a job running and record how long it was queued."""
+    job = _jobs[job_id]
+    if job["status"] != "cancelled":
+        job["status"] = "running"
+    job["started"] = time.time()
+    if job.get("created"):
+        _record_phase(job_id, "queued", job["created"], job["started"])
+    _notify_job(job_id)
+
+
+# ── yt-dlp backends ─────────────────────────────────────────────
+# "subprocess" runs the yt-dlp CLI per job and parses its output.
+# "api" drives yt_dlp.YoutubeDL inside a reusable process pool, with
+# progress and postprocessor hooks reporting structured state back to the
+# parent. Both take the same CLI-style argument list.
+
+_api_pool_state = {}   # "pool": ProcessPoolExecutor, "manager": SyncManager
+_api_pool_lock = threading.Lock()
+
+# Download progress arrives as typed fields rather than scraped text: the
+# CLI prints one JSON object per progress report through --progress-template
+# (unset fields default to a bare null), and the api backend's progress
+# hook sends the same fields. A job downloading several videos reports
+# "item N of M" and an overall percentage across all of them; within a
+# video, merged formats share the video's slice of the bar.
+
+_PROGRESS_PREFIX = "[progress] "
+
+_PROGRESS_KEYS = (
+    "status", "downloaded_bytes", "total_bytes", "total_bytes_estimate",
+    "speed", "eta", "filename", "fragment_index", "fragment_count",
+)
+_PROGRESS_INFO_KEYS = ("id", "title", "format_id", "playlist_index", "n_entries")
+
+_PROGRESS_TEMPLATE = "download:" + _PROGRESS_PREFIX + "{" + ", ".join(
+    [f'"{key}": %(progress.{key}|null)j' for key in _PROGRESS_KEYS]
+    + [f'"{key}": %(info.{key}|null)j' for key in _PROGRESS_INFO_KEYS]
+    + ['"formats": %(info.requested_formats.:.format_id|null)j']
+) + "}"
+
+_PROGRESS_TYPES = {
+    "status": str, "downloaded_bytes": int, "total_bytes": int,
+    "total_bytes_estimate": int, "speed": float, "eta": int, "filename": str,
+    "fragment_index": int, "fragment_count": int, "id": str, "title": str,
+    "format_id": str, "playlist_index": int, "n_entries": int,
+    "formats": lambda v: [str(f) for f in v] if isinstance(v, list) else None,
+}
+
+
+def _progress_fields(raw):
+    """Coerce a raw progress report to typed fields, None where unknown."""
+    fields = {}
+    for key, kind in _PROGRESS_TYPES.items():
+        value = raw.get(key)
+        try:
+            fields[key] = None if value is None else kind(value)
+        except (TypeError, ValueError):
+            fields[key] = None
+    return fields
+
+
+def _parse_progress(line):
+    """Return the typed fields of a --progress-template line, or None."""
+    if not line.startswith(_PROGRESS_PREFIX):
+        return None
+    try:
+        raw = json.loads(line[len(_PROGRESS_PREFIX):])
+    except ValueError:
+        return None
+    return _progress_fields(raw) if isinstance(raw, dict) else None
+
+
+def _progress_item(job, fields):
+    """Return (item number, item count) of the video a progress report is for.
+
+    yt-dlp numbers playlist entries itself; runs over a list of video URLs
+    number videos in the order they start, out of the job's "item_count".
+    """
+    if fields["playlist_index"]:
+        item = fields["playlist_index"]
+    else:
+        seen = job.setdefault("item_ids", {})
+        item = seen.setdefault(fields["id"] or fields["filename"], len(seen) + 1)
+    return item, max(fields["n_entries"] or job.get("item_count") or 1, item)
+
+
+def _apply_progress(job_id, fields, written):
+    """Apply one structured download progress report to the job's state."""
+    job = _jobs[job_id]
+    done = fields["downloaded_bytes"]
+    total = fields["total_bytes"] or fields["total_bytes_estimate"]
+    item, items = _progress_item(job, fields)
+    job.update(
+        phase="download", speed=fields["speed"], eta=fields["eta"],
+        downloaded_bytes=done, total_bytes=total, item=item, items=items,
+        fragment_index=fields["fragment_index"], fragment_count=fields["fragment_count"],
+    )
+    if fields["id"]:
+        job["video_id"] = fields["id"]
+    if fields["title"] and not job["title"]:
+        job["title"] = fields["title"][:120]
+    if fields["status"] == "finished":
+        file_done = 1.0
+        job["bytes"] = job.get("bytes", 0) + (total or done or 0)
+        if fields["filename"]:
+            written.add(os.path.dirname(fields["filename"]))
+    elif done is not None and total:
+        file_done = min(done / total, 1)
+    else:
+        file_done = 0.0
+    formats = fields["formats"] or []
+    part = formats.index(fields["format_id"]) if fields["format_id"] in formats else 0
+    item_done = (part + file_done) / max(len(formats), 1)
+    job["progress"] = round((item - 1 + item_done) / items * 100, 1)
+
+
+def _handle_output_line(job_id, line, written, clock=None):
+    """Apply one line of yt-dlp output to the job's state.
+
+    *clock* is the phase state of the output stream the line came from.
+    """
+    job = _jobs[job_id]
+    fields = _parse_progress(line)
+    if fields is not None:
+        if clock is not None:
+            _mark_phase(job_id, clock, "download")
+        _apply_progress(job_id, fields, written)
+        _notify_job(job_id)
+        return
+    _append_log(job_id, line)
+    phase = _line_phase(line) if clock is not None else None
+    if phase:
+        _mark_phase(job_id, clock, phase)
+    out_dir = _parse_output_dir(line)
+    if out_dir:
+        written.add(out_dir)
+    video_id = _parse_video_id(line)
+    if video_id and not job.get("newest_video_id"):
+        job["newest_video_id"] = video_id
+    _notify_job(job_id)
+
+
+def _consume_output(job_id, proc):
+    """Feed yt-dlp output into the job; return the directories it wrote to."""
+    written = set()
+    clock = {}
+    for line in proc.stdout:
+        _handle_output_line(job_id, line.rstrip("\n"), written, clock)
+        _poll_handoff(job_id)
+    _end_phase(job_id, clock)
+    return written
+
+
+def _execute_ytdlp(job_id, argv):
+    """Run yt-dlp with *argv* for a job on the configured backend.
+
+    Returns (exit code, directories written to). While it runs, the job
+    can be stopped through _job_procs[job_id].terminate().
+    """
+    argv = _ejs_args() + argv
+    print(f"[yt-dlp:{YTDLP_BACKEND}] job {job_id}: {' '.join(argv)}", flush=True)
+    try:
+        if YTDLP_BACKEND == "api":
+            return _execute_ytdlp_api(job_id, argv)
+        proc = subprocess.Popen(  # noqa: S603
+            ["yt-dlp", "--newline", "--progress-template", _PROGRESS_TEMPLATE] + argv,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            text=True, bufsize=1, env=_ytdlp_env(),
+        )
+        _job_procs[job_id] = proc
+        if _cancelled(job_id):
+            proc.terminate()
+        written = _consume_output(job_id, proc)
+        proc.wait()
+        return proc.returncode, written
+    finally:
+        _job_procs.pop(job_id, None)
+
+
+def _api_pool():
+    with _api_pool_lock:
+        if not _api_pool_state:
+            ctx = multiprocessing.get_context("spawn")
+            _api_pool_state["manager"] = ctx.Manager()
+            _api_pool_state["pool"] = ProcessPoolExecutor(
+                max_workers=YTDLP_API_PROCESSES, mp_context=ctx
+            )
+        return _api_pool_state["pool"], _api_pool_state["manager"]
+
+
+def _execute_ytdlp_api(job_id, argv):
+    pool, manager = _api_pool()
+    events = manager.Queue()
+    cancel = manager.Event()
+    _job_procs[job_id] = SimpleNamespace(terminate=cancel.set)
+    if _cancelled(job_id):
+        cancel.set()
+    future = pool.submit(_api_download, argv, events, cancel, _ejs_state["path"])
+    written = set()
+    clock = {}
+    while True:
+        try:
+            event = events.get(timeout=1)
+        except queue.Empty:
+            if future.done():
+                break
+            continue
+        if event is None:
+            break
+        _apply_api_event(job_id, event, written, clock)
+        _poll_handoff(job_id)
+    _end_phase(job_id, clock)
+    return future.result(), written
+
+
+def _apply_api_event(job_id, event, written, clock=None):
+    """Apply one event from an api-backend worker to the job's state."""
+    job = _jobs[job_id]
+    if event["type"] == "log":
+        _handle_output_line(job_id, event["line"], written, clock)
+        return
+    if clock is not None:
+        if event["type"] == "download":
+            phase = "download"
+        else:
+            phase = _PHASE_TAGS.get(event.get("postprocessor"))
+        if phase:
+            _mark_phase(job_id, clock, phase)
+
+    if event["type"] == "download":
+        _apply_progress(job_id, _progress_fields(event), written)
+    elif event["type"] == "postprocess":
+        job["phase"] = event.get("postprocessor")
+        job["speed"] = job["eta"] = None
+        if event.get("filepath"):
+            written.add(os.path.dirname(event["filepath"]))
+    _notify_job(job_id)
+
+
+def _api_download(argv, events, cancel, ejs_path=None):
+    """Pool worker: run yt-dlp in-process, streaming events to *events*.
+
+    Returns yt-dlp's exit code. Always ends the stream with None.
+    """
+    if ejs_path and ejs_path not in sys.path:
+        sys.path.insert(0, ejs_path)
+    import yt_dlp
+    from yt_dlp.utils import DownloadCancelled
+
+    def check_cancelled():
+        if cancel.is_set():
+            raise DownloadCancelled("cancelled by user")
+
+    def progress_hook(d):
+        check_cancelled()
+        info = d.get("info_dict") or {}
+        event = {k: d.get(k) for k in _PROGRESS_KEYS}
+        event.update({k: info.get(k) for k in _PROGRESS_INFO_KEYS})
+        event["formats"] = [f.get("format_id") for f in info.get("requested_formats") or []]
+        events.put(dict(event, type="download"))
+
+    def postprocessor_hook(d):
+        check_cancelled()
+        events.put({
+            "type": "postprocess",
+            "postprocessor": d.get("postprocessor"),
+            "status": d.get("status"),
+            "filepath": (d.get("info_dict") or {}).get("filepath"),
+        })
+
+    def log(msg):
+        for line in str(msg).splitlines():
+            events.put({"type": "log", "line": line})
+
+    try:
+        parsed = yt_dlp.parse_options(argv)
+        opts = dict(
+            parsed.ydl_opts,
+            noprogress=True,
+            progress_hooks=[progress_hook],
+            postprocessor_hooks=[postprocessor_hook],
+            logger=SimpleNamespace(debug=log, info=log, warning=log, error=log),
+        )
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            if parsed.options.load_info_filename:
+                return ydl.download_with_info_file(parsed.options.load_info_filename)
+            return ydl.download(parsed.urls)
+    except DownloadCancelled as e:
+        log(f"[info] {e}")
+        return 1
+    finally:
+        events.put(None)
+
+
+# ── Scratch staging ─────────────────────────────────────────────
+# Pipelined jobs download and post-process under STAGING_DIR, a local
+# scratch disk, instead of writing fragments, .part renames and ffmpeg
+# rewrites straight to CephFS. Once a video has been post-processed, it
+# and its sidecar files (thumbnail, subtitles) are committed to the same
+# relative path under YOUTUBE_PATH: copied with a large buffer to a hidden
+# name and renamed into place, so Jellyfin never sees a half-written
+# file. A job whose scratch volume is short of STAGING_MIN_FREE_GB writes
+# to YOUTUBE_PATH directly. Each job stages under its own subdirectory,
+# removed with whatever a cancelled or failed run left behind once the
+# job's post-processing is done; anything left from before a restart is
+# swept at start-up.
+
+# What may follow "<stem>." in a sidecar's name: a thumbnail or a subtitle.
+_SIDECAR_RE = re.compile(r"(?:jpg|jpeg|png|webp|[\w-]+\.(?:vtt|srt|ass|lrc|ttml))")
+_commit_stats = {"files": 0, "bytes": 0, "seconds": 0.0, "failures": 0, "last_mb_per_s": None}
+_commit_lock = threading.Lock()
+
+
+def _staging_dir(job_id):
+    return os.path.join(STAGING_DIR, job_id)
+
+
+def _staging_args(job_id):
+    """Return the yt-dlp arguments that point a job's output at the scratch disk."""
+    if not STAGING_DIR:
+        return []
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    free_gb = shutil.disk_usage(STAGING_DIR).free / 1024 ** 3
+    if free_gb < STAGING_MIN_FREE_GB:
+        _append_log(job_id, f"[staging] only {free_gb:.1f} GB free on {STAGING_DIR}; "
+                            f"writing to {YOUTUBE_PATH} directly")
+        return []
+    return ["--paths", _staging_dir(job_id)]
+
+
+def _is_staged(path):
+    if not STAGING_DIR:
+        return False
+    return os.path.abspath(path).startswith(os.path.join(os.path.abspath(STAGING_DIR), ""))
+
+
+def _final_path(path):
+    """Return where a staged path ends up under YOUTUBE_PATH; other paths are returned as is."""
+    if not _is_staged(path):
+        return path
+    # Drop the job's own directory: STAGING_DIR/<job_id>/rest -> YOUTUBE_PATH/rest
+    _job_dir, _, rest = os.path.relpath(path, STAGING_DIR).partition(os.sep)
+    return os.path.join(YOUTUBE_PATH, rest)
+
+
+def _clear_staging(job_id):
+    """Remove a job's staging directory and any files it still holds."""
+    if not STAGING_DIR:
+        return
+    folder = _staging_dir(job_id)
+    leftovers = sum(len(files) for _root, _dirs, files in os.walk(folder))
+    if leftovers:
+        _append_log(job_id, f"[staging] removing {leftovers} leftover files")
+    shutil.rmtree(folder, ignore_errors=True)
+
+
+def sweep_staging():
+    """Delete everything under STAGING_DIR; called at start-up, before any job runs."""
+    if not STAGING_DIR or not os.path.isdir(STAGING_DIR):
+        return
+    stale = os.listdir(STAGING_DIR)
+    for name in stale:
+        path = os.path.join(STAGING_DIR, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    if stale:
+        print(f"[staging] swept {len(stale)} stale entries from {STAGING_DIR}", flush=True)
+
+
+def _same_filesystem(a, b):
+    return os.stat(a).st_dev == os.stat(b).st_dev
+
+
+def _commit_file(src, dest):
+    """Move *src* to *dest*, copying across filesystems behind an atomic rename.
+
+    Returns the number of bytes copied (0 for a plain rename).
+    """
+    dest_dir = os.path.dirname(dest)
+    os.makedirs(dest_dir, exist_ok=True)
+    if _same_filesystem(src, dest_dir):
+        os.replace(src, dest)
+        return 0
+    tmp = os.path.join(dest_dir, f".{os.path.basename(dest)}.committing")
+    try:
+        with open(src, "rb") as fsrc, open(tmp, "wb") as fdst:
+            shutil.copyfileobj(fsrc, fdst, COMMIT_BUFFER_MB * 1024 ** 2)
+            fdst.flush()
+            os.fsync(fdst.fileno())
+            size = fdst.tell()
+        shutil.copystat(src, tmp)
+        os.replace(tmp, dest)
+    except Exception:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    os.remove(src)
+    return size
+
+
+def commit_staged(job_id, filepath):
+    """Commit a staged video and its sidecar files to YOUTUBE_PATH.
+
+    Returns the final path of the video, or *filepath* itself if it was
+    not staged.
+    """
+    if not _is_staged(filepath):
+        return filepath
+    src_dir = os.path.dirname(filepath)
+    stem = os.path.splitext(os.path.basename(filepath))[0]
+    names = [n for n in os.listdir(src_dir)
+             if n == os.path.basename(filepath)
+             or (n.startswith(f"{stem}.") and _SIDECAR_RE.fullmatch(n[len(stem) + 1:]))]
+    started = time.monotonic()
+    started_at = time.time()
+    copied = 0
+    try:
+        for name in names:
+            src = os.path.join(src_dir, name)
+            copied += _commit_file(src, _final_path(src))
+    except OSError as e:
+        with _commit_lock:
+            _commit_stats["failures"] += 1
+        _append_log(job_id, f"[staging] ERROR: could not commit {filepath}: {e}")
+        raise
+    elapsed = time.monotonic() - started
+    _record_phase(job_id, "commit", started_at, started_at + elapsed)
+    mb_per_s = copied / 1024 ** 2 / elapsed if copied and elapsed else None
+    with _commit_lock:
+        _commit_stats["files"] += len(names)
+        _commit_stats["bytes"] += copied
+        _commit_stats["seconds"] += elapsed
+        if mb_per_s is not None:
+            _commit_stats["last_mb_per_s"] = round(mb_per_s, 1)
+    rate = f" ({mb_per_s:.1f} MB/s)" if mb_per_s is not None else ""
+    _append_log(job_id, f"[staging] committed {len(names)} files, "
+                        f"{copied / 1024 ** 2:.1f} MB in {elapsed:.1f}s{rate}")
+    return _final_path(filepath)
+
+
+def staging_commit_stats():
+    """Return scratch volume usage and commit throughput counters."""
+    with _commit_lock:
+        stats = dict(_commit_stats)
+    stats["mb_per_s"] = (round(stats["bytes"] / 1024 ** 2 / stats["seconds"], 1)
+                         if stats["bytes"] and stats["seconds"] else None)
+    stats["staging_dir"] = STAGING_DIR or None
+    if STAGING_DIR and os.path.isdir(STAGING_DIR):
+        usage = shutil.disk_usage(STAGING_DIR)
+        stats["free_gb"] = round(usage.free / 1024 ** 3, 1)
+        stats["total_gb"] = round(usage.total / 1024 ** 3, 1)
+    return stats
+
+
+# ── Post-processing stage ───────────────────────────────────────
+# Downloads run in two pipelined stages. The download stage (a download
+# worker or watch slot) runs yt-dlp without the SponsorBlock and embedding
+# post-processors and hands each finished video over through
+# --print-to-file after_move:%()j. The post-processing stage replays that
+# info dict with --load-info-json plus the post-processor flags: yt-dlp
+# finds the file already on disk and only runs ffmpeg. Up to
+# POSTPROCESS_WORKERS videos are post-processed at once, so muxing one
+# video overlaps fetching the next and a download slot is free as soon as
+# its last byte arrives. A job finishes once both stages are done with it.
+# The hand-off file is read at most every _HANDOFF_POLL seconds while the
+# download stage runs, and once more when it ends.
+# The bestvideo+bestaudio merge stays in the download stage: yt-dlp
+# merges as part of downloading a merged format, before after_move, and
+# has no option to defer it. It is a stream copy (no re-encoding), so
+# it is short next to the SponsorBlock cut and embedding moved here.
+
+_postprocess_executor = ThreadPoolExecutor(
+    max_workers=POSTPROCESS_WORKERS, thread_name_prefix="postprocess"
+)
+_pipelines = {}           # job_id -> hand-off state, while its download stage runs
+_HANDOFF_POLL = 1.0       # seconds between reads of a running job's hand-off file
+_postprocess_procs = {}   # job_id -> set of running post-processing Popens
+_stage_lock = threading.Lock()
+_stage_counts = {
+    "download_running": 0, "watch_running": 0,
+    "postprocess_queued": 0, "postprocess_running": 0,
+}
+
+
+def _count_stage(name, delta):
+    with _stage_lock:
+        _stage_counts[name] += delta
+
+
+def stage_depths():
+    """Return how many jobs or videos wait in and run through each stage."""
+    with _stage_lock:
+        counts = dict(_stage_counts)
+    with _queue_cond:
+        download_queued = len(_queue_items)
+    with _watch_jobs_lock:
+        watch_jobs = list(_watch_jobs.values())
+    watch_queued = sum(1 for job_id in watch_jobs
+                       if _jobs.get(job_id, {}).get("status") == "queued")
+    return {
+        "download": {"queued": download_queued, "running": counts["download_running"]},
+        "watch": {"queued": watch_queued, "running": counts["watch_running"]},
+        "postprocess": {"queued": counts["postprocess_queued"],
+                        "running": counts["postprocess_running"]},
+    }
+
+
+def _start_pipeline(job_id, postprocess_args):
+    """Open a job's hand-off and return the download-stage arguments that feed it.
+
+    *postprocess_args* are the full yt-dlp arguments for replaying one
+    video through the post-processors.
+    """
+    handoff = os.path.join(tempfile.gettempdir(), f"handoff-{job_id}.jsonl")
+    _pipelines[job_id] = {
+        "handoff": handoff,
+        "args": postprocess_args,
+        "offset": 0,
+        "futures": [],
+        "polled": time.monotonic(),
+    }
+    return ["--print-to-file", "after_move:%()j", handoff]
+
+
+def _poll_handoff(job_id):
+    """_drain_handoff, at most every _HANDOFF_POLL seconds; called per line of output."""
+    pipeline = _pipelines.get(job_id)
+    if pipeline is None or time.monotonic() - pipeline["polled"] < _HANDOFF_POLL:
+        return
+    pipeline["polled"] = time.monotonic()
+    _drain_handoff(job_id)
+
 
-def run_ytdlp(url, extra_args=None):
-    """Run yt-dlp with given URL and optional extra args. Returns True on success."""
-    cmd = ["yt-dlp"] + (extra_args or []) + [url]
-    print(f"[yt-dlp] {' '.join(cmd)}", flush=True)
-    result = subprocess.run(cmd, shell=False)  # noqa: S603
-    return result.returncode == 0
-
-
-def trigger_jellyfin_scan():
-    """Trigger a Jellyfin library scan for the YouTube path."""
-    try:
-        response = requests.post(
-            f"{JELLYFIN_URL}/Library/Media/Updated",
-            headers={
-                "X-MediaBrowser-Token": JELLYFIN_TOKEN,
-                "Content-Type": "application/json",
-            },
-            json={
-                "dto": {
-                    "Updates": [
-                        {"Path": YOUTUBE_PATH, "UpdateType": "scan"}
-                    ]
-                }
-            },
-            timeout=5,
-        )
-        print(
-            f"[jellyfin] HTTP {response.status_code} | bytes={len(response.content)}",
-            flush=True,
+def _drain_handoff(job_id):
+    """Queue post-processing for videos the download stage finished since the last call."""
+    pipeline = _pipelines.get(job_id)
+    if pipeline is None:
+        return
+    try:
+        with open(pipeline["handoff"], "rb") as f:
+            f.seek(pipeline["offset"])
+            data = f.read()
+    except FileNotFoundError:
+        return
+    complete = data[:data.rfind(b"\n") + 1]   # a line still being written waits
+    pipeline["offset"] += len(complete)
+    for line in complete.splitlines():
+        if not line.strip():
+            continue
+        info_path = f"{pipeline['handoff']}.{len(pipeline['futures'])}.info.json"
+        with open(info_path, "wb") as f:
+            f.write(line)
+        with _stage_lock:
+            _stage_counts["postprocess_queued"] += 1
+            _jobs[job_id]["postprocess_pending"] = _jobs[job_id].get("postprocess_pending", 0) + 1
+        pipeline["futures"].append(
+            _postprocess_executor.submit(_postprocess_video, job_id, info_path, pipeline["args"])
         )
-    except Exception as e:
-        print(f"[jellyfin] scan failed: {e}", flush=True)
 
 
-# ── Watches persistence ─────────────────────────────────────────
+def _postprocess_video(job_id, info_path, args):
+    """Run the post-processors for one downloaded video, then commit it from scratch.
 
-def load_watches():
-    with WATCHES_LOCK:
-        if not os.path.isfile(WATCHES_FILE):
-            _save_watches_unlocked([])
-            return []
+    Returns (exit code, directories written to); the exit code is None
+    if the job was cancelled before the video's turn came. The video is
+    committed either way, as it is already in the archive.
+    """
+    with _stage_lock:
+        _stage_counts["postprocess_queued"] -= 1
+        _stage_counts["postprocess_running"] += 1
+    written = set()
+    returncode = None
+    try:
+        if not _cancelled(job_id):
+            proc = subprocess.Popen(  # noqa: S603
+                ["yt-dlp", "--newline"] + args + ["--load-info-json", info_path],
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                text=True, bufsize=1, env=_ytdlp_env(),
+            )
+            _postprocess_procs.setdefault(job_id, set()).add(proc)
+            if _cancelled(job_id):
+                proc.terminate()
+            clock = {}
+            try:
+                for line in proc.stdout:
+                    _handle_output_line(job_id, line.rstrip("\n"), written, clock)
+                proc.wait()
+            finally:
+                _postprocess_procs[job_id].discard(proc)
+                _end_phase(job_id, clock)
+            returncode = proc.returncode
+            count_metric("downloader_ytdlp_exit_codes_total", stage="postprocess", code=returncode)
+        with open(info_path, encoding="utf-8") as f:
+            filepath = json.load(f).get("filepath")
+        if filepath:
+            written.add(os.path.dirname(commit_staged(job_id, filepath)))
+        return returncode, written
+    finally:
+        with _stage_lock:
+            _stage_counts["postprocess_running"] -= 1
+            _jobs[job_id]["postprocess_pending"] -= 1
         try:
-            with open(WATCHES_FILE) as f:
-                content = f.read().strip()
-                watches = json.loads(content) if content else []
-        except (json.JSONDecodeError, OSError):
-            return []
-
-        # Migrate legacy playlist_url → channel_url
-        migrated = False
-        for w in watches:
-            if "playlist_url" in w and "channel_url" not in w:
-                w["channel_url"] = w.pop("playlist_url")
-                migrated = True
-        if migrated:
-            _save_watches_unlocked(watches)
-        return watches
+            os.remove(info_path)
+        except FileNotFoundError:
+            pass
 
 
-def save_watches(watches):
-    with WATCHES_LOCK:
-        _save_watches_unlocked(watches)
+def _finish_pipeline(job_id, returncode, written, finish):
+    """Call finish(exit code, directories written) once the job's post-processing is done.
+
+    *returncode* and *written* are the download stage's results; the exit
+    code passed on is the first failure across both stages. Runs *finish*
+    right away if no job was handed off, else on the post-processing
+    thread that completes last.
+    """
+    _drain_handoff(job_id)
+    pipeline = _pipelines.pop(job_id, None)
+    futures = pipeline["futures"] if pipeline else []
+    if pipeline:
+        try:
+            os.remove(pipeline["handoff"])
+        except FileNotFoundError:
+            pass
+    if not futures:
+        _clear_staging(job_id)
+        finish(returncode, {_final_path(d) for d in written})
+        return
+    _jobs[job_id]["phase"] = "post-processing"
+    _notify_job(job_id)
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_future):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        code, dirs = returncode, set(written)
+        for future in futures:
+            try:
+                pp_code, pp_dirs = future.result()
+            except Exception as e:
+                _append_log(job_id, f"ERROR: {e}")
+                pp_code, pp_dirs = 1, set()
+            dirs |= pp_dirs
+            if pp_code is not None and code == 0:
+                code = pp_code
+        _postprocess_procs.pop(job_id, None)
+        _clear_staging(job_id)
+        finish(code, {_final_path(d) for d in dirs})
+
+    for future in futures:
+        future.add_done_callback(done)
+
+
+# ── Download queue ──────────────────────────────────────────────
+# Manual downloads are queued and drained by DOWNLOAD_WORKERS threads,
+# highest priority first, FIFO within a priority. Queued and running
+# entries are mirrored to QUEUE_FILE until their job finishes, so both
+# survive a restart; running ones are listed first and start first again.
+
+_queue = []            # heap of (-priority, seq, job_id)
+_queue_items = {}      # job_id -> {"url": str, "priority": int, "seq": int}
+_queue_running = {}    # job_id -> its _queue_items entry, from a worker taking it until it finishes
+_queue_cond = threading.Condition()
+_queue_seq = itertools.count()
+_queue_saves = {"taken": 0, "written": 0}   # snapshot numbers, so an older one never overwrites a newer
+_queue_file_lock = threading.Lock()
+_job_procs = {}        # job_id -> Popen (or anything with terminate()), for running jobs
+
+
+def enqueue_download(url, priority=0, job_id=None, profile=None):
+    """Queue a manual download and return its job_id."""
+    job_id = job_id or str(uuid.uuid4())
+    with _jobs_lock:
+        _jobs[job_id] = _new_job(status="queued", url=url)
+        if profile:
+            _jobs[job_id]["profile"] = _profile_name(profile)
+    with _queue_cond:
+        seq = next(_queue_seq)
+        _queue_items[job_id] = {"url": url, "priority": priority, "seq": seq}
+        heapq.heappush(_queue, (-priority, seq, job_id))
+        snapshot = _queue_changed_unlocked()
+        _queue_cond.notify()
+    _save_queue(snapshot)
+    return job_id
+
+
+def queue_position(job_id):
+    """Return the 1-based position of a queued job, or None if not queued."""
+    with _queue_cond:
+        if job_id not in _queue_items:
+            return None
+        return sorted(_queue).index(_queue_key(job_id)) + 1
+
+
+def cancel_job(job_id):
+    """Cancel a queued or unfinished job. Returns False if it is unknown or already finished.
+
+    A queued download is dropped from the queue. Any other job is marked
+    cancelled, which keeps further yt-dlp processes from starting for it,
+    and the processes it is running are stopped.
+    """
+    with _queue_cond:
+        queued = job_id in _queue_items
+        if queued:
+            _queue.remove(_queue_key(job_id))
+            heapq.heapify(_queue)
+            del _queue_items[job_id]
+            snapshot = _queue_changed_unlocked()
+    if queued:
+        _save_queue(snapshot)
+        _jobs[job_id]["status"] = "cancelled"
+        _finish_job(job_id)
+        return True
+    job = _jobs.get(job_id)
+    if job is None or job["status"] in _TERMINAL_STATUSES:
+        return False
+    job["status"] = "cancelled"
+    for p in [_job_procs.get(job_id), *list(_postprocess_procs.get(job_id, ()))]:
+        if p is not None:
+            p.terminate()
+    _notify_job(job_id)
+    return True
+
+
+def _cancelled(job_id):
+    """Return whether *job_id* was cancelled; checked before and after each process starts."""
+    return _jobs[job_id]["status"] == "cancelled"
+
+
+def reprioritize_job(job_id, priority):
+    """Change the priority of a queued job. Returns False if it is not queued."""
+    with _queue_cond:
+        if job_id not in _queue_items:
+            return False
+        _queue.remove(_queue_key(job_id))
+        _queue_items[job_id]["priority"] = priority
+        _queue.append(_queue_key(job_id))
+        heapq.heapify(_queue)
+        snapshot = _queue_changed_unlocked()
+    _save_queue(snapshot)
+    return True
+
+
+def _queue_key(job_id):
+    item = _queue_items[job_id]
+    return (-item["priority"], item["seq"], job_id)
+
+
+def _queue_changed_unlocked():
+    """Wake the progress streams of queued jobs and return a snapshot of the queue.
+
+    Called with _queue_cond held; the caller passes the snapshot to
+    _save_queue() after releasing it, so the file write never holds up
+    the progress streams that read queue positions.
+    """
+    for job_id in _queue_items:
+        _notify_job(job_id)
+    pending = []
+    entries = list(_queue_running.items()) + [(job_id, _queue_items[job_id])
+                                              for _, _, job_id in sorted(_queue)]
+    for job_id, entry in entries:
+        item = {"job_id": job_id, "url": entry["url"], "priority": entry["priority"]}
+        if _jobs[job_id].get("profile"):
+            item["profile"] = _jobs[job_id]["profile"]
+        pending.append(item)
+    _queue_saves["taken"] += 1
+    return _queue_saves["taken"], pending
+
+
+def _save_queue(snapshot):
+    """Write a queue snapshot to QUEUE_FILE, unless a newer one is already there."""
+    number, pending = snapshot
+    with _queue_file_lock:
+        if number <= _queue_saves["written"]:
+            return
+        tmp = QUEUE_FILE + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(pending, f, indent=2)
+        os.replace(tmp, QUEUE_FILE)
+        _queue_saves["written"] = number
 
 
-def _save_watches_unlocked(watches):
-    with open(WATCHES_FILE, "w") as f:
-        json.dump(watches, f, indent=2)
+def _dequeue_finished(job_id):
+    """Drop a finished download from QUEUE_FILE."""
+    with _queue_cond:
+        if _queue_running.pop(job_id, None) is None:
+            return
+        snapshot = _queue_changed_unlocked()
+    _save_queue(snapshot)
 
 
-def find_watch(watches, watch_id):
-    return next((w for w in watches if w["id"] == watch_id), None)
+def _load_queue():
+    """Re-queue downloads that were still pending when the app last stopped."""
+    try:
+        with open(QUEUE_FILE) as f:
+            content = f.read().strip()
+            pending = json.loads(content) if content else []
+    except (json.JSONDecodeError, OSError):
+        return
+    for item in pending:
+        enqueue_download(item["url"], item.get("priority", 0), item["job_id"], item.get("profile"))
 
 
-# ── Background download helpers ────────────────────────────────
+def _download_worker():
+    while True:
+        with _queue_cond:
+            while not _queue:
+                _queue_cond.wait()
+            _, _, job_id = heapq.heappop(_queue)
+            _queue_running[job_id] = _queue_items.pop(job_id)
+            url = _queue_running[job_id]["url"]
+            snapshot = _queue_changed_unlocked()
+        _save_queue(snapshot)
+        _count_stage("download_running", 1)
+        try:
+            _run_download_job(job_id, url)
+        except Exception:
+            import traceback
+            traceback.print_exc()
+        finally:
+            _count_stage("download_running", -1)
 
-_PROGRESS_RE = re.compile(r"\[download\]\s+([\d.]+)%")
 
+def start_download_workers():
+    _load_queue()
+    for _ in range(DOWNLOAD_WORKERS):
+        threading.Thread(target=_download_worker, daemon=True).start()
 
-def _parse_progress(line):
-    """Extract download percentage from a yt-dlp output line."""
-    m = _PROGRESS_RE.search(line)
-    return float(m.group(1)) if m else None
 
+# ── Job history ─────────────────────────────────────────────────
+# Finished jobs are written to the job_history table and dropped from
+# _jobs once they are older than JOB_TTL seconds, or sooner (oldest
+# first) when more than MAX_JOBS jobs are held in memory.
 
-def _run_download_job(job_id, url):
-    """Run yt-dlp in background, updating job state as output arrives."""
-    job = _jobs[job_id]
-    cmd = ["yt-dlp", "--newline", "--config-locations", "/app/yt-dlp.conf", url]
-    print(f"[yt-dlp] job {job_id}: {' '.join(cmd)}", flush=True)
+_HISTORY_COLUMNS = (
+    "job_id", "watch_id", "url", "title", "status", "exit_code", "bytes",
+    "created", "started", "finished", "duration", "log_tail",
+    "listed", "filtered", "downloaded", "profile", "mb_per_s", "phase_seconds", "timeline",
+)
+
+# Columns added after the first release: per-run video counts from a
+# watch's listing stage (NULL for plain downloads), throughput and phase
+# timing (JSON).
+_HISTORY_ADDED_COLUMNS = {
+    "listed": "INTEGER", "filtered": "INTEGER", "downloaded": "INTEGER",
+    "profile": "TEXT", "mb_per_s": "REAL", "phase_seconds": "TEXT", "timeline": "TEXT",
+}
+_HISTORY_JSON_COLUMNS = ("phase_seconds", "timeline")
 
+
+def _iso(ts):
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec="seconds")
+
+
+def _finish_job(job_id):
+    """Stamp a finished job, record it in the history store and wake its streams."""
+    job = _jobs[job_id]
+    job["finished"] = time.time()
+    kind = "watch" if job.get("watch_id") else "manual"
+    count_metric("downloader_jobs_total", kind=kind, status=job["status"])
+    count_metric("downloader_downloaded_bytes_total", job.get("bytes", 0), kind=kind)
+    if job.get("started"):
+        observe_metric("downloader_job_duration_seconds", job["finished"] - job["started"], kind=kind)
     try:
-        proc = subprocess.Popen(
-            cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-            text=True, bufsize=1,
+        _record_history(job_id, job)
+    except (sqlite3.Error, OSError) as e:
+        print(f"[history] could not record job {job_id}: {e}", flush=True)
+    _dequeue_finished(job_id)
+    _close_job_log(job_id)
+    if job["finished"] - _job_log_state["pruned"] > 3600:
+        _prune_job_logs(job["finished"])
+    _notify_job(job_id)
+    _evict_jobs()
+
+
+def _record_history(job_id, job):
+    started = job.get("started")
+    row = {
+        "job_id": job_id,
+        "watch_id": job.get("watch_id"),
+        "url": job.get("url"),
+        "title": job["title"],
+        "status": job["status"],
+        "exit_code": job.get("exit_code"),
+        "bytes": job.get("bytes", 0),
+        "created": _iso(job.get("created")),
+        "started": _iso(started),
+        "finished": _iso(job["finished"]),
+        "duration": round(job["finished"] - started, 1) if started else None,
+        "log_tail": "\n".join(list(job["log"])[-HISTORY_LOG_LINES:]),
+        "listed": job.get("listed"),
+        "filtered": job.get("filtered"),
+        "downloaded": job.get("downloaded"),
+        "profile": job.get("profile"),
+        "mb_per_s": job.get("mb_per_s"),
+    }
+    for column in _HISTORY_JSON_COLUMNS:
+        row[column] = json.dumps(job[column]) if job.get(column) else None
+    conn = _db()
+    with conn:
+        conn.execute(
+            f"INSERT OR REPLACE INTO job_history ({', '.join(_HISTORY_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(_HISTORY_COLUMNS))})",
+            [row[c] for c in _HISTORY_COLUMNS],
         )
-        for line in proc.stdout:
-            line = line.rstrip("\n")
-            job["log"].append(line)
-            pct = _parse_progress(line)
-            if pct is not None:
-                job["progress"] = pct
-            # Try to grab title from metadata
-            if line.startswith("[info]") and ":" in line and not job["title"]:
-                job["title"] = line.split(":", 1)[1].strip()[:120]
-        proc.wait()
-        if proc.returncode == 0:
-            job["status"] = "done"
-            job["progress"] = 100
-            trigger_jellyfin_scan()
-        else:
-            job["status"] = "error"
-    except Exception as e:
-        job["log"].append(f"ERROR: {e}")
-        job["status"] = "error"
+
+
+def _evict_jobs(now=None):
+    """Drop finished jobs past JOB_TTL, plus the oldest beyond MAX_JOBS."""
+    now = now or time.time()
+    with _jobs_lock:
+        finished = sorted(
+            (job["finished"], job_id) for job_id, job in _jobs.items() if job.get("finished")
+        )
+        excess = len(_jobs) - MAX_JOBS
+        for finished_at, job_id in finished:
+            if excess <= 0 and now - finished_at < JOB_TTL:
+                break
+            del _jobs[job_id]
+            _job_signals.pop(job_id, None)
+            excess -= 1
+
+
+def get_job_history(job_id):
+    """Return the recorded final state of *job_id*, or None."""
+    row = _db().execute("SELECT * FROM job_history WHERE job_id = ?", (job_id,)).fetchone()
+    return _history_from_row(row) if row else None
+
+
+def list_job_history(page=1, per_page=50, watch_id=None, status=None):
+    """Return (jobs, total) for one page of history, newest first."""
+    where, params = [], []
+    if watch_id:
+        where.append("watch_id = ?")
+        params.append(watch_id)
+    if status:
+        where.append("status = ?")
+        params.append(status)
+    clause = f"WHERE {' AND '.join(where)}" if where else ""
+    conn = _db()
+    total = conn.execute(f"SELECT COUNT(*) FROM job_history {clause}", params).fetchone()[0]
+    rows = conn.execute(
+        f"SELECT * FROM job_history {clause} ORDER BY finished DESC, job_id "
+        "LIMIT ? OFFSET ?",
+        params + [per_page, (page - 1) * per_page],
+    ).fetchall()
+    return [_history_from_row(r) for r in rows], total
+
+
+def _history_from_row(row):
+    record = dict(row)
+    for column in _HISTORY_JSON_COLUMNS:
+        if record[column]:
+            record[column] = json.loads(record[column])
+    return record
+
+
+def watch_phase_summary(watch_id, runs=20):
+    """Average seconds per phase over a watch's last *runs* recorded runs.
+
+    "slowest" names the phase with the highest average, ignoring time
+    spent queued.
+    """
+    rows = _db().execute(
+        "SELECT phase_seconds FROM job_history WHERE watch_id = ? AND phase_seconds IS NOT NULL "
+        "ORDER BY finished DESC LIMIT ?",
+        (watch_id, runs),
+    ).fetchall()
+    totals = {}
+    for row in rows:
+        for phase, seconds in json.loads(row["phase_seconds"]).items():
+            totals[phase] = totals.get(phase, 0) + seconds
+    mean = {phase: round(total / len(rows), 1) for phase, total in totals.items()}
+    working = {phase: s for phase, s in mean.items() if phase != "queued"}
+    return {
+        "runs": len(rows),
+        "mean_seconds": mean,
+        "slowest": max(working, key=working.get) if working else None,
+    }
 
 
 # ── Manual download routes ──────────────────────────────────────
@@ -155,54 +2403,331 @@ def _run_download_job(job_id, url):
 def download():
     if request.method == "POST":
         url = request.form["url"]
-        job_id = str(uuid.uuid4())
-        _jobs[job_id] = {
-            "status": "running",
-            "progress": 0,
-            "log": deque(maxlen=50),
-            "title": "",
-        }
-        t = threading.Thread(target=_run_download_job, args=(job_id, url), daemon=True)
-        t.start()
+        try:
+            priority = int(request.form.get("priority") or 0)
+        except ValueError:
+            return jsonify({"error": "priority must be an integer"}), 400
+        job_id = enqueue_download(url, priority, profile=request.form.get("profile"))
         return redirect(url_for("download_progress", job_id=job_id))
 
-    return render_template("download.html")
+    return render_template("download.html", profiles=THROUGHPUT_PROFILES,
+                           default_profile=DEFAULT_PROFILE)
 
 
 @app.route("/progress/<job_id>")
 def download_progress(job_id):
-    if job_id not in _jobs:
+    if job_id not in _jobs and get_job_history(job_id) is None:
         return redirect(url_for("download"))
     return render_template("progress.html", job_id=job_id)
 
 
+def _history_event(job_id):
+    """Build a final progress event for a job that is no longer in memory."""
+    past = get_job_history(job_id)
+    if past is None:
+        return {"status": "error", "progress": 0, "log": [], "title": "", "position": None}
+    return {
+        "status": past["status"],
+        "progress": 100 if past["status"] == "done" else 0,
+        "log": past["log_tail"].splitlines() if past["log_tail"] else [],
+        "title": past["title"],
+        "position": None,
+        "phase_seconds": past["phase_seconds"],
+    }
+
+
+def _parse_event_id(event_id):
+    """Parse a "<version>.<lines>" SSE event id, or return None."""
+    try:
+        version, lines = event_id.split(".")
+        return int(version), int(lines)
+    except (AttributeError, ValueError):
+        return None
+
+
 @app.route("/progress/<job_id>/stream")
 def progress_stream(job_id):
-    """SSE endpoint that pushes job progress updates to the browser."""
+    """SSE endpoint that pushes job progress updates to the browser.
+
+    Events carry only new log lines and fields that changed since the
+    previous event. Each event id is "<version>.<log lines sent>"; a client
+    reconnecting with Last-Event-ID gets every field again plus exactly the
+    log lines it missed.
+    """
+    resume = _parse_event_id(request.headers.get("Last-Event-ID"))
+    job = _jobs.get(job_id)
+    if job is None:
+        event = json.dumps(_history_event(job_id))
+        return Response(f"data: {event}\n\n", mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
     def generate():
-        if job_id not in _jobs:
-            yield f"data: {json.dumps({'status': 'error', 'progress': 0, 'log': [], 'title': ''})}\n\n"
-            return
-        job = _jobs[job_id]
-        last_sent = None
+        sent_fields = {}
+        lines_seen = resume[1] if resume else 0
+        version = None
         while True:
-            snapshot = json.dumps({
+            changed = wait_for_job_change(job_id, version, SSE_HEARTBEAT)
+            if changed is None:
+                yield ": heartbeat\n\n"
+                continue
+            version = changed
+            fields = {
                 "status": job["status"],
                 "progress": job["progress"],
-                "log": list(job["log"])[-3:],
                 "title": job["title"],
-            })
-            if snapshot != last_sent:
-                yield f"data: {snapshot}\n\n"
-                last_sent = snapshot
-            if job["status"] in ("done", "error"):
+                "position": queue_position(job_id),
+                "speed": job.get("speed"),
+                "eta": job.get("eta"),
+                "downloaded_bytes": job.get("downloaded_bytes"),
+                "total_bytes": job.get("total_bytes"),
+                "item": job.get("item"),
+                "items": job.get("items"),
+                "phase": job.get("phase"),
+                "phase_seconds": dict(job.get("phase_seconds") or {}),
+            }
+            delta = {k: v for k, v in fields.items()
+                     if k not in sent_fields or sent_fields[k] != v}
+            lines, lines_seen = _log_since(job_id, job, lines_seen)
+            if delta or lines:
+                sent_fields.update(delta)
+                delta["log"] = lines
+                yield f"id: {version}.{lines_seen}\ndata: {json.dumps(delta)}\n\n"
+            if job["status"] in _TERMINAL_STATUSES:
                 break
-            time.sleep(0.5)
 
     return Response(generate(), mimetype="text/event-stream",
                     headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
+@app.route("/events")
+def events_stream():
+    """SSE endpoint multiplexing progress for every active job.
+
+    Pass ``?watch=<id>`` (repeatable) to only receive jobs for those watches.
+    Each event carries the job_id and, for watch runs, the watch_id.
+    """
+    watch_ids = set(request.args.getlist("watch"))
+
+    def wanted(job):
+        return not watch_ids or job.get("watch_id") in watch_ids
+
+    def generate():
+        with _jobs_lock:
+            finished = {job_id for job_id, job in _jobs.items()
+                        if job["status"] in _TERMINAL_STATUSES}
+        sent = {}  # job_id -> job version last sent
+        seen = None
+        while True:
+            changed = _wait_signal(_any_job_signal, seen, SSE_HEARTBEAT)
+            if changed is None:
+                yield ": heartbeat\n\n"
+                continue
+            seen = changed
+            with _jobs_lock:
+                jobs = list(_jobs.items())
+            # Forget jobs pruned from _jobs so a long-lived stream stays bounded.
+            live = {job_id for job_id, _ in jobs}
+            finished &= live
+            sent = {job_id: version for job_id, version in sent.items() if job_id in live}
+            for job_id, job in jobs:
+                if job_id in finished or not wanted(job):
+                    continue
+                signal = _job_signals.get(job_id)
+                version = signal["version"] if signal else 0
+                if sent.get(job_id) == version:
+                    continue
+                if job["status"] in _TERMINAL_STATUSES:
+                    # The final event; later changes are not streamed.
+                    finished.add(job_id)
+                    sent.pop(job_id, None)
+                else:
+                    sent[job_id] = version
+                payload = json.dumps({
+                    "job_id": job_id,
+                    "watch_id": job.get("watch_id"),
+                    "status": job["status"],
+                    "progress": job["progress"],
+                    "title": job["title"],
+                    "item": job.get("item"),
+                    "items": job.get("items"),
+                })
+                yield f"data: {payload}\n\n"
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route("/jobs")
+def jobs_list():
+    """Paginated JSON listing of finished jobs from the history store."""
+    try:
+        page = max(int(request.args.get("page", 1)), 1)
+        per_page = min(max(int(request.args.get("per_page", 50)), 1), 500)
+    except ValueError:
+        return jsonify({"error": "page and per_page must be integers"}), 400
+    jobs, total = list_job_history(
+        page, per_page, request.args.get("watch_id"), request.args.get("status")
+    )
+    return jsonify({"jobs": jobs, "page": page, "per_page": per_page, "total": total})
+
+
+@app.route("/history")
+def jobs_history():
+    page = max(request.args.get("page", 1, type=int), 1)
+    per_page = 50
+    jobs, total = list_job_history(page, per_page)
+    pages = max((total + per_page - 1) // per_page, 1)
+    return render_template("history.html", jobs=jobs, page=page, pages=pages)
+
+
+@app.route("/jobs/<job_id>")
+def job_detail(job_id):
+    """One job's state and phase timing, live or from the history store."""
+    job = _jobs.get(job_id)
+    if job is None:
+        record = get_job_history(job_id)
+        if record is None:
+            return jsonify({"error": "unknown job"}), 404
+        record.pop("log_tail")
+        return jsonify(record)
+    with _phase_lock:
+        timing = {"phase_seconds": dict(job.get("phase_seconds") or {}),
+                  "timeline": list(job.get("timeline") or [])}
+    return jsonify({
+        "job_id": job_id,
+        "watch_id": job.get("watch_id"),
+        "url": job.get("url"),
+        "title": job["title"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "phase": job.get("phase"),
+        "speed": job.get("speed"),
+        "eta": job.get("eta"),
+        "downloaded_bytes": job.get("downloaded_bytes"),
+        "total_bytes": job.get("total_bytes"),
+        "fragment_index": job.get("fragment_index"),
+        "fragment_count": job.get("fragment_count"),
+        "item": job.get("item"),
+        "items": job.get("items"),
+        "video_id": job.get("video_id"),
+        "bytes": job.get("bytes", 0),
+        "created": _iso(job.get("created")),
+        "started": _iso(job.get("started")),
+        "finished": _iso(job.get("finished")),
+        **timing,
+    })
+
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _parse_byte_range(match, first, size):
+    """Return (start, end) of a ``bytes=`` range within [first, size), or None.
+
+    Ranges reaching before *first* (rotated away) are clipped to it, and
+    at most JOB_LOG_MAX_CHUNK bytes are served per request.
+    """
+    if match.group(1):
+        start = int(match.group(1))
+        end = int(match.group(2)) + 1 if match.group(2) else size
+    elif match.group(2):
+        start, end = size - int(match.group(2)), size
+    else:
+        return None
+    start = max(start, first)
+    end = min(end, size, start + JOB_LOG_MAX_CHUNK)
+    return (start, end) if start < end else None
+
+
+@app.route("/jobs/<job_id>/log")
+def job_log(job_id):
+    """A job's full log file, served by byte offset.
+
+    ``?offset=N&limit=M`` returns up to M bytes from offset N; a negative
+    N counts back from the end, for tailing. A ``Range: bytes=`` header
+    gets a 206 response instead. Offsets are stable across rotation:
+    X-Log-Start and X-Log-End give the retained extent, X-Log-Offset where
+    the body starts and X-Log-Next where to continue from.
+    """
+    extent = job_log_extent(job_id) if _JOB_ID_RE.match(job_id) else None
+    if extent is None:
+        return jsonify({"error": "no log for this job"}), 404
+    first, size = extent
+    headers = {"Accept-Ranges": "bytes", "X-Log-Start": str(first), "X-Log-End": str(size)}
+    match = _RANGE_RE.match(request.headers.get("Range", "").strip())
+    if match:
+        byte_range = _parse_byte_range(match, first, size)
+        if byte_range is None:
+            return Response(status=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        start, end = byte_range
+    else:
+        try:
+            offset = int(request.args.get("offset", first))
+            limit = min(max(int(request.args.get("limit", JOB_LOG_CHUNK)), 1), JOB_LOG_MAX_CHUNK)
+        except ValueError:
+            return jsonify({"error": "offset and limit must be integers"}), 400
+        start = min(max(size + offset if offset < 0 else offset, first), size)
+        end = min(start + limit, size)
+    data = read_job_log(job_id, start, end)
+    end = start + len(data)
+    headers.update({"X-Log-Offset": str(start), "X-Log-Next": str(end)})
+    if not match:
+        return Response(data, mimetype="text/plain", headers=headers)
+    if not data:
+        return Response(status=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    return Response(data, status=206, mimetype="text/plain", headers=headers)
+
+
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def job_cancel(job_id):
+    return jsonify({"cancelled": cancel_job(job_id)})
+
+
+@app.route("/jobs/<job_id>/priority", methods=["POST"])
+def job_priority(job_id):
+    try:
+        priority = int(request.form.get("priority") or 0)
+    except ValueError:
+        return jsonify({"error": "priority must be an integer"}), 400
+    if not reprioritize_job(job_id, priority):
+        return jsonify({"position": None})
+    return jsonify({"position": queue_position(job_id)})
+
+
+@app.route("/cache/stats")
+def cache_stats():
+    """Metadata cache counters, for tuning METADATA_CACHE_TTL / _MAX_MB."""
+    return jsonify(metadata_cache_stats())
+
+
+@app.route("/stages")
+def stages():
+    """Queued and running counts per pipeline stage."""
+    return jsonify(stage_depths())
+
+
+@app.route("/staging/stats")
+def staging_stats():
+    """Scratch volume usage and commit throughput."""
+    return jsonify(staging_commit_stats())
+
+
+@app.route("/metrics")
+def metrics():
+    """Pipeline metrics in the Prometheus text format."""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/archive/<video_id>")
+def archive_lookup(video_id):
+    """Report whether a video is in the download archive."""
+    record = get_archived(video_id, request.args.get("extractor", "youtube"))
+    if record is None:
+        return jsonify({"archived": False}), 404
+    return jsonify({"archived": True, **record})
+
+
 # ── Watch CRUD routes ───────────────────────────────────────────
 
 @app.route("/watches")
@@ -211,23 +2736,23 @@ def watches_list():
     today = date.today().isoformat()
     for w in watches:
         w["_active"] = w.get("start_date", "") <= today <= w.get("end_date", "")
+        w["_phases"] = watch_phase_summary(w["id"])
     return render_template("watches.html", watches=watches)
 
 
 @app.route("/watches/add", methods=["GET", "POST"])
 def watches_add():
     if request.method == "POST":
-        watches = load_watches()
-        watches.append(_watch_from_form(request.form))
-        save_watches(watches)
+        add_watch(_watch_from_form(request.form))
+        wake_scheduler()
         return redirect(url_for("watches_list"))
-    return render_template("watch_form.html", watch=None)
+    return render_template("watch_form.html", watch=None, profiles=THROUGHPUT_PROFILES,
+                           default_profile=DEFAULT_PROFILE)
 
 
 @app.route("/watches/<watch_id>/edit", methods=["GET", "POST"])
 def watches_edit(watch_id):
-    watches = load_watches()
-    watch = find_watch(watches, watch_id)
+    watch = get_watch(watch_id)
     if not watch:
         return redirect(url_for("watches_list"))
 
@@ -235,45 +2760,52 @@ def watches_edit(watch_id):
         updated = _watch_from_form(request.form)
         updated["id"] = watch["id"]
         updated["last_run"] = watch.get("last_run")
-        watches = [updated if w["id"] == watch_id else w for w in watches]
-        save_watches(watches)
+        update_watch(updated)
+        if any(updated[k] != watch[k] for k in _SWEEP_FIELDS):
+            # Videos skipped under the old rules may match now.
+            set_watch_state(watch_id, hwm_video_id=None, hwm_date=None,
+                            last_full_sweep=None, feed_seen=None)
+        wake_scheduler()
         return redirect(url_for("watches_list"))
 
-    return render_template("watch_form.html", watch=watch)
+    return render_template("watch_form.html", watch=watch, profiles=THROUGHPUT_PROFILES,
+                           default_profile=DEFAULT_PROFILE)
 
 
 @app.route("/watches/<watch_id>/delete", methods=["POST"])
 def watches_delete(watch_id):
-    watches = load_watches()
-    watches = [w for w in watches if w["id"] != watch_id]
-    save_watches(watches)
+    delete_watch(watch_id)
+    wake_scheduler()
     return redirect(url_for("watches_list"))
 
 
 @app.route("/watches/<watch_id>/run", methods=["POST"])
 def watches_run(watch_id):
-    watches = load_watches()
-    watch = find_watch(watches, watch_id)
+    watch = get_watch(watch_id)
     if watch:
-        job_id = str(uuid.uuid4())
-        with _jobs_lock:
-            _jobs[job_id] = {
-                "status": "running",
-                "progress": 0,
-                "log": deque(maxlen=50),
-                "title": "",
-            }
-        with _watch_jobs_lock:
-            _watch_jobs[watch["id"]] = job_id
-        threading.Thread(
-            target=_run_watch, args=(watch,), kwargs={"job_id": job_id}, daemon=True
-        ).start()
-        watch["last_run"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
-        save_watches(watches)
+        job_id, started = start_watch_job(watch)
+        if started:
+            set_last_run(watch_id, datetime.now(timezone.utc).isoformat(timespec="seconds"))
+            wake_scheduler()
         return jsonify({"job_id": job_id})
     return jsonify({"job_id": None})
 
 
+@app.route("/watches/<watch_id>/phases")
+def watches_phases(watch_id):
+    """Average phase timing over a watch's recent runs."""
+    return jsonify(watch_phase_summary(watch_id, request.args.get("runs", 20, type=int)))
+
+
+@app.route("/watches/export")
+def watches_export():
+    return Response(
+        json.dumps(load_watches(), indent=2),
+        mimetype="application/json",
+        headers={"Content-Disposition": "attachment; filename=watches.json"},
+    )
+
+
 @app.route("/watches/running")
 def watches_running():
     with _watch_jobs_lock:
@@ -292,130 +2824,680 @@ def _watch_from_form(form):
         "interval_hours": int(form["interval_hours"]),
         "enabled": "enabled" in form,
         "last_run": None,
+        "profile": _profile_name(form.get("profile")),
     }
 
 
+# ── Upload feeds ────────────────────────────────────────────────
+# YouTube publishes the newest uploads of every channel and playlist as
+# an Atom feed, which costs one small request. An incremental watch run
+# checks it first and skips yt-dlp altogether when every entry was
+# already in the feed at the previous successful run. Channel feeds are
+# keyed by channel ID, so @handle URLs are resolved once and cached in
+# the channel_ids table.
+
+_CHANNEL_ID_RE = re.compile(r"/channel/(UC[\w-]{22})")
+_PAGE_CHANNEL_ID_RE = re.compile(
+    r'"externalId":"(UC[\w-]{22})"|<link rel="canonical" href="[^"]*/channel/(UC[\w-]{22})"'
+)
+_PLAYLIST_ID_RE = re.compile(r"[?&]list=([\w-]+)")
+_FEED_NS = {"atom": "http://www.w3.org/2005/Atom", "yt": "http://www.youtube.com/xml/schemas/2015"}
+
+
+def resolve_channel_id(url):
+    """Return the UC... channel ID behind a channel URL, or None."""
+    match = _CHANNEL_ID_RE.search(url)
+    if match:
+        return match.group(1)
+    url = url.rstrip("/")
+    conn = _db()
+    row = conn.execute("SELECT channel_id FROM channel_ids WHERE url = ?", (url,)).fetchone()
+    if row is not None:
+        return row["channel_id"]
+    try:
+        # The consent cookie keeps EU requests from landing on consent.youtube.com.
+        response = requests.get(url, cookies={"CONSENT": "YES+1"}, timeout=FEED_TIMEOUT)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        print(f"[feed] could not resolve {url}: {e}", flush=True)
+        return None
+    match = _PAGE_CHANNEL_ID_RE.search(response.text)
+    if match is None:
+        print(f"[feed] no channel ID found at {url}", flush=True)
+        return None
+    channel_id = match.group(1) or match.group(2)
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO channel_ids (url, channel_id, resolved) VALUES (?, ?, ?)",
+            (url, channel_id, datetime.now(timezone.utc).isoformat(timespec="seconds")),
+        )
+    return channel_id
+
+
+def _feed_url(url):
+    match = _PLAYLIST_ID_RE.search(url)
+    if match:
+        return f"{YOUTUBE_FEED_URL}?playlist_id={match.group(1)}"
+    channel_id = resolve_channel_id(url)
+    if channel_id is None:
+        return None
+    return f"{YOUTUBE_FEED_URL}?channel_id={channel_id}"
+
+
+def fetch_feed(url):
+    """Return the video IDs in the upload feed for a channel or playlist URL.
+
+    Newest first; None if the feed could not be found or fetched.
+    """
+    feed_url = _feed_url(url)
+    if feed_url is None:
+        return None
+    try:
+        response = requests.get(feed_url, timeout=FEED_TIMEOUT)
+        response.raise_for_status()
+        root = ElementTree.fromstring(response.content)
+    except (requests.RequestException, ElementTree.ParseError) as e:
+        print(f"[feed] could not fetch {feed_url}: {e}", flush=True)
+        return None
+    return [el.text for el in root.iterfind("atom:entry/yt:videoId", _FEED_NS)]
+
+
+def _feed_unchanged(watch, feed):
+    """Return True if *feed* has nothing the watch's last successful run didn't see."""
+    seen = watch.get("feed_seen")
+    return seen is not None and set(feed) <= set(seen.split())
+
+
 # ── Watch execution ─────────────────────────────────────────────
+# A watch runs in two stages. The listing stage enumerates the channel
+# with --flat-playlist, which costs one request per page of videos, and
+# applies the title filters, date window and archive to that metadata.
+# Only the videos that survive are handed to the download stage, so
+# rejected videos never cost a full page and player fetch.
+#
+# Channel tabs list newest uploads first, so incremental runs stop the
+# listing at the first video already dealt with: one in the archive, the
+# newest video seen by the previous run (hwm_video_id), or anything
+# uploaded before that run (hwm_date) or before the watch window. Every
+# WATCH_FULL_SWEEP_DAYS a run walks the whole channel instead, to catch
+# uploads that show up out of order.
+
+# Changing any of these invalidates a watch's high-water mark.
+_SWEEP_FIELDS = ("channel_url", "title_filter", "title_exclude", "start_date", "end_date")
+
+
+def _incremental_stop(watch, now):
+    """Return where an incremental listing may stop, or None for a full sweep.
+
+    The result is a dict with "since" (YYYYMMDD), "video_id" (or None) and
+    the "watch_id" whose own archive records end the listing.
+    """
+    if not WATCH_INCREMENTAL:
+        return None
+    last_sweep = _parse_last_run(watch.get("last_full_sweep"))
+    if last_sweep is None or now - last_sweep >= timedelta(days=WATCH_FULL_SWEEP_DAYS):
+        return None
+    since = max(watch["start_date"].replace("-", ""), watch.get("hwm_date") or "")
+    return {"since": since, "video_id": watch.get("hwm_video_id"), "watch_id": watch["id"]}
+
 
-def _run_watch(watch, job_id=None):
-    """Execute yt-dlp for a single watch.
+def _title_filter_pattern(watch):
+    """Return the --match-title regex for a watch's title_filter, or ""."""
+    words = watch.get("title_filter", "").split()
+    return "".join(f"(?=.*{re.escape(w)})" for w in words)
 
-    If job_id is provided, streams output to _jobs[job_id] via Popen.
-    Otherwise (scheduler path), calls run_ytdlp synchronously.
+
+def _entry_archived(entry):
+    return has_video(entry.get("id"), entry.get("ie_key") or "youtube")
+
+
+def _entry_url(entry):
+    return entry.get("url") or entry.get("webpage_url") or entry["id"]
+
+
+def _entry_date(entry):
+    """Return an entry's upload date as YYYYMMDD, or None if the listing lacks it."""
+    if entry.get("upload_date"):
+        return entry["upload_date"]
+    if entry.get("timestamp"):
+        return datetime.fromtimestamp(entry["timestamp"], timezone.utc).strftime("%Y%m%d")
+    return None
+
+
+def _entry_wanted(watch, entry):
+    """Apply a watch's title filters and date window to a listing entry.
+
+    Entries the listing has no date for are kept; the download stage's
+    --dateafter/--datebefore decide those once the full info is known.
     """
-    os.makedirs(ARCHIVES_DIR, exist_ok=True)
-    archive_file = os.path.join(ARCHIVES_DIR, f"{watch['id']}.txt")
+    title = entry.get("title") or ""
+    pattern = _title_filter_pattern(watch)
+    if pattern and not re.search(pattern, title, re.IGNORECASE):
+        return False
+    exclude = watch.get("title_exclude", "").strip()
+    if exclude and re.search(exclude, title, re.IGNORECASE):
+        return False
+    uploaded = _entry_date(entry)
+    if uploaded and not (
+        watch["start_date"].replace("-", "") <= uploaded <= watch["end_date"].replace("-", "")
+    ):
+        return False
+    return True
+
+
+def _stop_listing(entry, stop):
+    """Return True if an incremental listing has reached already-seen videos.
+
+    Only videos this watch archived itself count: the archive is shared, so
+    a video another watch or a manual download fetched says nothing about
+    the uploads behind it.
+    """
+    record = get_archived(entry.get("id"), entry.get("ie_key") or "youtube")
+    if record and record["watch_id"] == stop["watch_id"]:
+        return True
+    if stop["video_id"] and entry.get("id") == stop["video_id"]:
+        return True
+    uploaded = _entry_date(entry)
+    return bool(uploaded and uploaded < stop["since"])
+
+
+def _list_entries(url, job_ids=(), stop_at=None):
+    """Enumerate *url* with --flat-playlist and return its entries, newest first.
+
+    Enumeration ends early at the first entry *stop_at* returns True for;
+    that entry is not included. Returns None if the listing failed. For
+    each of *job_ids*, non-JSON output goes to the job log and the job can
+    be cancelled through _job_procs like a download; cancelling only drops
+    that job from a shared listing, which stops once no job is left. No
+    listing is started if every one of *job_ids* is already cancelled.
+    """
+    if job_ids and all(_cancelled(job_id) for job_id in job_ids):
+        return None
+    started = time.time()
+    proc = subprocess.Popen(  # noqa: S603
+        ["yt-dlp", "--flat-playlist", "--lazy-playlist", "--dump-json", url],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        text=True, bufsize=1,
+    )
+    members = set(job_ids)
+    members_lock = threading.Lock()
+
+    def leave(job_id):
+        with members_lock:
+            members.discard(job_id)
+            last = not members
+        if last:
+            proc.terminate()
+
+    for job_id in job_ids:
+        _job_procs[job_id] = SimpleNamespace(terminate=lambda job_id=job_id: leave(job_id))
+        if _cancelled(job_id):
+            leave(job_id)
+    entries = []
+    stopped = False
+    try:
+        for line in proc.stdout:
+            line = line.rstrip("\n")
+            try:
+                entry = json.loads(line) if line.startswith("{") else None
+            except ValueError:
+                entry = None
+            if entry is None:
+                for job_id in list(members):
+                    _append_log(job_id, line)
+                continue
+            if stop_at is not None and stop_at(entry):
+                stopped = True
+                proc.terminate()
+                break
+            entries.append(entry)
+        proc.wait()
+    finally:
+        for job_id in job_ids:
+            _job_procs.pop(job_id, None)
+            _record_phase(job_id, "listing", started, time.time())
+    if not stopped:
+        count_metric("downloader_ytdlp_exit_codes_total", stage="listing", code=proc.returncode)
+        if proc.returncode != 0:
+            return None
+    return entries
+
+
+def _group_stop(stops):
+    """Return a listing stop_at that fires once every one of *stops* has been reached."""
+    reached = set()
+
+    def stop_at(entry):
+        for i, stop in enumerate(stops):
+            if i not in reached and _stop_listing(entry, stop):
+                reached.add(i)
+        return len(reached) == len(stops)
+    return stop_at
+
+
+def _entries_until(entries, stop):
+    """Cut a listing at the first entry an incremental watch has already seen."""
+    if stop is None:
+        return entries
+    for i, entry in enumerate(entries):
+        if _stop_listing(entry, stop):
+            return entries[:i]
+    return entries
+
+
+def _filter_entries(watch, entries):
+    """Return (video URLs a watch still wants from *entries*, counts)."""
+    wanted = [
+        e for e in entries
+        if not _entry_archived(e) and _entry_wanted(watch, e)
+    ]
+    counts = {"listed": len(entries), "filtered": len(entries) - len(wanted)}
+    return [_entry_url(e) for e in wanted], counts
 
+
+def _watch_url(watch):
+    """Return the URL a watch lists: its channel's Videos tab for @handles."""
+    url = watch["channel_url"].rstrip("/")
+    if re.search(r"youtube\.com/@[^/]+$", url):
+        url += "/videos"
+    return url
+
+
+# Post-processors a watch run leaves to the post-processing stage.
+_WATCH_POSTPROCESS_ARGS = ["--embed-metadata", "--embed-thumbnail", "--embed-subs"]
+
+
+def _watch_args(watch):
+    """Return the yt-dlp download-stage arguments for a watch."""
     args = [
-        "--download-archive", archive_file,
         "--dateafter", watch["start_date"].replace("-", ""),
         "--datebefore", watch["end_date"].replace("-", ""),
         "--write-thumbnail",
         "--format", "bestvideo+bestaudio/best",
         "--merge-output-format", "mp4",
         "--parse-metadata", "%(upload_date>%Y)s:%(meta_date)s",
-        "--embed-metadata",
-        "--embed-thumbnail",
-        "--embed-subs",
+        "--write-subs",
         "--sub-langs", "en,en-US",
-        "--remote-components", "ejs:github",
         "--ignore-errors",
         "--no-overwrites",
-        "--output", f"{YOUTUBE_PATH}%(uploader)s/{watch['name']}/%(title)s.%(ext)s",
+        "--paths", YOUTUBE_PATH,
+        "--output", f"%(uploader)s/{watch['name']}/%(title)s.%(ext)s",
     ]
 
-    title_filter = watch.get("title_filter", "").strip()
+    title_filter = _title_filter_pattern(watch)
     if title_filter:
-        words = title_filter.split()
-        pattern = "".join(f"(?=.*{re.escape(w)})" for w in words)
-        args += ["--match-title", pattern]
+        args += ["--match-title", title_filter]
 
     title_exclude = watch.get("title_exclude", "").strip()
     if title_exclude:
         args += ["--reject-title", title_exclude]
+    return args
 
-    url = watch["channel_url"].rstrip("/")
-    if re.search(r"youtube\.com/@[^/]+$", url):
-        url += "/videos"
 
-    print(f"[scheduler] running watch '{watch['name']}'", flush=True)
+def _record_watch_progress(watch, job, started_at, full_sweep, feed=None):
+    """Advance a watch's high-water mark after a successful run."""
+    fields = {
+        # upload_date is a calendar date in an unknown timezone; keep a day of slack.
+        "hwm_date": (started_at - timedelta(days=1)).strftime("%Y%m%d"),
+    }
+    if job.get("newest_video_id"):
+        fields["hwm_video_id"] = job["newest_video_id"]
+    if full_sweep:
+        fields["last_full_sweep"] = started_at.isoformat(timespec="seconds")
+    if feed is not None:
+        fields["feed_seen"] = " ".join(feed)
+    set_watch_state(watch["id"], **fields)
+
+
+def _claim_watch(watch):
+    """Create a queued job for *watch* unless it already has one in flight.
+
+    Returns (job_id, claimed); an in-flight watch returns its existing job.
+    """
+    with _watch_jobs_lock:
+        running = _watch_jobs.get(watch["id"])
+        if running is not None:
+            return running, False
+        job_id = str(uuid.uuid4())
+        with _jobs_lock:
+            _jobs[job_id] = _new_job(status="queued", watch_id=watch["id"],
+                                     url=watch["channel_url"])
+        _watch_jobs[watch["id"]] = job_id
+    _notify_job(job_id)
+    return job_id, True
+
+
+def start_watch_job(watch):
+    """Submit a run of *watch* to the watch executor.
+
+    Returns (job_id, started). A watch only ever has one run in flight:
+    if it is already queued or running, its existing job_id is returned
+    with started=False.
+    """
+    job_id, started = _claim_watch(watch)
+    if started:
+        _watch_executor.submit(_in_watch_slot, _run_watch, watch, job_id=job_id)
+    return job_id, started
+
+
+def start_watch_group(watches):
+    """Submit one run of several watches that share a channel.
+
+    Watches already in flight are left out. Returns the (watch, job_id)
+    pairs that were started.
+    """
+    runs = []
+    for watch in watches:
+        job_id, started = _claim_watch(watch)
+        if started:
+            runs.append((watch, job_id))
+    if runs:
+        _watch_executor.submit(_in_watch_slot, _run_watch_group, runs)
+    return runs
+
+
+def _in_watch_slot(run, *args, **kwargs):
+    """Executor task: run a watch download stage, counted for stage_depths()."""
+    _count_stage("watch_running", 1)
+    try:
+        run(*args, **kwargs)
+    finally:
+        _count_stage("watch_running", -1)
+
+
+def _release_watch(watch_id, job_id):
+    with _watch_jobs_lock:
+        if _watch_jobs.get(watch_id) == job_id:
+            del _watch_jobs[watch_id]
+    wake_scheduler()
+
 
-    if job_id is not None:
-        job = _jobs[job_id]
+def _run_watch(watch, job_id):
+    """Run a single watch on the configured backend, streaming progress to _jobs[job_id]."""
+    _run_watch_group([(watch, job_id)])
+
+
+def _run_watch_group(runs):
+    """Run watches that share a channel from a single listing of it.
+
+    *runs* is a list of (watch, job_id). The feed and the listing are
+    fetched once; each watch then applies its own filters, archive check
+    and output directory in its own job. The listing goes as far as the
+    watch that needs the most of it.
+    """
+    started_at = datetime.now(timezone.utc)
+    url = _watch_url(runs[0][0])
+    stops = {job_id: None for _, job_id in runs}
+    listings = {}
+    feed = None
+    # Whatever fails here, every run still goes through
+    # _run_watch_downloads, whose finish path releases the watch.
+    try:
+        for _, job_id in runs:
+            _job_started(job_id)
+        if len(runs) > 1:
+            names = ", ".join(f"'{watch['name']}'" for watch, _ in runs)
+            print(f"[scheduler] listing {url} once for watches {names}", flush=True)
+        stops = {job_id: _incremental_stop(watch, started_at) for watch, job_id in runs}
+        feed = fetch_feed(runs[0][0]["channel_url"]) if WATCH_FEED_PRECHECK else None
+        listed = [
+            job_id for watch, job_id in runs
+            if not (stops[job_id] and feed is not None and _feed_unchanged(watch, feed))
+        ]
+        if listed:
+            group_stops = [stops[job_id] for job_id in listed]
+            stop_at = _group_stop(group_stops) if None not in group_stops else None
+            entries = _list_entries(url, job_ids=listed, stop_at=stop_at)
+            if entries is not None and stop_at is None:
+                cache_playlist(url, entries)
+            if entries is not None:
+                # Cut every share before any download adds to the archive.
+                listings = {job_id: _entries_until(entries, stops[job_id]) for job_id in listed}
+    except Exception as e:
+        for _, job_id in runs:
+            _append_log(job_id, f"ERROR: {e}")
+            _jobs[job_id]["status"] = "error"
+
+    for watch, job_id in runs:
+        _run_watch_downloads(watch, job_id, url, started_at, stops[job_id], feed,
+                             listings.get(job_id))
+
+
+def _run_watch_downloads(watch, job_id, url, started_at, stop, feed, entries):
+    """Download stage for one watch of a run, given its share of the listing.
+
+    *entries* is None if the listing failed, in which case yt-dlp walks
+    the channel page itself. The job finishes, and the watch is released,
+    once its videos have been post-processed.
+    """
+    job = _jobs[job_id]
+    returncode, written = None, set()
+
+    def finish(returncode, written):
         try:
-            cmd = ["yt-dlp", "--newline"] + args + [url]
-            proc = subprocess.Popen(  # noqa: S603
-                cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                text=True, bufsize=1,
-            )
-            for line in proc.stdout:
-                line = line.rstrip("\n")
-                job["log"].append(line)
-                pct = _parse_progress(line)
-                if pct is not None:
-                    job["progress"] = pct
-                if line.startswith("[info]") and ":" in line and not job["title"]:
-                    job["title"] = line.split(":", 1)[1].strip()[:120]
-            proc.wait()
-            if proc.returncode == 0:
-                job["status"] = "done"
-                job["progress"] = 100
-                trigger_jellyfin_scan()
-            else:
-                job["status"] = "error"
+            if returncode is not None:
+                job["exit_code"] = returncode
+                if job["status"] == "running":
+                    _finish_ytdlp_status(job, returncode, written)
+            if job["status"] == "done":
+                _record_watch_progress(watch, job, started_at, full_sweep=stop is None, feed=feed)
         except Exception as e:
-            job["log"].append(f"ERROR: {e}")
+            _append_log(job_id, f"ERROR: {e}")
             job["status"] = "error"
         finally:
-            with _watch_jobs_lock:
-                _watch_jobs.pop(watch["id"], None)
-    else:
-        success = run_ytdlp(url, args)
-        if success:
-            trigger_jellyfin_scan()
+            _finish_job(job_id)
+            _release_watch(watch["id"], job_id)
+
+    try:
+        if job["status"] in ("cancelled", "error"):
+            return
+        mode = "incremental" if stop else "full sweep"
+        print(f"[scheduler] running watch '{watch['name']}' ({mode})", flush=True)
+        if stop and feed is not None and _feed_unchanged(watch, feed):
+            _append_log(job_id, "[watch] no new uploads in the channel feed; skipping yt-dlp")
+            job["progress"] = 100
+            job["status"] = "done"
+            return
+        if entries is None:
+            _append_log(job_id, "[watch] listing failed; downloading from the channel page")
+            videos = [url]
+        else:
+            videos, counts = _filter_entries(watch, entries)
+            job.update(counts)
+            if entries:
+                job["newest_video_id"] = entries[0].get("id")
+            _append_log(job_id, f"[watch] listed {counts['listed']}, "
+                                f"filtered {counts['filtered']}, queued {len(videos)}")
+        if videos:
+            report_file = _archive_report_file(job_id)
+            args = _watch_args(watch) + _staging_args(job_id)
+            handoff = _start_pipeline(job_id, args + _WATCH_POSTPROCESS_ARGS)
+            profile = _profile_args(job_id, watch.get("profile"))
+            # Without a listing, yt-dlp walks the channel and checks the archive itself.
+            archive = _archive_export_args(job_id) if entries is None else []
+            returncode, written = _download_videos(
+                job_id, args + profile + archive + _archive_args(report_file) + handoff, videos
+            )
+            # Archive right away so the other watches of a group skip these videos.
+            job["downloaded"] = _collect_archive_report(
+                report_file, watch_id=watch["id"], job_id=job_id
+            )
+        else:
+            job["downloaded"] = 0
+            job["progress"] = 100
+            job["status"] = "done"
+    except Exception as e:
+        _append_log(job_id, f"ERROR: {e}")
+        job["status"] = "error"
+    finally:
+        _remove_archive_export(job_id)
+        _finish_pipeline(job_id, returncode, written, finish)
 
 
 # ── Background scheduler ────────────────────────────────────────
+# Due times live in a heap keyed on each watch's next run. The loop sleeps
+# until the earliest deadline and is woken early by wake_scheduler()
+# whenever watches change or a watch run finishes. Due times are offset
+# by up to SCHEDULER_JITTER × interval so watches added or run together
+# drift apart instead of firing in lock-step. Each watch's offset is
+# derived from its id, so it stays the same from run to run and restart
+# to restart.
+# A due watch takes along any watch on the same channel that would fall
+# due within WATCH_GROUP_WINDOW seconds, so the channel is listed once.
+
+_schedule = []        # heap of (due datetime, watch_id)
+_schedule_due = {}    # watch_id -> (fingerprint, due datetime or None)
+_scheduler_wake = threading.Event()
+
+_SCHEDULE_FIELDS = ("enabled", "last_run", "interval_hours", "start_date", "end_date")
+
+
+def wake_scheduler():
+    _scheduler_wake.set()
+
+
+def _parse_last_run(last_run):
+    if not last_run:
+        return None
+    try:
+        last_run_dt = datetime.fromisoformat(last_run)
+    except (TypeError, ValueError):
+        return None
+    if last_run_dt.tzinfo is None:
+        last_run_dt = last_run_dt.astimezone(timezone.utc)
+    return last_run_dt
+
+
+def _jitter_fraction(watch_id):
+    """Return a stable fraction in [-1, 1) for spreading *watch_id*'s runs."""
+    digest = hashlib.sha1(watch_id.encode()).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 63 - 1
+
+
+def _scheduled_due(watch):
+    """Return (due time, window end, catch-up delay) for *watch*, or None if it never runs.
+
+    The due time is last_run + interval (or the window start) plus the
+    watch's jitter offset, before an overdue watch is moved up to now.
+    """
+    if not watch.get("enabled"):
+        return None
+    try:
+        start = datetime.fromisoformat(watch["start_date"]).replace(tzinfo=timezone.utc)
+        end = datetime.fromisoformat(watch["end_date"]).replace(tzinfo=timezone.utc)
+    except (KeyError, TypeError, ValueError):
+        return None
+    end += timedelta(days=1)
+
+    interval = timedelta(hours=watch.get("interval_hours", 4))
+    jitter = interval * SCHEDULER_JITTER
+    last_run = _parse_last_run(watch.get("last_run"))
+    due = last_run + interval if last_run else start
+    offset = _jitter_fraction(watch["id"])
+    return max(due + jitter * offset, start), end, jitter * (offset + 1) / 2
+
+
+def _compute_due(watch, now):
+    """Return when *watch* should next run, or None if it never will."""
+    scheduled = _scheduled_due(watch)
+    if scheduled is None:
+        return None
+    due, end, catch_up = scheduled
+    if due < now:
+        due = now + catch_up
+    return due if due < end else None
+
+
+def _record_lag(watch, due_at, now):
+    """Record how late *watch* starts at *now*.
+
+    A watch that has run before is measured from its jittered due time
+    rather than *due_at*, which is moved up to the present when a watch
+    is overdue, so time lost to downtime still counts.
+    """
+    scheduled = _scheduled_due(watch) if watch.get("last_run") else None
+    lag = max((now - (scheduled[0] if scheduled else due_at)).total_seconds(), 0.0)
+    observe_metric("downloader_scheduler_lag_seconds", lag)
+    set_metric("downloader_scheduler_last_lag_seconds", lag, watch_id=watch["id"])
+
+
+def _scheduler_tick(now):
+    """Start every watch due at *now*; return seconds until the next deadline."""
+    watches = load_watches()
+    with _watch_jobs_lock:
+        running = set(_watch_jobs)
+
+    due = {}
+    for watch in watches:
+        fingerprint = tuple(watch.get(k) for k in _SCHEDULE_FIELDS)
+        cached = _schedule_due.get(watch["id"])
+        if cached is not None and cached[0] == fingerprint:
+            due[watch["id"]] = cached
+        else:
+            due[watch["id"]] = (fingerprint, _compute_due(watch, now))
+    _schedule_due.clear()
+    _schedule_due.update(due)
+
+    # Watches still running are left out; their release wakes us again.
+    _schedule[:] = [
+        (due_at, watch_id) for watch_id, (_, due_at) in due.items()
+        if due_at is not None and watch_id not in running
+    ]
+    heapq.heapify(_schedule)
+
+    changed = False
+    while _schedule and _schedule[0][0] <= now:
+        due_at, watch_id = heapq.heappop(_schedule)
+        watch = find_watch(watches, watch_id)
+        mates = _pop_channel_mates(watch, watches, now)
+        for member, member_due in [(watch, due_at)] + mates:
+            _record_lag(member, member_due, now)
+        group = [watch] + [mate for mate, _ in mates]
+        if len(group) == 1:
+            _, started = start_watch_job(watch)
+            started = [watch] if started else []
+        else:
+            started = [w for w, _ in start_watch_group(group)]
+        for w in started:
+            set_last_run(w["id"], now.isoformat(timespec="seconds"))
+            changed = True
+
+    if changed:
+        return 0  # reschedule the watches that just ran
+    if not _schedule:
+        return SCHEDULER_MAX_SLEEP
+    return min((_schedule[0][0] - now).total_seconds(), SCHEDULER_MAX_SLEEP)
+
+
+def _pop_channel_mates(watch, watches, now):
+    """Take watches on *watch*'s channel due within WATCH_GROUP_WINDOW off the heap.
+
+    They run alongside *watch* from one listing of the channel. Returns
+    a list of (watch, due time).
+    """
+    horizon = now + timedelta(seconds=WATCH_GROUP_WINDOW)
+    channel = _watch_url(watch).lower()
+    mates = []
+    for due_at, watch_id in list(_schedule):
+        other = find_watch(watches, watch_id)
+        if due_at <= horizon and _watch_url(other).lower() == channel:
+            _schedule.remove((due_at, watch_id))
+            mates.append((other, due_at))
+    heapq.heapify(_schedule)
+    return mates
+
 
 def _scheduler_loop():
     print("[scheduler] started", flush=True)
     while True:
-        time.sleep(300)  # check every 5 minutes
+        _scheduler_wake.clear()
         try:
-            watches = load_watches()
-            now = datetime.now(timezone.utc)
-            today = now.date().isoformat()
-            changed = False
-
-            for watch in watches:
-                if not watch.get("enabled"):
-                    continue
-                if not (watch.get("start_date", "") <= today <= watch.get("end_date", "")):
-                    continue
-
-                last_run = watch.get("last_run")
-                if last_run:
-                    try:
-                        last_run_dt = datetime.fromisoformat(last_run)
-                        if last_run_dt.tzinfo is None:
-                            last_run_dt = last_run_dt.astimezone(timezone.utc)
-                    except (TypeError, ValueError):
-                        last_run_dt = None
-                    if last_run_dt is not None:
-                        elapsed = (now - last_run_dt).total_seconds() / 3600
-                        if elapsed < watch.get("interval_hours", 4):
-                            continue
-
-                _run_watch(watch)
-                watch["last_run"] = now.isoformat(timespec="seconds")
-                changed = True
-
-            if changed:
-                save_watches(watches)
-
-        except Exception as e:
+            timeout = _scheduler_tick(datetime.now(timezone.utc))
+        except Exception:
             import traceback
             traceback.print_exc()
+            timeout = SCHEDULER_MAX_SLEEP
+        _scheduler_wake.wait(timeout)
 
 
 def start_scheduler():
@@ -423,8 +3505,101 @@ def start_scheduler():
     t.start()
 
 
+# ── Serving ─────────────────────────────────────────────────────
+# SERVER=gevent (the default) serves HTTP from gevent's WSGI server: each
+# connection is a greenlet on one event loop in the main thread, so an
+# open SSE stream costs a coroutine rather than a thread, and at most
+# HTTP_MAX_CONNECTIONS are served at once. Nothing is monkey-patched:
+# downloads, watches and the scheduler keep running in ordinary threads,
+# and wake the streams waiting on a job through gevent async watchers,
+# which may be signalled from any thread. Since SQLite, file and queue
+# I/O would block the one event loop, every request's handler runs on
+# the hub's threadpool (HTTP_THREADS threads); only the bodies of SSE
+# streams, which wait on the loop, are iterated by the greenlet. The
+# locks those streams take (a job's signal, _queue_cond) are never held
+# across file writes, so a slow disk cannot stall them either. SERVER=dev runs Flask's
+# threaded development server instead. Job state lives in this process,
+# so it must be the only one serving the app; start_background() starts
+# the background threads once per process whichever server runs.
+
+_green = {"thread": None}   # ident of the thread running the gevent event loop
+_background_state = {"started": False}
+_background_lock = threading.Lock()
+
+
+def _wait_signal_green(signal, seen_version, timeout):
+    """_wait_signal for a greenlet: yield to the event loop while waiting."""
+    from gevent import get_hub
+    from gevent.event import Event
+
+    woken = Event()
+    watcher = get_hub().loop.async_()
+    watcher.start(woken.set)
+    try:
+        with signal["cond"]:
+            signal["watchers"].add(watcher)
+            version = signal["version"]
+        if version == seen_version:
+            woken.wait(timeout)
+    finally:
+        with signal["cond"]:
+            signal["watchers"].discard(watcher)
+        watcher.close()
+    version = signal["version"]
+    return version if version != seen_version else None
+
+
+def _offloaded(wsgi_app):
+    """Wrap *wsgi_app* so each request is handled on the hub's threadpool.
+
+    The request body is read on the event loop first, as gevent sockets
+    can only be used from their hub's thread.
+    """
+    from gevent import get_hub
+
+    def handle(environ, start_response):
+        environ["wsgi.input"] = io.BytesIO(environ["wsgi.input"].read())
+        return get_hub().threadpool.apply(wsgi_app, (environ, start_response))
+
+    return handle
+
+
+def _gevent_server(listener):
+    """Return a gevent WSGI server for the app, whose event loop is this thread's."""
+    from gevent import get_hub
+    from gevent.pool import Pool
+    from gevent.pywsgi import WSGIServer
+
+    _green["thread"] = threading.get_ident()
+    get_hub().threadpool.maxsize = HTTP_THREADS
+    return WSGIServer(listener, _offloaded(app), spawn=Pool(HTTP_MAX_CONNECTIONS))
+
+
+def start_background():
+    """Start the background threads, once per process. Returns False if already started."""
+    with _background_lock:
+        if _background_state["started"]:
+            return False
+        _background_state["started"] = True
+    sweep_staging()
+    start_ejs_refresher()
+    start_scan_dispatcher()
+    start_download_workers()
+    start_scheduler()
+    return True
+
+
+def serve(host="0.0.0.0", port=5000):
+    """Start the background threads and serve the app with the SERVER backend."""
+    start_background()
+    print(f"[server] serving on {host}:{port} with {SERVER}", flush=True)
+    if SERVER == "dev":
+        app.run(host=host, port=port)
+    else:
+        _gevent_server((host, port)).serve_forever()
+
+
 # ── Main ────────────────────────────────────────────────────────
 
 if __name__ == "__main__":
-    start_scheduler()
-    app.run(host="0.0.0.0", port=5000)
+    serve()
@@ -9,74 +9,74 @@ document.querySelectorAll(".local-time").forEach((el) => {
   } catch (e) {}
 });
 
-const _openStreams = [];
-window.addEventListener("beforeunload", () =>
-  _openStreams.forEach((es) => es.close()),
-);
+const _hideTimers = {};
 
-function startWatchProgress(watchId, jobId) {
-  if (!jobId) {
+function setWatchRunning(watchId, running) {
+  clearTimeout(_hideTimers[watchId]);
+  if (running) {
     document
-      .querySelectorAll('.run-btn[data-watch-id="' + watchId + '"]')
-      .forEach((btn) => (btn.disabled = false));
-    return;
+      .querySelectorAll('.watch-progress[data-watch-id="' + watchId + '"]')
+      .forEach((el) => (el.style.display = "block"));
   }
-  document
-    .querySelectorAll('.watch-progress[data-watch-id="' + watchId + '"]')
-    .forEach((el) => (el.style.display = "block"));
   document
     .querySelectorAll('.run-btn[data-watch-id="' + watchId + '"]')
-    .forEach((btn) => (btn.disabled = true));
+    .forEach((btn) => (btn.disabled = running));
   document
     .querySelectorAll('a.btn-blue[href*="/' + watchId + '/edit"]')
-    .forEach((btn) => (btn.style.pointerEvents = "none"));
+    .forEach((btn) => (btn.style.pointerEvents = running ? "none" : ""));
+}
+
+function updateWatchProgress(d) {
+  const watchId = d.watch_id;
+  const finished =
+    d.status === "done" || d.status === "error" || d.status === "cancelled";
+  if (!finished) setWatchRunning(watchId, true);
+
+  const pct = Math.round(d.progress) + "%";
+  document
+    .querySelectorAll(
+      '.watch-progress[data-watch-id="' + watchId + '"] .watch-prog-bar',
+    )
+    .forEach((bar) => {
+      bar.style.width = pct;
+      bar.textContent = pct;
+      bar.style.background = d.status === "error" ? "#e53935" : "#4CAF50";
+    });
+  document
+    .querySelectorAll(
+      '.watch-progress[data-watch-id="' + watchId + '"] .watch-prog-title',
+    )
+    .forEach((el) => {
+      const item = d.items > 1 ? "video " + d.item + " of " + d.items : "";
+      el.textContent = [item, d.title].filter(Boolean).join(" · ");
+    });
+
+  if (finished) {
+    setWatchRunning(watchId, false);
+    _hideTimers[watchId] = setTimeout(() => {
+      document
+        .querySelectorAll('.watch-progress[data-watch-id="' + watchId + '"]')
+        .forEach((el) => (el.style.display = "none"));
+    }, 2000);
+  }
+}
 
-  const es = new EventSource("/progress/" + jobId + "/stream");
-  _openStreams.push(es);
+// One multiplexed stream carries progress for every watch on the page.
+const _watchIds = [
+  ...new Set(
+    [...document.querySelectorAll(".run-btn")].map((b) => b.dataset.watchId),
+  ),
+];
+if (_watchIds.length) {
+  const es = new EventSource(
+    "/events?" +
+      _watchIds.map((id) => "watch=" + encodeURIComponent(id)).join("&"),
+  );
   es.onmessage = function (e) {
     const d = JSON.parse(e.data);
-    const pct = Math.round(d.progress) + "%";
-    document
-      .querySelectorAll(
-        '.watch-progress[data-watch-id="' + watchId + '"] .watch-prog-bar',
-      )
-      .forEach((bar) => {
-        bar.style.width = pct;
-        bar.textContent = pct;
-        if (d.status === "error") bar.style.background = "#e53935";
-      });
-    document
-      .querySelectorAll(
-        '.watch-progress[data-watch-id="' + watchId + '"] .watch-prog-title',
-      )
-      .forEach((el) => {
-        if (d.title) el.textContent = d.title;
-      });
-    if (d.status === "done" || d.status === "error") {
-      es.close();
-      const doneIdx = _openStreams.indexOf(es);
-      if (doneIdx !== -1) _openStreams.splice(doneIdx, 1);
-      document
-        .querySelectorAll('.run-btn[data-watch-id="' + watchId + '"]')
-        .forEach((btn) => (btn.disabled = false));
-      document
-        .querySelectorAll('a.btn-blue[href*="/' + watchId + '/edit"]')
-        .forEach((btn) => (btn.style.pointerEvents = ""));
-      setTimeout(() => {
-        document
-          .querySelectorAll('.watch-progress[data-watch-id="' + watchId + '"]')
-          .forEach((el) => (el.style.display = "none"));
-      }, 2000);
-    }
-  };
-  es.onerror = function () {
-    es.close();
-    const errIdx = _openStreams.indexOf(es);
-    if (errIdx !== -1) _openStreams.splice(errIdx, 1);
-    document
-      .querySelectorAll('.run-btn[data-watch-id="' + watchId + '"]')
-      .forEach((btn) => (btn.disabled = false));
+    if (d.watch_id) updateWatchProgress(d);
   };
+  window.addEventListener("beforeunload", () => es.close());
 }
 
 document.addEventListener("click", function (e) {
@@ -86,18 +86,10 @@ document.addEventListener("click", function (e) {
   btn.disabled = true;
   fetch("/watches/" + watchId + "/run", { method: "POST" })
     .then((r) => r.json())
-    .then((data) => startWatchProgress(watchId, data.job_id))
+    .then((data) => {
+      if (!data.job_id) btn.disabled = false;
+    })
     .catch(() => {
       btn.disabled = false;
     });
 });
-
-document.addEventListener("DOMContentLoaded", function () {
-  fetch("/watches/running")
-    .then((r) => r.json())
-    .then((running) => {
-      Object.entries(running).forEach(([watchId, jobId]) =>
-        startWatchProgress(watchId, jobId),
-      );
-    });
-});
@@ -1,8 +1,34 @@
 import json
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
 import pytest
 import app as app_module
 
 
+@pytest.fixture(autouse=True)
+def tmp_db(tmp_path):
+    path = str(tmp_path / "downloader.db")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(app_module, "DB_FILE", path)
+        mp.setattr(app_module, "DOWNLOAD_ARCHIVE_FILE", str(tmp_path / "download-archive.txt"))
+        mp.setattr(app_module, "ARCHIVES_DIR", str(tmp_path / "archives"))
+        mp.setattr(app_module, "METADATA_CACHE_DIR", str(tmp_path / "metadata-cache"))
+        mp.setattr(app_module, "STAGING_DIR", str(tmp_path / "staging"))
+        mp.setattr(app_module, "JOB_LOG_DIR", str(tmp_path / "job-logs"))
+        mp.setattr(app_module, "STAGING_MIN_FREE_GB", 0)
+        # Tests must not reach YouTube; feed tests opt back in via feed_server.
+        mp.setattr(app_module, "WATCH_FEED_PRECHECK", False)
+        yield path
+        for job_id in list(app_module._job_logs):
+            app_module._close_job_log(job_id)
+        # Mocked watch runs never reach the finish path that releases them.
+        with app_module._watch_jobs_lock:
+            app_module._watch_jobs.clear()
+
+
 @pytest.fixture
 def client(tmp_path):
     watches_file = str(tmp_path / "watches.json")
@@ -11,6 +37,10 @@ def client(tmp_path):
     ):
         mp.setattr(app_module, "WATCHES_FILE", watches_file)
         mp.setattr(app_module, "ARCHIVES_DIR", str(tmp_path / "archives"))
+        mp.setattr(app_module, "QUEUE_FILE", str(tmp_path / "queue.json"))
+        mp.setattr(app_module, "_queue", [])
+        mp.setattr(app_module, "_queue_items", {})
+        mp.setattr(app_module, "_queue_running", {})
         app_module.app.config["TESTING"] = True
         with app_module.app.test_client() as c:
             yield c
@@ -37,4 +67,118 @@ def sample_watch():
         "interval_hours": 4,
         "enabled": True,
         "last_run": None,
+        "profile": "default",
     }
+
+
+@pytest.fixture
+def tmp_queue(tmp_path):
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(app_module, "QUEUE_FILE", str(tmp_path / "queue.json"))
+        mp.setattr(app_module, "_queue", [])
+        mp.setattr(app_module, "_queue_items", {})
+        mp.setattr(app_module, "_queue_running", {})
+        yield str(tmp_path / "queue.json")
+
+
+def feed_xml(video_ids):
+    """Render a minimal YouTube upload feed listing *video_ids*, newest first."""
+    entries = "".join(
+        f"<entry><id>yt:video:{v}</id><yt:videoId>{v}</yt:videoId><title>{v}</title></entry>"
+        for v in video_ids
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" '
+        f'xmlns="http://www.w3.org/2005/Atom">{entries}</feed>'
+    )
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        body = self.server.pages.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def feed_server():
+    """A local stand-in for YouTube's channel pages and upload feeds.
+
+    Serve a path by setting server.pages[path] = body; server.requests
+    records every path requested. Feeds are served under /feeds/videos.xml.
+    """
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    httpd.pages = {}
+    httpd.requests = []
+    threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True).start()
+    url = f"http://127.0.0.1:{httpd.server_port}"
+    server = SimpleNamespace(url=url, pages=httpd.pages, requests=httpd.requests, feed_xml=feed_xml)
+    server.add_feed = lambda channel_id, video_ids: httpd.pages.__setitem__(
+        f"/feeds/videos.xml?channel_id={channel_id}", feed_xml(video_ids)
+    )
+    try:
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr(app_module, "YOUTUBE_FEED_URL", f"{url}/feeds/videos.xml")
+            mp.setattr(app_module, "WATCH_FEED_PRECHECK", True)
+            yield server
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+class _InlineExecutor:
+    """Runs submitted work on the spot, so a pipeline finishes before its caller returns."""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+@pytest.fixture
+def inline_postprocess():
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(app_module, "_postprocess_executor", _InlineExecutor())
+        yield
+
+
+@pytest.fixture
+def gevent_server():
+    """The app served by gevent's WSGI server from its own thread; yields the port."""
+    gevent = pytest.importorskip("gevent")
+    ready, stop = threading.Event(), threading.Event()
+    state = {}
+
+    def run():
+        server = app_module._gevent_server(("127.0.0.1", 0))
+        server.start()
+        state["port"] = server.server_port
+        ready.set()
+        while not stop.is_set():
+            gevent.sleep(0.02)
+        server.stop(timeout=1)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    assert ready.wait(5)
+    try:
+        yield state["port"]
+    finally:
+        stop.set()
+        thread.join(5)
+        app_module._green["thread"] = None
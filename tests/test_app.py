@@ -1,26 +1,127 @@
 import json
-from datetime import datetime, timezone
+import os
+import re
+import selectors
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
 from unittest.mock import patch, MagicMock
 
 import pytest
+import requests
 import app as app_module
 
 
 # ── _parse_progress ──────────────────────────────────────────
 
-class TestParseProgress:
-    def test_percentage_line(self):
-        assert app_module._parse_progress("[download]  42.3% of 100MiB") == 42.3
+_TEMPLATE_FIELD_RE = re.compile(r"%\((?:progress|info)\.(\w+)[^)|]*\|null\)j")
+
+
+def progress_line(**fields):
+    """Render _PROGRESS_TEMPLATE as yt-dlp does: set fields as JSON, the rest as bare null."""
+    def render(match):
+        key = "formats" if match.group(1) == "requested_formats" else match.group(1)
+        return json.dumps(fields[key]) if key in fields else "null"
+
+    return _TEMPLATE_FIELD_RE.sub(render, app_module._PROGRESS_TEMPLATE.split(":", 1)[1])
+
 
-    def test_100_percent(self):
-        assert app_module._parse_progress("[download] 100% of 500MiB") == 100.0
+class TestParseProgress:
+    def test_typed_fields(self):
+        fields = app_module._parse_progress(progress_line(
+            status="downloading", downloaded_bytes=1024, total_bytes_estimate=4096.7,
+            speed=512, eta=6, id="abcdefghijk", formats=["137", "140"],
+        ))
+        assert fields["status"] == "downloading"
+        assert fields["downloaded_bytes"] == 1024
+        assert fields["total_bytes_estimate"] == 4096
+        assert fields["speed"] == 512.0
+        assert fields["eta"] == 6
+        assert fields["id"] == "abcdefghijk"
+        assert fields["formats"] == ["137", "140"]
+
+    def test_unset_fields_are_none(self):
+        fields = app_module._parse_progress(progress_line(status="downloading"))
+        assert fields["total_bytes"] is None
+        assert fields["playlist_index"] is None
+        assert fields["formats"] is None
+
+    def test_every_template_field_defaults_to_null(self):
+        fields = re.findall(r"%\([^)]*\)j", app_module._PROGRESS_TEMPLATE)
+        assert len(fields) == len(app_module._PROGRESS_TYPES)
+        assert all(field.endswith("|null)j") for field in fields)
 
     def test_no_match(self):
+        assert app_module._parse_progress("[download]  42.3% of 100MiB") is None
         assert app_module._parse_progress("[info] Downloading video #1") is None
-
-    def test_empty_string(self):
         assert app_module._parse_progress("") is None
 
+    def test_garbled_json(self):
+        assert app_module._parse_progress(app_module._PROGRESS_PREFIX + "{oops") is None
+
+
+class TestApplyProgress:
+    def _apply(self, job_id, written=None, **fields):
+        raw = {k: fields.get(k) for k in app_module._PROGRESS_TYPES}
+        app_module._apply_progress(job_id, app_module._progress_fields(raw),
+                                   set() if written is None else written)
+        return app_module._jobs[job_id]
+
+    def test_overall_progress_across_items(self):
+        job_id = "job-items"
+        app_module._jobs[job_id] = app_module._new_job()
+        app_module._jobs[job_id]["item_count"] = 4
+        job = self._apply(job_id, id="video000001", downloaded_bytes=50, total_bytes=100)
+        assert (job["item"], job["items"], job["progress"]) == (1, 4, 12.5)
+        job = self._apply(job_id, id="video000002", downloaded_bytes=50, total_bytes=100)
+        assert (job["item"], job["progress"]) == (2, 37.5)
+        assert job["video_id"] == "video000002"
+
+    def test_merged_formats_share_the_item(self):
+        job_id = "job-formats"
+        app_module._jobs[job_id] = app_module._new_job()
+        written = set()
+        formats = ["137", "140"]
+        job = self._apply(job_id, written, status="finished", total_bytes=300, id="v",
+                          format_id="137", formats=formats, filename="/yt/Up/v.f137.mp4")
+        assert job["progress"] == 50
+        job = self._apply(job_id, written, downloaded_bytes=50, total_bytes=100, id="v",
+                          format_id="140", formats=formats)
+        assert job["progress"] == 75
+        assert job["bytes"] == 300
+        assert written == {"/yt/Up"}
+
+    def test_playlist_position_from_yt_dlp(self):
+        job_id = "job-playlist"
+        app_module._jobs[job_id] = app_module._new_job()
+        app_module._jobs[job_id]["item_count"] = 1
+        job = self._apply(job_id, id="x", playlist_index=3, n_entries=10, downloaded_bytes=0,
+                          total_bytes=100, title="Third")
+        assert (job["item"], job["items"], job["progress"]) == (3, 10, 20)
+        assert job["title"] == "Third"
+
+    def test_progress_lines_stay_out_of_the_log(self):
+        job_id = "job-quiet"
+        app_module._jobs[job_id] = app_module._new_job()
+        line = progress_line(status="downloading", downloaded_bytes=10, total_bytes=40,
+                             speed=2.5, eta=12, id="v")
+        app_module._handle_output_line(job_id, line, set(), {})
+        job = app_module._jobs[job_id]
+        assert list(job["log"]) == []
+        assert (job["progress"], job["speed"], job["eta"], job["phase"]) == (25, 2.5, 12, "download")
+
+    def test_cli_gets_progress_template(self):
+        job_id = "job-template"
+        app_module._jobs[job_id] = app_module._new_job()
+        proc = MagicMock(stdout=iter([]), returncode=0)
+        with patch("app.subprocess.Popen", return_value=proc) as popen:
+            app_module._execute_ytdlp(job_id, ["https://youtu.be/abcdefghijk"])
+        argv = popen.call_args[0][0]
+        assert argv[argv.index("--progress-template") + 1] == app_module._PROGRESS_TEMPLATE
+        assert app_module._PROGRESS_TEMPLATE.startswith("download:[progress] {")
+
 
 # ── _watch_from_form ─────────────────────────────────────────
 
@@ -111,13 +212,58 @@ class TestLoadWatches:
         assert result[0]["channel_url"] == "https://youtube.com/playlist?list=OLD"
 
 
-class TestSaveWatches:
-    def test_writes_valid_json(self, tmp_watches_file, sample_watch):
+def _form_fields(watch):
+    """Drop run bookkeeping columns so stored watches compare against fixtures."""
+    return {k: v for k, v in watch.items() if k not in app_module._WATCH_STATE_COLUMNS}
+
+
+class TestWatchStore:
+    def test_save_and_load_round_trip(self, tmp_watches_file, sample_watch):
         app_module.save_watches([sample_watch])
-        with open(tmp_watches_file) as f:
-            data = json.load(f)
-        assert len(data) == 1
-        assert data[0]["id"] == "test-id-123"
+        assert [_form_fields(w) for w in app_module.load_watches()] == [sample_watch]
+
+    def test_migration_renames_json_file(self, tmp_watches_file, sample_watch):
+        with open(tmp_watches_file, "w") as f:
+            json.dump([sample_watch], f)
+        app_module.load_watches()
+        assert not app_module.os.path.exists(tmp_watches_file)
+        assert app_module.os.path.exists(tmp_watches_file + ".migrated")
+        assert [_form_fields(w) for w in app_module.load_watches()] == [sample_watch]
+
+    def test_corrupt_json_is_left_in_place(self, tmp_watches_file):
+        with open(tmp_watches_file, "w") as f:
+            f.write("{bad json!!")
+        app_module.load_watches()
+        assert app_module.os.path.exists(tmp_watches_file)
+
+    def test_get_watch(self, tmp_watches_file, sample_watch):
+        app_module.add_watch(sample_watch)
+        assert _form_fields(app_module.get_watch("test-id-123")) == sample_watch
+        assert app_module.get_watch("nonexistent") is None
+
+    def test_preserves_insertion_order(self, tmp_watches_file, sample_watch):
+        second = dict(sample_watch, id="second", name="Second")
+        app_module.add_watch(second)
+        app_module.add_watch(sample_watch)
+        assert [w["id"] for w in app_module.load_watches()] == ["second", "test-id-123"]
+
+    def test_update_watch(self, tmp_watches_file, sample_watch):
+        app_module.add_watch(sample_watch)
+        assert app_module.update_watch(dict(sample_watch, name="Renamed", enabled=False))
+        watch = app_module.get_watch("test-id-123")
+        assert watch["name"] == "Renamed"
+        assert watch["enabled"] is False
+        assert not app_module.update_watch(dict(sample_watch, id="gone"))
+
+    def test_set_last_run(self, tmp_watches_file, sample_watch):
+        app_module.add_watch(sample_watch)
+        app_module.set_last_run("test-id-123", "2026-01-01T00:00:00+00:00")
+        assert app_module.get_watch("test-id-123")["last_run"] == "2026-01-01T00:00:00+00:00"
+
+    def test_delete_watch(self, tmp_watches_file, sample_watch):
+        app_module.add_watch(sample_watch)
+        app_module.delete_watch("test-id-123")
+        assert app_module.load_watches() == []
 
 
 # ── Flask routes ─────────────────────────────────────────────
@@ -134,6 +280,379 @@ class TestDownloadRoute:
         assert "/progress/" in resp.headers["Location"]
 
 
+class TestDownloadQueue:
+    def test_enqueue_creates_queued_job(self, tmp_queue):
+        job_id = app_module.enqueue_download("https://youtube.com/watch?v=a")
+        assert app_module._jobs[job_id]["status"] == "queued"
+        assert app_module.queue_position(job_id) == 1
+
+    def test_fifo_within_priority(self, tmp_queue):
+        first = app_module.enqueue_download("https://youtube.com/watch?v=a")
+        second = app_module.enqueue_download("https://youtube.com/watch?v=b")
+        assert app_module.queue_position(first) == 1
+        assert app_module.queue_position(second) == 2
+
+    def test_higher_priority_jumps_queue(self, tmp_queue):
+        low = app_module.enqueue_download("https://youtube.com/watch?v=a")
+        high = app_module.enqueue_download("https://youtube.com/watch?v=b", priority=5)
+        assert app_module.queue_position(high) == 1
+        assert app_module.queue_position(low) == 2
+
+    def test_reprioritize(self, tmp_queue):
+        first = app_module.enqueue_download("https://youtube.com/watch?v=a")
+        second = app_module.enqueue_download("https://youtube.com/watch?v=b")
+        assert app_module.reprioritize_job(second, 10) is True
+        assert app_module.queue_position(second) == 1
+        assert app_module.queue_position(first) == 2
+
+    def test_cancel_queued(self, tmp_queue):
+        job_id = app_module.enqueue_download("https://youtube.com/watch?v=a")
+        assert app_module.cancel_job(job_id) is True
+        assert app_module._jobs[job_id]["status"] == "cancelled"
+        assert app_module.queue_position(job_id) is None
+
+    def test_cancel_running_terminates_process(self, tmp_queue):
+        job_id = app_module.enqueue_download("https://youtube.com/watch?v=a")
+        app_module._queue_items.clear()
+        app_module._queue.clear()
+        proc = MagicMock()
+        app_module._job_procs[job_id] = proc
+        try:
+            assert app_module.cancel_job(job_id) is True
+        finally:
+            app_module._job_procs.pop(job_id, None)
+        proc.terminate.assert_called_once()
+        assert app_module._jobs[job_id]["status"] == "cancelled"
+
+    def test_cancel_unknown_job(self, tmp_queue):
+        assert app_module.cancel_job("nope") is False
+
+    def test_cancel_finished_job(self, tmp_queue):
+        app_module._jobs["job-done"] = app_module._new_job(status="done")
+        assert app_module.cancel_job("job-done") is False
+
+    def test_cancel_between_processes_stops_the_next(self, tmp_queue):
+        job_id = "job-gap"
+        app_module._jobs[job_id] = app_module._new_job()
+        assert app_module.cancel_job(job_id) is True
+        proc = MagicMock(returncode=-15)
+        proc.stdout = iter([])
+        with patch("app.subprocess.Popen", return_value=proc):
+            app_module._execute_ytdlp(job_id, ["https://www.youtube.com/watch?v=x"])
+        proc.terminate.assert_called_once()
+        with patch("app.subprocess.Popen") as popen:
+            assert app_module._list_entries("u", job_ids=(job_id,)) is None
+        popen.assert_not_called()
+
+    def test_cancel_queued_watch_job(self, sample_watch):
+        executor = app_module.ThreadPoolExecutor(max_workers=1)
+        blocker = threading.Event()
+        executor.submit(blocker.wait, 5)
+        with patch.object(app_module, "_watch_executor", executor), \
+             patch("app.subprocess.Popen") as popen:
+            job_id, _ = app_module.start_watch_job(sample_watch)
+            assert app_module.cancel_job(job_id) is True
+            blocker.set()
+            executor.shutdown(wait=True)
+        popen.assert_not_called()
+        assert app_module._jobs[job_id]["status"] == "cancelled"
+        with app_module._watch_jobs_lock:
+            assert sample_watch["id"] not in app_module._watch_jobs
+
+    def test_queue_persisted_and_reloaded(self, tmp_queue):
+        job_id = app_module.enqueue_download("https://youtube.com/watch?v=a", priority=3)
+        with open(tmp_queue) as f:
+            assert json.load(f) == [
+                {"job_id": job_id, "url": "https://youtube.com/watch?v=a", "priority": 3}
+            ]
+        app_module._queue.clear()
+        app_module._queue_items.clear()
+        app_module._load_queue()
+        assert app_module.queue_position(job_id) == 1
+
+    def test_running_job_kept_in_queue_file_until_finished(self, tmp_queue):
+        first = app_module.enqueue_download("https://youtube.com/watch?v=a")
+        second = app_module.enqueue_download("https://youtube.com/watch?v=b")
+        persisted = []
+
+        def fake_run(job_id, url):
+            with open(tmp_queue) as f:
+                persisted.append([item["job_id"] for item in json.load(f)])
+            app_module._jobs[job_id]["status"] = "done"
+            app_module._finish_job(job_id)
+            raise SystemExit
+
+        with patch.object(app_module, "_run_download_job", side_effect=fake_run):
+            with pytest.raises(SystemExit):
+                app_module._download_worker()
+        assert persisted == [[first, second]]
+        with open(tmp_queue) as f:
+            assert [item["job_id"] for item in json.load(f)] == [second]
+
+    def test_failed_save_keeps_previous_queue_file(self, tmp_queue):
+        job_id = app_module.enqueue_download("https://youtube.com/watch?v=a")
+        with patch.object(app_module.json, "dump", side_effect=OSError("disk full")):
+            with pytest.raises(OSError):
+                app_module.enqueue_download("https://youtube.com/watch?v=b")
+        with open(tmp_queue) as f:
+            assert [item["job_id"] for item in json.load(f)] == [job_id]
+
+    def test_worker_runs_highest_priority_first(self, tmp_queue):
+        ran = []
+        low = app_module.enqueue_download("https://youtube.com/watch?v=a")
+        high = app_module.enqueue_download("https://youtube.com/watch?v=b", priority=1)
+
+        def fake_run(job_id, url):
+            ran.append(job_id)
+            if len(ran) == 2:
+                raise SystemExit
+
+        with patch.object(app_module, "_run_download_job", side_effect=fake_run):
+            with pytest.raises(SystemExit):
+                app_module._download_worker()
+        assert ran == [high, low]
+
+    def test_cancel_and_priority_routes(self, client):
+        job_id = app_module.enqueue_download("https://youtube.com/watch?v=a")
+        other = app_module.enqueue_download("https://youtube.com/watch?v=b")
+        resp = client.post(f"/jobs/{other}/priority", data={"priority": "2"})
+        assert resp.get_json() == {"position": 1}
+        resp = client.post(f"/jobs/{job_id}/cancel")
+        assert resp.get_json() == {"cancelled": True}
+
+    def test_download_rejects_bad_priority(self, client):
+        resp = client.post("/", data={"url": "https://youtube.com/watch?v=a", "priority": "high"})
+        assert resp.status_code == 400
+        assert app_module._queue_items == {}
+
+
+class TestProgressStream:
+    def test_wait_returns_after_notify(self):
+        job_id = "job-notify"
+        version = app_module.wait_for_job_change(job_id, None, 0)
+        assert version is not None
+        assert app_module.wait_for_job_change(job_id, version, 0.01) is None
+        app_module._notify_job(job_id)
+        assert app_module.wait_for_job_change(job_id, version, 0.01) == version + 1
+
+    @staticmethod
+    def _parse(chunk):
+        lines = chunk.decode().strip().split("\n")
+        event_id = lines[0][len("id: "):]
+        return event_id, json.loads(lines[1][len("data: "):])
+
+    def test_finished_job_sends_single_event(self, client):
+        app_module._jobs["job-done"] = app_module._new_job(status="done")
+        resp = client.get("/progress/job-done/stream")
+        events = resp.get_data(as_text=True).split("\n\n")
+        assert events[0].startswith("id: ")
+        assert json.loads(events[0].split("data: ", 1)[1])["status"] == "done"
+        assert events[1:] == [""]
+
+    def test_idle_stream_sends_heartbeat(self, client):
+        app_module._jobs["job-idle"] = app_module._new_job()
+        with patch.object(app_module, "SSE_HEARTBEAT", 0.01):
+            resp = client.get("/progress/job-idle/stream", buffered=False)
+            chunks = iter(resp.response)
+            assert next(chunks).startswith(b"id: ")
+            assert next(chunks) == b": heartbeat\n\n"
+            app_module._jobs["job-idle"]["status"] = "done"
+            app_module._notify_job("job-idle")
+            assert b'"status": "done"' in next(chunks)
+        resp.close()
+
+    def test_events_carry_only_deltas(self, client):
+        job_id = "job-delta"
+        app_module._jobs[job_id] = app_module._new_job()
+        app_module._append_log(job_id, "line 1")
+        resp = client.get(f"/progress/{job_id}/stream", buffered=False)
+        chunks = iter(resp.response)
+        _, first = self._parse(next(chunks))
+        assert first == {"status": "running", "progress": 0, "title": "",
+                         "position": None, "speed": None, "eta": None,
+                         "downloaded_bytes": None, "total_bytes": None,
+                         "item": None, "items": None, "phase": None, "phase_seconds": {}, "log": ["line 1"]}
+
+        app_module._append_log(job_id, "line 2")
+        app_module._jobs[job_id]["progress"] = 40
+        app_module._notify_job(job_id)
+        event_id, second = self._parse(next(chunks))
+        assert second == {"progress": 40, "log": ["line 2"]}
+        assert event_id.endswith(".2")
+        resp.close()
+
+    def test_resume_replays_missed_lines(self, client):
+        job_id = "job-resume"
+        app_module._jobs[job_id] = app_module._new_job(status="done")
+        for i in range(5):
+            app_module._append_log(job_id, f"line {i}")
+        resp = client.get(f"/progress/{job_id}/stream", headers={"Last-Event-ID": "3.3"})
+        _, event = self._parse(resp.get_data())
+        assert event["log"] == ["line 3", "line 4"]
+        assert event["status"] == "done"
+
+    def test_log_since_skips_evicted_lines(self):
+        job_id = "job-evicted"
+        app_module._jobs[job_id] = app_module._new_job()
+        for i in range(60):
+            app_module._append_log(job_id, f"line {i}")
+        job = app_module._jobs[job_id]
+        lines, total = app_module._log_since(job_id, job, 0)
+        assert total == 60
+        assert lines[0] == "line 10"
+        assert len(lines) == 50
+
+    def test_log_since_after_job_eviction(self):
+        job_id = "job-gone"
+        job = app_module._jobs[job_id] = app_module._new_job()
+        app_module._append_log(job_id, "last line")
+        app_module._jobs.pop(job_id)
+        app_module._job_signals.pop(job_id)
+        assert app_module._log_since(job_id, job, 0) == (["last line"], 1)
+        assert job_id not in app_module._job_signals
+
+    def test_parse_event_id(self):
+        assert app_module._parse_event_id("12.34") == (12, 34)
+        assert app_module._parse_event_id("bogus") is None
+        assert app_module._parse_event_id(None) is None
+
+
+class TestEventsStream:
+    @pytest.fixture(autouse=True)
+    def _isolated_jobs(self):
+        with patch.object(app_module, "_jobs", {}), \
+             patch.object(app_module, "SSE_HEARTBEAT", 0.01):
+            yield
+
+    def _events(self, chunks, count):
+        events = []
+        for chunk in chunks:
+            if chunk.startswith(b"data: "):
+                events.append(json.loads(chunk[len(b"data: "):]))
+                if len(events) == count:
+                    return events
+        return events
+
+    def test_multiplexes_jobs_and_skips_finished(self, client):
+        app_module._jobs["old"] = app_module._new_job(status="done", watch_id="w-1")
+        app_module._jobs["a"] = app_module._new_job(watch_id="w-1")
+        app_module._jobs["b"] = app_module._new_job()
+        app_module._notify_job("a")
+        resp = client.get("/events", buffered=False)
+        events = self._events(iter(resp.response), 2)
+        resp.close()
+        assert {e["job_id"] for e in events} == {"a", "b"}
+        assert {e["watch_id"] for e in events} == {"w-1", None}
+
+    def test_filters_by_watch(self, client):
+        app_module._jobs["a"] = app_module._new_job(watch_id="w-1")
+        app_module._jobs["b"] = app_module._new_job(watch_id="w-2")
+        app_module._notify_job("a")
+        resp = client.get("/events?watch=w-2", buffered=False)
+        chunks = iter(resp.response)
+        events = self._events(chunks, 1)
+        assert [e["job_id"] for e in events] == ["b"]
+        app_module._jobs["b"]["status"] = "done"
+        app_module._notify_job("b")
+        events = self._events(chunks, 1)
+        resp.close()
+        assert events[0]["status"] == "done"
+
+    def test_forgets_evicted_jobs(self, client):
+        app_module._jobs["a"] = app_module._new_job()
+        app_module._notify_job("a")
+        resp = client.get("/events", buffered=False)
+        chunks = iter(resp.response)
+        assert self._events(chunks, 1)[0]["status"] == "running"
+        app_module._jobs["a"]["status"] = "done"
+        app_module._notify_job("a")
+        assert self._events(chunks, 1)[0]["status"] == "done"
+        del app_module._jobs["a"]
+        app_module._jobs["b"] = app_module._new_job()
+        app_module._notify_job("b")
+        assert self._events(chunks, 1)[0]["job_id"] == "b"
+        app_module._jobs["a"] = app_module._new_job(status="queued")
+        app_module._notify_job("a")
+        events = self._events(chunks, 1)
+        resp.close()
+        assert (events[0]["job_id"], events[0]["status"]) == ("a", "queued")
+
+
+class TestJobHistory:
+    @pytest.fixture(autouse=True)
+    def _isolated_jobs(self):
+        with patch.object(app_module, "_jobs", {}), \
+             patch.object(app_module, "_job_signals", {}):
+            yield
+
+    def _finished_job(self, job_id, status="done", **fields):
+        job = app_module._new_job(status=status, url=f"https://youtube.com/watch?v={job_id}")
+        job.update(fields)
+        app_module._jobs[job_id] = job
+        app_module._append_log(job_id, f"log for {job_id}")
+        app_module._finish_job(job_id)
+        return job
+
+    def test_finish_records_history(self):
+        self._finished_job("a", started=app_module.time.time() - 5, bytes=1234,
+                           exit_code=0, title="A Video")
+        past = app_module.get_job_history("a")
+        assert past["status"] == "done"
+        assert past["title"] == "A Video"
+        assert past["bytes"] == 1234
+        assert past["exit_code"] == 0
+        assert past["duration"] == pytest.approx(5, abs=1)
+        assert past["log_tail"] == "log for a"
+
+    def test_evicts_after_ttl(self):
+        job = self._finished_job("old")
+        app_module._jobs["active"] = app_module._new_job()
+        app_module._evict_jobs(now=job["finished"] + app_module.JOB_TTL + 1)
+        assert "old" not in app_module._jobs
+        assert "active" in app_module._jobs
+        assert app_module.get_job_history("old") is not None
+
+    def test_evicts_oldest_beyond_cap(self):
+        with patch.object(app_module, "MAX_JOBS", 2):
+            for job_id in ("a", "b", "c"):
+                self._finished_job(job_id)
+        assert set(app_module._jobs) == {"b", "c"}
+
+    def test_jobs_api_paginates(self, client):
+        for i in range(3):
+            self._finished_job(f"job-{i}")
+        data = client.get("/jobs?page=1&per_page=2").get_json()
+        assert data["total"] == 3
+        assert len(data["jobs"]) == 2
+        data = client.get("/jobs?page=2&per_page=2").get_json()
+        assert len(data["jobs"]) == 1
+
+    def test_jobs_api_filters(self, client):
+        self._finished_job("ok")
+        self._finished_job("bad", status="error")
+        data = client.get("/jobs?status=error").get_json()
+        assert [j["job_id"] for j in data["jobs"]] == ["bad"]
+
+    def test_jobs_api_rejects_bad_page(self, client):
+        assert client.get("/jobs?page=x").status_code == 400
+
+    def test_history_page(self, client):
+        self._finished_job("shown", title="Shown Video")
+        resp = client.get("/history")
+        assert resp.status_code == 200
+        assert b"Shown Video" in resp.data
+
+    def test_evicted_job_streams_from_history(self, client):
+        self._finished_job("gone", title="Gone Video")
+        del app_module._jobs["gone"]
+        assert client.get("/progress/gone").status_code == 200
+        body = client.get("/progress/gone/stream").get_data(as_text=True)
+        event = json.loads(body[len("data: "):])
+        assert event["status"] == "done"
+        assert event["title"] == "Gone Video"
+        assert event["log"] == ["log for gone"]
+
+
 class TestWatchesRoutes:
     def test_get_watches(self, client):
         resp = client.get("/watches")
@@ -161,6 +680,29 @@ class TestWatchesRoutes:
         assert resp.status_code == 302
         assert app_module.load_watches() == []
 
+    def test_edit_watch_keeps_last_run(self, client, sample_watch):
+        sample_watch["last_run"] = "2026-01-01T00:00:00+00:00"
+        app_module.save_watches([sample_watch])
+        resp = client.post(f"/watches/{sample_watch['id']}/edit", data={
+            "name": "Edited",
+            "channel_url": "https://www.youtube.com/@TestChannel",
+            "start_date": "2025-01-01",
+            "end_date": "2025-12-31",
+            "interval_hours": "6",
+        })
+        assert resp.status_code == 302
+        watch = app_module.get_watch(sample_watch["id"])
+        assert watch["name"] == "Edited"
+        assert watch["interval_hours"] == 6
+        assert watch["last_run"] == "2026-01-01T00:00:00+00:00"
+
+    def test_export_watches(self, client, sample_watch):
+        app_module.save_watches([sample_watch])
+        resp = client.get("/watches/export")
+        assert resp.status_code == 200
+        assert "attachment" in resp.headers["Content-Disposition"]
+        assert [_form_fields(w) for w in json.loads(resp.data)] == [sample_watch]
+
     def test_run_watch_returns_json_job_id(self, client, sample_watch):
         app_module.save_watches([sample_watch])
         with patch.object(app_module, "_run_watch"):
@@ -182,7 +724,7 @@ class TestWatchesRoutes:
         app_module.save_watches([sample_watch])
         event = threading.Event()
 
-        def slow_run_watch(watch, job_id=None):
+        def slow_run_watch(watch, job_id):
             event.wait()  # block until test checks state
 
         with patch.object(app_module, "_run_watch", side_effect=slow_run_watch):
@@ -199,7 +741,7 @@ class TestWatchesRoutes:
         import threading
         event = threading.Event()
 
-        def slow_run_watch(watch, job_id=None):
+        def slow_run_watch(watch, job_id):
             event.wait()
 
         with patch.object(app_module, "_run_watch", side_effect=slow_run_watch):
@@ -219,7 +761,10 @@ class TestWatchesRoutes:
 
 
 class TestRunWatchWithJobId:
-    """Tests for _run_watch(watch, job_id=...) Popen path."""
+    """Tests for _run_watch(watch, job_id)."""
+
+    LISTED = [{"id": "vid00000001", "title": "Some Video",
+               "url": "https://www.youtube.com/watch?v=vid00000001"}]
 
     @pytest.fixture(autouse=True)
     def _clean_jobs_state(self):
@@ -230,7 +775,8 @@ class TestRunWatchWithJobId:
             app_module._jobs.clear()
             with app_module._watch_jobs_lock:
                 app_module._watch_jobs.clear()
-            yield
+            with patch.object(app_module, "_list_entries", return_value=self.LISTED):
+                yield
         finally:
             app_module._jobs.clear()
             app_module._jobs.update(old_jobs)
@@ -265,19 +811,24 @@ class TestRunWatchWithJobId:
             app_module._watch_jobs[watch["id"]] = job_id
 
         mock_proc = MagicMock()
-        mock_proc.stdout = iter(["[download]  50.0% of 100MiB\n", "[info] title: Some Video\n"])
+        mock_proc.stdout = iter([
+            "[download]  50.0% of 100MiB\n",
+            "[info] title: Some Video\n",
+            "[download] Destination: /mnt/ceph-videos/YouTube/Up/Test Watch/Some Video.f137.mp4\n",
+            '[Merger] Merging formats into "/mnt/ceph-videos/YouTube/Up/Test Watch/Some Video.mp4"\n',
+        ])
         mock_proc.returncode = 0
         mock_proc.wait.return_value = None
 
         with patch("app.subprocess.Popen", return_value=mock_proc), \
-             patch.object(app_module, "trigger_jellyfin_scan") as mock_scan, \
+             patch.object(app_module, "request_jellyfin_scan") as mock_scan, \
              patch.object(app_module, "ARCHIVES_DIR", str(tmp_path)):
             app_module._run_watch(watch, job_id=job_id)
 
         job = app_module._jobs[job_id]
         assert job["status"] == "done"
         assert job["progress"] == 100
-        mock_scan.assert_called_once()
+        mock_scan.assert_called_once_with({"/mnt/ceph-videos/YouTube/Up/Test Watch"})
         # Cleaned up from _watch_jobs
         with app_module._watch_jobs_lock:
             assert watch["id"] not in app_module._watch_jobs
@@ -296,7 +847,7 @@ class TestRunWatchWithJobId:
         mock_proc.wait.return_value = None
 
         with patch("app.subprocess.Popen", return_value=mock_proc), \
-             patch.object(app_module, "trigger_jellyfin_scan") as mock_scan, \
+             patch.object(app_module, "request_jellyfin_scan") as mock_scan, \
              patch.object(app_module, "ARCHIVES_DIR", str(tmp_path)):
             app_module._run_watch(watch, job_id=job_id)
 
@@ -324,20 +875,1022 @@ class TestRunWatchWithJobId:
         with app_module._watch_jobs_lock:
             assert watch["id"] not in app_module._watch_jobs
 
-    def test_no_job_id_uses_run_ytdlp(self, tmp_path):
-        """Scheduler path (job_id=None) should call run_ytdlp, not Popen."""
-        watch = self._make_watch()
-        watch["id"] = "w-4"
 
-        with patch.object(app_module, "run_ytdlp", return_value=True) as mock_run, \
-             patch.object(app_module, "trigger_jellyfin_scan") as mock_scan, \
+class TestStartWatchJob:
+    @pytest.fixture(autouse=True)
+    def _clean_watch_jobs(self):
+        with app_module._watch_jobs_lock:
+            old_watch_jobs = dict(app_module._watch_jobs)
+            app_module._watch_jobs.clear()
+        yield
+        with app_module._watch_jobs_lock:
+            app_module._watch_jobs.clear()
+            app_module._watch_jobs.update(old_watch_jobs)
+
+    def test_second_start_returns_existing_job(self, sample_watch):
+        import threading
+        event = threading.Event()
+        with patch.object(app_module, "_run_watch", side_effect=lambda w, job_id: event.wait()):
+            first, started = app_module.start_watch_job(sample_watch)
+            second, started_again = app_module.start_watch_job(sample_watch)
+        event.set()
+        assert started is True
+        assert started_again is False
+        assert first == second
+
+    def test_released_after_run(self, sample_watch):
+        import time
+        with patch.object(app_module, "_list_entries", return_value=[]):
+            job_id, _ = app_module.start_watch_job(sample_watch)
+            for _ in range(200):
+                with app_module._watch_jobs_lock:
+                    if sample_watch["id"] not in app_module._watch_jobs:
+                        break
+                time.sleep(0.01)
+        assert app_module._jobs[job_id]["status"] == "done"
+        with app_module._watch_jobs_lock:
+            assert sample_watch["id"] not in app_module._watch_jobs
+
+    def test_release_ignores_stale_job(self, sample_watch):
+        with app_module._watch_jobs_lock:
+            app_module._watch_jobs[sample_watch["id"]] = "new-job"
+        app_module._release_watch(sample_watch["id"], "old-job")
+        with app_module._watch_jobs_lock:
+            assert app_module._watch_jobs[sample_watch["id"]] == "new-job"
+
+    def test_run_route_does_not_touch_last_run_when_already_running(self, client, sample_watch):
+        app_module.save_watches([sample_watch])
+        with app_module._watch_jobs_lock:
+            app_module._watch_jobs[sample_watch["id"]] = "in-flight"
+        resp = client.post(f"/watches/{sample_watch['id']}/run")
+        assert resp.get_json() == {"job_id": "in-flight"}
+        assert app_module.load_watches()[0]["last_run"] is None
+
+
+class TestApiBackend:
+    @pytest.fixture(autouse=True)
+    def _api_backend(self):
+        import queue
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        manager = MagicMock(Queue=queue.Queue, Event=threading.Event)
+        with ThreadPoolExecutor(max_workers=1) as pool, \
+             patch.object(app_module, "YTDLP_BACKEND", "api"), \
+             patch.object(app_module, "_api_pool", return_value=(pool, manager)):
+            yield
+
+    @pytest.fixture
+    def fake_yt_dlp(self):
+        """A stand-in yt_dlp module whose download() fires the configured hooks."""
+        import sys
+        import types
+
+        class DownloadCancelled(Exception):
+            pass
+
+        class YoutubeDL:
+            def __init__(self, opts):
+                self.opts = opts
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def download(self, urls):
+                self.opts["logger"].debug("[info] abc: Fake Video")
+                for done in (50, 100):
+                    self.opts["progress_hooks"][0]({
+                        "status": "finished" if done == 100 else "downloading",
+                        "downloaded_bytes": done, "total_bytes": 100, "speed": 10.0,
+                        "eta": 5, "filename": "/yt/Up/Fake Video.mp4",
+                        "info_dict": {"title": "Fake Video"},
+                    })
+                self.opts["postprocessor_hooks"][0]({
+                    "postprocessor": "Merger", "status": "started",
+                    "info_dict": {"filepath": "/yt/Up/Fake Video.mp4"},
+                })
+                return 0
+
+        yt_dlp = types.ModuleType("yt_dlp")
+        yt_dlp.YoutubeDL = YoutubeDL
+        yt_dlp.parse_options = lambda argv: MagicMock(
+            ydl_opts={"format": "best"}, urls=argv[-1:], options=MagicMock(load_info_filename=None)
+        )
+        utils = types.ModuleType("yt_dlp.utils")
+        utils.DownloadCancelled = DownloadCancelled
+        yt_dlp.utils = utils
+        with patch.dict(sys.modules, {"yt_dlp": yt_dlp, "yt_dlp.utils": utils}):
+            yield yt_dlp
+
+    def test_runs_in_pool_with_structured_progress(self, fake_yt_dlp):
+        job_id = "api-job"
+        app_module._jobs[job_id] = app_module._new_job()
+        returncode, written = app_module._execute_ytdlp(job_id, ["https://youtube.com/watch?v=abc"])
+        job = app_module._jobs[job_id]
+        assert returncode == 0
+        assert written == {"/yt/Up"}
+        assert job["title"] == "Fake Video"
+        assert job["bytes"] == 100
+        assert job["progress"] == 100
+        assert job["phase"] == "Merger"
+        assert "[info] abc: Fake Video" in job["log"]
+        assert job_id not in app_module._job_procs
+
+    def test_cancel_stops_download(self, fake_yt_dlp):
+        job_id = "api-cancel"
+        app_module._jobs[job_id] = app_module._new_job()
+
+        def download(self, urls):
+            app_module.cancel_job(job_id)
+            self.opts["progress_hooks"][0]({"status": "downloading"})
+            return 0
+
+        with patch.object(fake_yt_dlp.YoutubeDL, "download", download):
+            returncode, _ = app_module._execute_ytdlp(job_id, ["https://youtube.com/watch?v=abc"])
+        assert returncode == 1
+        assert app_module._jobs[job_id]["status"] == "cancelled"
+
+    def test_download_event_updates_speed_and_eta(self):
+        job_id = "api-event"
+        app_module._jobs[job_id] = app_module._new_job()
+        written = set()
+        app_module._apply_api_event(job_id, {
+            "type": "download", "status": "downloading", "downloaded_bytes": 25,
+            "total_bytes": None, "total_bytes_estimate": 200, "speed": 1.5, "eta": 9,
+        }, written)
+        job = app_module._jobs[job_id]
+        assert job["progress"] == 12.5
+        assert job["speed"] == 1.5
+        assert job["eta"] == 9
+        assert written == set()
+
+
+class TestIncrementalWatch:
+    NOW = datetime(2026, 2, 22, 12, 0, tzinfo=timezone.utc)
+
+    def test_first_run_is_full_sweep(self, sample_watch):
+        assert app_module._incremental_stop(sample_watch, self.NOW) is None
+
+    def test_full_sweep_when_due(self, sample_watch):
+        sample_watch["last_full_sweep"] = (self.NOW - timedelta(days=8)).isoformat()
+        assert app_module._incremental_stop(sample_watch, self.NOW) is None
+
+    def test_disabled(self, sample_watch):
+        sample_watch["last_full_sweep"] = self.NOW.isoformat()
+        with patch.object(app_module, "WATCH_INCREMENTAL", False):
+            assert app_module._incremental_stop(sample_watch, self.NOW) is None
+
+    def test_stops_at_high_water_mark(self, sample_watch):
+        sample_watch.update(last_full_sweep=self.NOW.isoformat(),
+                            hwm_date="20260220", hwm_video_id="abcdefghijk")
+        assert app_module._incremental_stop(sample_watch, self.NOW) == {
+            "since": "20260220", "video_id": "abcdefghijk", "watch_id": sample_watch["id"],
+        }
+
+    def test_stops_at_window_start_without_mark(self, sample_watch):
+        sample_watch["last_full_sweep"] = self.NOW.isoformat()
+        assert app_module._incremental_stop(sample_watch, self.NOW)["since"] == "20250101"
+
+    def test_stop_listing(self):
+        stop = {"since": "20260220", "video_id": "abcdefghijk", "watch_id": "w-1"}
+        app_module.record_videos([("Youtube", "archived001", "/v/a.mp4")], watch_id="w-1")
+        app_module.record_videos([("Youtube", "manual00001", "/v/m.mp4")])
+        app_module.record_videos([("Youtube", "otherwatch1", "/v/o.mp4")], watch_id="w-2")
+        assert app_module._stop_listing({"id": "archived001", "ie_key": "Youtube"}, stop)
+        assert not app_module._stop_listing({"id": "manual00001", "ie_key": "Youtube"}, stop)
+        assert not app_module._stop_listing({"id": "otherwatch1", "ie_key": "Youtube"}, stop)
+        assert app_module._stop_listing({"id": "abcdefghijk"}, stop)
+        assert app_module._stop_listing({"id": "x", "upload_date": "20260219"}, stop)
+        assert not app_module._stop_listing({"id": "x", "upload_date": "20260221"}, stop)
+        assert not app_module._stop_listing({"id": "x"}, stop)
+
+    def test_parse_video_id(self):
+        assert app_module._parse_video_id("[youtube] dQw4w9WgXcQ: Downloading webpage") == "dQw4w9WgXcQ"
+        assert app_module._parse_video_id("[youtube] Extracting URL: x") is None
+
+    def test_successful_run_records_mark(self, tmp_watches_file, sample_watch, tmp_path):
+        app_module.add_watch(sample_watch)
+        job_id = "job-hwm"
+        app_module._jobs[job_id] = app_module._new_job(watch_id=sample_watch["id"])
+        proc = MagicMock(returncode=0)
+        proc.stdout = iter([])
+        listed = [{"id": "NEWEST00001", "title": "test one"}, {"id": "OLDER000001", "title": "test two"}]
+        with patch("app.subprocess.Popen", return_value=proc), \
+             patch.object(app_module, "_list_entries", return_value=listed), \
+             patch.object(app_module, "ARCHIVES_DIR", str(tmp_path)):
+            app_module._run_watch(sample_watch, job_id=job_id)
+        assert app_module._jobs[job_id]["status"] == "done"
+        stored = app_module.get_watch(sample_watch["id"])
+        assert stored["hwm_video_id"] == "NEWEST00001"
+        assert stored["last_full_sweep"] is not None
+        assert stored["hwm_date"] is not None
+
+    def test_exit_code_101_is_an_error(self):
+        job = app_module._new_job()
+        app_module._finish_ytdlp_status(job, 101, set())
+        assert job["status"] == "error"
+
+    def test_editing_filters_resets_mark(self, client, sample_watch):
+        app_module.save_watches([sample_watch])
+        app_module.set_watch_state(sample_watch["id"], hwm_video_id="x", hwm_date="20260101",
+                                   last_full_sweep="2026-01-01T00:00:00+00:00")
+        client.post(f"/watches/{sample_watch['id']}/edit", data={
+            "name": "Test Watch",
+            "channel_url": sample_watch["channel_url"],
+            "title_filter": "different",
+            "start_date": sample_watch["start_date"],
+            "end_date": sample_watch["end_date"],
+            "interval_hours": "4",
+            "enabled": "on",
+        })
+        stored = app_module.get_watch(sample_watch["id"])
+        assert stored["hwm_video_id"] is None
+        assert stored["last_full_sweep"] is None
+
+
+class TestWatchListing:
+    ENTRIES = [
+        {"id": "new00000001", "title": "Test one", "upload_date": "20260220",
+         "url": "https://www.youtube.com/watch?v=new00000001"},
+        {"id": "new00000002", "title": "Unrelated", "url": "https://www.youtube.com/watch?v=new00000002"},
+        {"id": "arc00000001", "title": "Test archived", "url": "https://www.youtube.com/watch?v=arc00000001"},
+        {"id": "old00000001", "title": "Test old", "upload_date": "20240101",
+         "url": "https://www.youtube.com/watch?v=old00000001"},
+    ]
+
+    def _listing_proc(self, entries, returncode=0):
+        proc = MagicMock(returncode=returncode)
+        proc.stdout = iter(["[youtube:tab] Downloading page 1\n"]
+                           + [json.dumps(e) + "\n" for e in entries])
+        return proc
+
+    def test_list_entries_parses_json_lines(self):
+        with patch("app.subprocess.Popen", return_value=self._listing_proc(self.ENTRIES)) as popen:
+            entries = app_module._list_entries("https://www.youtube.com/@X/videos")
+        assert [e["id"] for e in entries] == [e["id"] for e in self.ENTRIES]
+        assert "--flat-playlist" in popen.call_args[0][0]
+
+    def test_list_entries_stops_early(self):
+        proc = self._listing_proc(self.ENTRIES)
+        with patch("app.subprocess.Popen", return_value=proc):
+            entries = app_module._list_entries("u", stop_at=lambda e: e["id"] == "arc00000001")
+        assert [e["id"] for e in entries] == ["new00000001", "new00000002"]
+        proc.terminate.assert_called_once()
+
+    def test_cancel_leaves_shared_listing(self):
+        for job_id in ("job-stay", "job-leave"):
+            app_module._jobs[job_id] = app_module._new_job(watch_id=job_id)
+        proc = self._listing_proc(self.ENTRIES)
+        lines = list(proc.stdout)
+
+        def stdout():
+            yield lines[0]
+            app_module.cancel_job("job-leave")
+            yield from lines[1:]
+
+        proc.stdout = stdout()
+        with patch("app.subprocess.Popen", return_value=proc):
+            entries = app_module._list_entries("u", job_ids=("job-stay", "job-leave"))
+        assert [e["id"] for e in entries] == [e["id"] for e in self.ENTRIES]
+        proc.terminate.assert_not_called()
+        assert app_module._jobs.pop("job-leave")["status"] == "cancelled"
+        assert app_module._jobs.pop("job-stay")["status"] == "running"
+
+    def test_cancelling_every_job_stops_listing(self):
+        app_module._jobs["job-only"] = app_module._new_job(watch_id="w")
+        proc = self._listing_proc(self.ENTRIES)
+        proc.stdout = iter([])
+        with patch("app.subprocess.Popen", return_value=proc):
+            proc.wait.side_effect = lambda: app_module.cancel_job("job-only")
+            app_module._list_entries("u", job_ids=("job-only",))
+        app_module._jobs.pop("job-only")
+        proc.terminate.assert_called_once()
+
+    def test_list_entries_failure(self):
+        with patch("app.subprocess.Popen", return_value=self._listing_proc([], returncode=1)):
+            assert app_module._list_entries("u") is None
+
+    def test_filter_entries_applies_filters_and_archive(self, sample_watch):
+        app_module.record_videos([("youtube", "arc00000001", "/v/a.mp4")])
+        sample_watch["title_filter"] = "test"
+        videos, counts = app_module._filter_entries(sample_watch, self.ENTRIES)
+        assert videos == ["https://www.youtube.com/watch?v=new00000001"]
+        assert counts == {"listed": 4, "filtered": 3}
+
+    def test_run_downloads_only_survivors(self, sample_watch, tmp_path):
+        sample_watch["title_filter"] = "test"
+        job_id = "job-listing"
+        app_module._jobs[job_id] = app_module._new_job(watch_id=sample_watch["id"])
+        proc = MagicMock(returncode=0)
+        proc.stdout = iter([])
+        with patch("app.subprocess.Popen", return_value=proc) as popen, \
+             patch.object(app_module, "_list_entries", return_value=self.ENTRIES), \
+             patch.object(app_module, "set_watch_state"), \
+             patch.object(app_module, "ARCHIVES_DIR", str(tmp_path)):
+            app_module._run_watch(sample_watch, job_id=job_id)
+        argv = popen.call_args[0][0]
+        assert argv[-2:] == ["https://www.youtube.com/watch?v=new00000001",
+                             "https://www.youtube.com/watch?v=arc00000001"]
+        assert "https://www.youtube.com/@TestChannel/videos" not in argv
+        job = app_module._jobs.pop(job_id)
+        assert (job["listed"], job["filtered"], job["downloaded"]) == (4, 2, 0)
+        assert job["status"] == "done"
+
+    def test_listing_failure_downloads_against_archive(self, sample_watch, tmp_path):
+        job_id = "job-fallback"
+        app_module._jobs[job_id] = app_module._new_job(watch_id=sample_watch["id"])
+        proc = MagicMock(returncode=0)
+        proc.stdout = iter([])
+        with patch("app.subprocess.Popen", return_value=proc) as popen, \
+             patch.object(app_module, "_list_entries", return_value=None), \
+             patch.object(app_module, "set_watch_state"), \
+             patch.object(app_module, "ARCHIVES_DIR", str(tmp_path)):
+            app_module._run_watch(sample_watch, job_id=job_id)
+        argv = popen.call_args[0][0]
+        app_module._jobs.pop(job_id)
+        assert argv[argv.index("--download-archive") + 1] == app_module._archive_export_file(job_id)
+        assert argv[-1] == "https://www.youtube.com/@TestChannel/videos"
+
+    def test_run_with_nothing_new_skips_download(self, sample_watch, tmp_path):
+        job_id = "job-empty"
+        app_module._jobs[job_id] = app_module._new_job(watch_id=sample_watch["id"])
+        with patch("app.subprocess.Popen") as popen, \
+             patch.object(app_module, "_list_entries", return_value=[]), \
+             patch.object(app_module, "set_watch_state"), \
              patch.object(app_module, "ARCHIVES_DIR", str(tmp_path)):
-            app_module._run_watch(watch)
+            app_module._run_watch(sample_watch, job_id=job_id)
+        popen.assert_not_called()
+        job = app_module._jobs.pop(job_id)
+        assert job["status"] == "done"
+        assert job["downloaded"] == 0
+        assert app_module.get_job_history(job_id)["listed"] == 0
+
+
+class TestWatchGroup:
+    ENTRIES = [
+        {"id": "vid00000003", "title": "Alpha and Beta", "url": "https://www.youtube.com/watch?v=vid00000003"},
+        {"id": "vid00000002", "title": "Beta only", "url": "https://www.youtube.com/watch?v=vid00000002"},
+        {"id": "vid00000001", "title": "Alpha only", "url": "https://www.youtube.com/watch?v=vid00000001"},
+    ]
+
+    def _runs(self, sample_watch):
+        alpha = dict(sample_watch, id="alpha", name="Alpha", title_filter="alpha")
+        beta = dict(sample_watch, id="beta", name="Beta", title_filter="beta")
+        runs = []
+        for watch in (alpha, beta):
+            app_module.add_watch(watch)
+            job_id = f"job-{watch['id']}"
+            app_module._jobs[job_id] = app_module._new_job(status="queued", watch_id=watch["id"])
+            runs.append((watch, job_id))
+        return runs
+
+    def test_entries_until(self):
+        stop = {"since": "20260101", "video_id": "vid00000002", "watch_id": "alpha"}
+        assert [e["id"] for e in app_module._entries_until(self.ENTRIES, stop)] == ["vid00000003"]
+        assert app_module._entries_until(self.ENTRIES, None) == self.ENTRIES
+
+    def test_lists_once_and_fans_out(self, sample_watch):
+        runs = self._runs(sample_watch)
+        downloads = {}
+
+        def fake_execute(job_id, argv):
+            videos = [a for a in argv if a.startswith("https://www.youtube.com/watch")]
+            downloads[job_id] = videos
+            report = argv[argv.index("--print-to-file") + 2]
+            with open(report, "w") as f:
+                for url in videos:
+                    f.write(f"Youtube {url[-11:]} /v/{url[-11:]}.mp4\n")
+            return 0, set()
+
+        with patch.object(app_module, "_list_entries", return_value=self.ENTRIES) as listing, \
+             patch.object(app_module, "_execute_ytdlp", side_effect=fake_execute):
+            app_module._run_watch_group(runs)
+        listing.assert_called_once()
+        assert listing.call_args.kwargs["job_ids"] == ["job-alpha", "job-beta"]
+        # vid00000003 matches both watches but is only downloaded by the first.
+        assert downloads == {
+            "job-alpha": ["https://www.youtube.com/watch?v=vid00000003",
+                          "https://www.youtube.com/watch?v=vid00000001"],
+            "job-beta": ["https://www.youtube.com/watch?v=vid00000002"],
+        }
+        for _, job_id in runs:
+            assert app_module._jobs.pop(job_id)["status"] == "done"
+        assert app_module.get_archived("vid00000002")["watch_id"] == "beta"
+
+    def test_listing_runs_as_far_as_any_watch_needs(self, sample_watch):
+        runs = self._runs(sample_watch)
+        now = datetime.now(timezone.utc).isoformat()
+        app_module.set_watch_state("alpha", last_full_sweep=now, hwm_video_id="vid00000003")
+        app_module.set_watch_state("beta", last_full_sweep=now, hwm_video_id="vid00000001")
+        runs = [(app_module.get_watch(w["id"]), job_id) for w, job_id in runs]
+        with patch.object(app_module, "_list_entries", return_value=self.ENTRIES) as listing, \
+             patch.object(app_module, "_execute_ytdlp", return_value=(0, set())) as execute:
+            app_module._run_watch_group(runs)
+        stop_at = listing.call_args.kwargs["stop_at"]
+        assert [stop_at(e) for e in self.ENTRIES] == [False, False, True]
+        # Alpha has seen everything; only Beta downloads.
+        assert [c.args[0] for c in execute.call_args_list] == ["job-beta"]
+        assert app_module._jobs.pop("job-alpha")["listed"] == 0
+        assert app_module._jobs.pop("job-beta")["listed"] == 2
+
+
+class TestDownloadArchive:
+    def test_record_and_lookup(self):
+        assert not app_module.has_video("vid00000001")
+        app_module.record_videos([("Youtube", "vid00000001", "/v/one.mp4")], watch_id="w1", job_id="j1")
+        assert app_module.has_video("vid00000001")
+        assert app_module.has_video("vid00000001", extractor="YouTube")
+        assert not app_module.has_video("vid00000001", extractor="vimeo")
+        record = app_module.get_archived("vid00000001")
+        assert (record["watch_id"], record["job_id"], record["filepath"]) == ("w1", "j1", "/v/one.mp4")
+
+    def test_first_record_wins(self):
+        app_module.record_videos([("youtube", "vid00000001", "/v/first.mp4")], watch_id="w1")
+        app_module.record_videos([("youtube", "vid00000001", "/v/second.mp4")], watch_id="w2")
+        assert app_module.get_archived("vid00000001")["watch_id"] == "w1"
+
+    def test_imports_text_archives(self, tmp_path):
+        (tmp_path / "download-archive.txt").write_text("youtube manual00001\n")
+        archives = tmp_path / "archives"
+        archives.mkdir()
+        (archives / "w1.txt").write_text("youtube watched0001\nyoutube manual00001\n\n")
+        assert app_module.get_archived("watched0001")["watch_id"] == "w1"
+        assert app_module.get_archived("manual00001")["watch_id"] is None
+        assert (archives / "w1.txt.migrated").exists()
+        assert not (tmp_path / "download-archive.txt").exists()
+
+    def test_collect_report(self, tmp_path):
+        report = tmp_path / "report.txt"
+        report.write_text("Youtube vid00000001 /v/Some Title.mp4\n")
+        assert app_module._collect_archive_report(str(report), watch_id="w1") == 1
+        assert app_module.get_archived("vid00000001")["filepath"] == "/v/Some Title.mp4"
+        assert not report.exists()
+        assert app_module._collect_archive_report(str(report)) == 0
+
+    def test_archived_single_video_is_skipped(self):
+        app_module.record_videos([("youtube", "dQw4w9WgXcQ", "/v/x.mp4")])
+        job_id = "job-archived"
+        app_module._jobs[job_id] = app_module._new_job()
+        with patch.object(app_module, "_execute_ytdlp") as execute:
+            app_module._run_download_job(job_id, "https://www.youtube.com/watch?v=dQw4w9WgXcQ")
+        execute.assert_not_called()
+        assert app_module._jobs.pop(job_id)["status"] == "done"
+
+    def test_playlist_download_skips_archived_entries(self):
+        app_module.record_videos([("youtube", "vid00000001", "/v/x.mp4")])
+        entries = [
+            {"id": "vid00000001", "ie_key": "Youtube", "url": "https://www.youtube.com/watch?v=vid00000001"},
+            {"id": "vid00000002", "ie_key": "Youtube", "url": "https://www.youtube.com/watch?v=vid00000002"},
+        ]
+        job_id = "job-playlist"
+        app_module._jobs[job_id] = app_module._new_job()
+        with patch.object(app_module, "_list_entries", return_value=entries):
+            targets = app_module._download_targets(job_id, "https://www.youtube.com/playlist?list=PL1")
+        app_module._jobs.pop(job_id)
+        assert targets == (["https://www.youtube.com/watch?v=vid00000002"], True)
+
+    def test_unchecked_runs_get_the_archive_file(self):
+        app_module.record_videos([("youtube", "vid00000001", "/v/x.mp4")])
+        archives = {}
+
+        def fake_execute(job_id, argv):
+            path = argv[argv.index("--download-archive") + 1]
+            with open(path) as f:
+                archives[argv[-1]] = f.read()
+            return 0, set()
+
+        for url in ("https://vimeo.com/12345", "https://www.youtube.com/playlist?list=PL1"):
+            job_id = f"job-unchecked-{len(archives)}"
+            app_module._jobs[job_id] = app_module._new_job()
+            with patch.object(app_module, "_list_entries", return_value=None), \
+                 patch.object(app_module, "_execute_ytdlp", side_effect=fake_execute):
+                app_module._run_download_job(job_id, url)
+            app_module._jobs.pop(job_id)
+            assert not os.path.exists(app_module._archive_export_file(job_id))
+        assert archives == {"https://vimeo.com/12345": "youtube vid00000001\n",
+                            "https://www.youtube.com/playlist?list=PL1": "youtube vid00000001\n"}
+
+    def test_download_records_reported_videos(self):
+        def fake_execute(job_id, argv):
+            report = argv[argv.index("--print-to-file") + 2]
+            with open(report, "w") as f:
+                f.write("Youtube vid00000009 /v/new.mp4\n")
+            return 0, set()
+
+        job_id = "job-record"
+        app_module._jobs[job_id] = app_module._new_job()
+        with patch.object(app_module, "_execute_ytdlp", side_effect=fake_execute):
+            app_module._run_download_job(job_id, "https://www.youtube.com/watch?v=vid00000009")
+        app_module._jobs.pop(job_id)
+        assert app_module.get_archived("vid00000009")["job_id"] == job_id
+
+    def test_archive_route(self, client):
+        assert client.get("/archive/vid00000001").status_code == 404
+        app_module.record_videos([("youtube", "vid00000001", "/v/x.mp4")])
+        resp = client.get("/archive/vid00000001")
+        assert resp.get_json()["archived"] is True
+        assert resp.get_json()["filepath"] == "/v/x.mp4"
+
+
+class TestMetadataCache:
+    @pytest.fixture(autouse=True)
+    def _stats(self):
+        with patch.dict(app_module._metadata_stats, {k: 0 for k in app_module._metadata_stats}):
+            yield
 
-        mock_run.assert_called_once()
-        mock_scan.assert_called_once()
+    def _write(self, name, content="{}", age=0):
+        os = app_module.os
+        os.makedirs(app_module.METADATA_CACHE_DIR, exist_ok=True)
+        path = os.path.join(app_module.METADATA_CACHE_DIR, name)
+        with open(path, "w") as f:
+            f.write(content)
+        stamp = app_module.time.time() - age
+        os.utime(path, (stamp, stamp))
+        return path
+
+    def test_video_hit_and_miss(self):
+        assert app_module.cached_video_info("vid00000001") is None
+        path = self._write("Youtube-vid00000001.info.json")
+        assert app_module.cached_video_info("vid00000001") == path
+        stats = app_module.metadata_cache_stats()
+        assert (stats["video_hits"], stats["video_misses"], stats["entries"]) == (1, 1, 1)
+
+    def test_expired_entry_is_removed(self):
+        path = self._write("Youtube-vid00000001.info.json", age=app_module.METADATA_CACHE_TTL + 1)
+        assert app_module.cached_video_info("vid00000001") is None
+        assert not app_module.os.path.exists(path)
+
+    def test_playlist_round_trip(self):
+        url = "https://www.youtube.com/playlist?list=PL123"
+        assert app_module.cached_playlist(url) is None
+        app_module.cache_playlist(url, [{"id": "vid00000001"}])
+        assert app_module.cached_playlist(url) == [{"id": "vid00000001"}]
+        assert app_module.os.path.basename(app_module._playlist_cache_path(url)) == "playlist-PL123.json"
+
+    def test_manual_playlist_listing_uses_cache(self):
+        url = "https://www.youtube.com/playlist?list=PL123"
+        entries = [{"id": "vid00000001", "url": "https://www.youtube.com/watch?v=vid00000001"}]
+        job_id = "job-cache"
+        app_module._jobs[job_id] = app_module._new_job()
+        with patch.object(app_module, "_list_entries", return_value=entries) as listing:
+            app_module._download_targets(job_id, url)
+            assert app_module._download_targets(job_id, url) == ([entries[0]["url"]], True)
+        app_module._jobs.pop(job_id)
+        listing.assert_called_once()
+
+    def test_lru_eviction_past_size_limit(self):
+        old = self._write("Youtube-old00000001.info.json", "x" * 600)
+        new = self._write("Youtube-new00000001.info.json", "x" * 600)
+        app_module.os.utime(old, (app_module.time.time() - 100, app_module.os.path.getmtime(old)))
+        with patch.object(app_module, "METADATA_CACHE_MAX_MB", 1000 / 1024 ** 2):
+            app_module._prune_metadata_cache()
+        assert not app_module.os.path.exists(old)
+        assert app_module.os.path.exists(new)
+        assert app_module.metadata_cache_stats()["evictions"] == 1
+
+    def test_download_replays_cached_videos(self):
+        cached = self._write("Youtube-vid00000001.info.json")
+        urls = ["https://www.youtube.com/watch?v=vid00000001", "https://www.youtube.com/watch?v=vid00000002"]
+        job_id = "job-replay"
+        app_module._jobs[job_id] = app_module._new_job()
+        with patch.object(app_module, "_execute_ytdlp", side_effect=[(0, {"/a"}), (1, {"/b"})]) as execute:
+            returncode, written = app_module._download_videos(job_id, ["--flag"], urls)
+        app_module._jobs.pop(job_id)
+        first, second = (c.args[1] for c in execute.call_args_list)
+        assert first[-2:] == ["--load-info-json", cached]
+        assert second[-1] == urls[1]
+        assert "--write-info-json" in second
+        assert (returncode, written) == (1, {"/a", "/b"})
+
+    def test_failed_replay_is_extracted_again(self):
+        cached = self._write("Youtube-vid00000001.info.json")
+        urls = ["https://www.youtube.com/watch?v=vid00000001"]
+        job_id = "job-bad-cache"
+        app_module._jobs[job_id] = app_module._new_job()
+        with patch.object(app_module, "_execute_ytdlp", side_effect=[(1, set()), (0, {"/a"})]) as execute:
+            returncode, written = app_module._download_videos(job_id, ["--flag"], urls)
+        job = app_module._jobs.pop(job_id)
+        first, second = (c.args[1] for c in execute.call_args_list)
+        assert first[-2:] == ["--load-info-json", cached]
+        assert second[-1] == urls[0] and "--load-info-json" not in second
+        assert (returncode, written) == (0, {"/a"})
+        assert not app_module.os.path.exists(cached)
+        assert any("[cache] replaying vid00000001 failed" in line for line in job["log"])
+
+    def test_failed_extraction_drops_cache_entries(self):
+        urls = ["https://www.youtube.com/watch?v=vid00000001"]
+        job_id = "job-failed-extract"
+        app_module._jobs[job_id] = app_module._new_job()
+
+        def extract(job_id, args):
+            self._write("Youtube-vid00000001.info.json")
+            return 1, set()
+
+        with patch.object(app_module, "_execute_ytdlp", side_effect=extract):
+            assert app_module._download_videos(job_id, ["--flag"], urls) == (1, set())
+        app_module._jobs.pop(job_id)
+        assert app_module.cached_video_info("vid00000001") is None
+
+    def test_stats_route(self, client):
+        resp = client.get("/cache/stats")
+        assert resp.status_code == 200
+        assert "video_hits" in resp.get_json()
+
+
+class TestPostprocessStage:
+    INFO = {"id": "vid00000009", "extractor_key": "Youtube", "filepath": "/v/new.mp4"}
+
+    def _fake_download(self, job_id, argv):
+        handoff = argv[argv.index("after_move:%()j") + 1]
+        with open(handoff, "a") as f:
+            f.write(json.dumps(self.INFO) + "\n")
+        return 0, {"/v"}
+
+    def test_downloads_hand_off_to_postprocessing(self, inline_postprocess):
+        replayed = []
+
+        def fake_postprocess(job_id, info_path, args):
+            with open(info_path) as f:
+                replayed.append(json.load(f))
+            return 0, {"/v"}
+
+        job_id = "job-pipeline"
+        app_module._jobs[job_id] = app_module._new_job()
+        with patch.object(app_module, "_execute_ytdlp", side_effect=self._fake_download) as execute, \
+             patch.object(app_module, "_postprocess_video", side_effect=fake_postprocess) as pp, \
+             patch.object(app_module, "request_jellyfin_scan") as scan:
+            app_module._run_download_job(job_id, "https://www.youtube.com/watch?v=vid00000009")
+        job = app_module._jobs.pop(job_id)
+        assert replayed == [self.INFO]
+        assert "/app/yt-dlp-postprocess.conf" not in execute.call_args.args[1]
+        assert "/app/yt-dlp-postprocess.conf" in pp.call_args.args[2]
+        assert job["status"] == "done"
+        assert job["phase"] == "post-processing"
+        scan.assert_called_once_with({"/v"})
+        assert job_id not in app_module._pipelines
+
+    def test_handoff_polled_at_most_once_a_second(self):
+        job_id = "job-poll"
+        app_module._start_pipeline(job_id, [])
+        try:
+            with patch.object(app_module, "_drain_handoff") as drain:
+                for _ in range(100):
+                    app_module._poll_handoff(job_id)
+                drain.assert_not_called()
+                app_module._pipelines[job_id]["polled"] -= app_module._HANDOFF_POLL
+                for _ in range(100):
+                    app_module._poll_handoff(job_id)
+            drain.assert_called_once_with(job_id)
+        finally:
+            app_module._pipelines.pop(job_id)
+
+    def test_postprocessing_failure_fails_job(self, inline_postprocess):
+        job_id = "job-pp-fail"
+        app_module._jobs[job_id] = app_module._new_job()
+        with patch.object(app_module, "_execute_ytdlp", side_effect=self._fake_download), \
+             patch.object(app_module, "_postprocess_video", return_value=(1, set())):
+            app_module._run_download_job(job_id, "https://www.youtube.com/watch?v=vid00000009")
+        job = app_module._jobs.pop(job_id)
+        assert (job["status"], job["exit_code"]) == ("error", 1)
+
+    def test_postprocess_video_replays_info_json(self, tmp_path):
+        info = tmp_path / "one.info.json"
+        info.write_text(json.dumps(self.INFO))
+        job_id = "job-pp"
+        app_module._jobs[job_id] = app_module._new_job()
+        app_module._jobs[job_id]["postprocess_pending"] = 1
+        app_module._stage_counts["postprocess_queued"] += 1
+        before = app_module.stage_depths()["postprocess"]
+        proc = MagicMock(returncode=0)
+        proc.stdout = iter(['[EmbedThumbnail] ffmpeg: Adding thumbnail to "/v/new.mp4"\n'])
+        with patch("app.subprocess.Popen", return_value=proc) as popen:
+            assert app_module._postprocess_video(job_id, str(info), ["--embed-subs"]) == (0, {"/v"})
+        job = app_module._jobs.pop(job_id)
+        assert popen.call_args[0][0][-3:] == ["--embed-subs", "--load-info-json", str(info)]
+        assert job["postprocess_pending"] == 0
+        assert not info.exists()
+        after = app_module.stage_depths()["postprocess"]
+        assert (after["queued"], after["running"]) == (before["queued"] - 1, before["running"])
+
+    def test_cancel_stops_postprocessing(self):
+        job_id = "job-pp-cancel"
+        app_module._jobs[job_id] = app_module._new_job()
+        app_module._jobs[job_id]["postprocess_pending"] = 2
+        proc = MagicMock()
+        app_module._postprocess_procs[job_id] = {proc}
+        try:
+            assert app_module.cancel_job(job_id) is True
+        finally:
+            app_module._postprocess_procs.pop(job_id)
+        proc.terminate.assert_called_once()
+        assert app_module._jobs.pop(job_id)["status"] == "cancelled"
+
+    def test_watch_held_until_postprocessed(self, sample_watch):
+        postprocessed = Future()
+
+        def download_stage(job_id, returncode, written, finish):
+            # Cancelled once its download stage ended, while a video is still post-processed.
+            app_module._jobs[job_id]["status"] = "cancelled"
+            postprocessed.add_done_callback(lambda _f: finish(returncode, written))
+
+        executor = app_module.ThreadPoolExecutor(max_workers=1)
+        with patch.object(app_module, "_watch_executor", executor), \
+             patch.object(app_module, "_list_entries", return_value=[]), \
+             patch.object(app_module, "_finish_pipeline", side_effect=download_stage):
+            job_id, _ = app_module.start_watch_job(sample_watch)
+            executor.shutdown(wait=True)
         with app_module._watch_jobs_lock:
-            assert watch["id"] not in app_module._watch_jobs
+            assert app_module._watch_jobs[sample_watch["id"]] == job_id
+        assert app_module.start_watch_job(sample_watch) == (job_id, False)
+        postprocessed.set_result(None)
+        with app_module._watch_jobs_lock:
+            assert sample_watch["id"] not in app_module._watch_jobs
+
+    def test_stages_route(self, client):
+        depths = client.get("/stages").get_json()
+        assert set(depths) == {"download", "watch", "postprocess"}
+        assert depths["download"] == {"queued": 0, "running": 0}
+
+
+class TestThroughputProfiles:
+    @pytest.fixture
+    def job_id(self):
+        job_id = "job-profile"
+        app_module._jobs[job_id] = app_module._new_job()
+        yield job_id
+        app_module._jobs.pop(job_id, None)
+
+    def test_default_profile_args(self, job_id):
+        args = app_module._profile_args(job_id, None)
+        assert args[:2] == ["--concurrent-fragments", "4"]
+        assert "--http-chunk-size" in args
+        assert app_module._jobs[job_id]["profile"] == "default"
+
+    def test_unknown_profile_falls_back_to_default(self, job_id):
+        app_module._profile_args(job_id, "warp-speed")
+        assert app_module._jobs[job_id]["profile"] == "default"
+
+    def test_external_downloader(self, job_id):
+        args = app_module._profile_args(job_id, "aria2c")
+        assert args[args.index("--downloader") + 1] == "aria2c"
+        assert args[args.index("--downloader-args") + 1] == "aria2c:-x 16 -s 16 -k 1M"
+
+    def test_fragments_shared_between_running_jobs(self, job_id):
+        with patch.dict(app_module._stage_counts, {"download_running": 2, "watch_running": 2}):
+            args = app_module._profile_args(job_id, "fast")
+        assert args[:2] == ["--concurrent-fragments", "4"]
+        assert "using 4 of 8 fragments" in app_module._jobs[job_id]["log"][-1]
+
+    def test_throughput_recorded_in_history(self, job_id):
+        job = app_module._jobs[job_id]
+        job["bytes"] = 10 * 1024 ** 2
+        job["profile"] = "fast"
+        app_module._record_throughput(job_id, 2.0)
+        job["status"] = "done"
+        app_module._finish_job(job_id)
+        record = app_module.get_job_history(job_id)
+        assert (record["mb_per_s"], record["profile"]) == (5.0, "fast")
+
+    def test_manual_download_profile_survives_restart(self, tmp_queue):
+        job_id = app_module.enqueue_download("https://youtube.com/watch?v=a", profile="low")
+        app_module._queue.clear()
+        app_module._queue_items.clear()
+        app_module._jobs.pop(job_id)
+        app_module._load_queue()
+        assert app_module._jobs.pop(job_id)["profile"] == "low"
+
+    def test_watch_profile_from_form(self, sample_watch):
+        form = {"name": "W", "channel_url": sample_watch["channel_url"], "start_date": "2025-01-01",
+                "end_date": "2025-12-31", "interval_hours": "4", "profile": "aria2c"}
+        watch = app_module._watch_from_form(form)
+        app_module.add_watch(watch)
+        assert app_module.get_watch(watch["id"])["profile"] == "aria2c"
+
+
+class TestStaging:
+    @pytest.fixture
+    def library(self, tmp_path):
+        with patch.object(app_module, "YOUTUBE_PATH", str(tmp_path / "library") + "/"):
+            yield tmp_path / "library"
+
+    def _stage(self, *names, job_id="job-commit"):
+        folder = app_module.os.path.join(app_module._staging_dir(job_id), "Uploader", "Watch")
+        app_module.os.makedirs(folder, exist_ok=True)
+        for name in names:
+            with open(app_module.os.path.join(folder, name), "w") as f:
+                f.write(name)
+        return folder
+
+    def test_staging_args(self):
+        staging = app_module.os.path.join(app_module.STAGING_DIR, "job-x")
+        assert app_module._staging_args("job-x") == ["--paths", staging]
+
+    def test_low_free_space_writes_to_library(self):
+        job_id = "job-full"
+        app_module._jobs[job_id] = app_module._new_job()
+        with patch.object(app_module, "STAGING_MIN_FREE_GB", 10 ** 9):
+            assert app_module._staging_args(job_id) == []
+        assert "[staging]" in app_module._jobs.pop(job_id)["log"][-1]
+
+    def test_final_path(self, library):
+        staged = app_module.os.path.join(app_module._staging_dir("job-x"), "Uploader", "a.mp4")
+        assert app_module._final_path(staged) == str(library / "Uploader" / "a.mp4")
+        assert app_module._final_path("/elsewhere/a.mp4") == "/elsewhere/a.mp4"
+
+    @pytest.mark.parametrize("same_fs", [True, False])
+    def test_commit_moves_video_and_sidecars(self, library, same_fs):
+        folder = self._stage("Clip.mp4", "Clip.jpg", "Clip.en.vtt", "Clip.f137.mp4.part",
+                             "Clip.f251.webm", "Clip. Part 2.mp4", "Clip. Part 2.jpg", "Other.mp4")
+        job_id = "job-commit"
+        app_module._jobs[job_id] = app_module._new_job()
+        with patch.object(app_module, "_same_filesystem", return_value=same_fs):
+            final = app_module.commit_staged(job_id, app_module.os.path.join(folder, "Clip.mp4"))
+        app_module._jobs.pop(job_id)
+        dest = library / "Uploader" / "Watch"
+        assert final == str(dest / "Clip.mp4")
+        assert sorted(p.name for p in dest.iterdir()) == ["Clip.en.vtt", "Clip.jpg", "Clip.mp4"]
+        assert (dest / "Clip.mp4").read_text() == "Clip.mp4"
+        assert sorted(app_module.os.listdir(folder)) == [
+            "Clip. Part 2.jpg", "Clip. Part 2.mp4", "Clip.f137.mp4.part", "Clip.f251.webm", "Other.mp4",
+        ]
+
+    @pytest.mark.parametrize("handed_off", [False, True])
+    def test_finish_removes_leftovers(self, handed_off):
+        job_id = "job-leftovers"
+        self._stage("Clip.f137.mp4.part", "Clip.f251.webm", job_id=job_id)
+        app_module._jobs[job_id] = app_module._new_job()
+        finished = []
+        if handed_off:
+            future = Future()
+            app_module._pipelines[job_id] = {"futures": [future], "handoff": "/nonexistent"}
+        with patch.object(app_module, "_drain_handoff"):
+            app_module._finish_pipeline(job_id, 1, set(), lambda code, dirs: finished.append(code))
+            if handed_off:
+                assert app_module.os.path.isdir(app_module._staging_dir(job_id))
+                future.set_result((0, set()))
+        app_module._jobs.pop(job_id)
+        assert finished == [1]
+        assert not app_module.os.path.exists(app_module._staging_dir(job_id))
+
+    def test_sweep_at_startup(self):
+        self._stage("Clip.mp4.part", job_id="job-stale")
+        with open(app_module.os.path.join(app_module.STAGING_DIR, "stray.ytdl"), "w"):
+            pass
+        app_module.sweep_staging()
+        assert app_module.os.listdir(app_module.STAGING_DIR) == []
+
+    def test_commit_records_throughput(self, library):
+        folder = self._stage("Clip.mp4")
+        job_id = "job-stats"
+        app_module._jobs[job_id] = app_module._new_job()
+        before = app_module.staging_commit_stats()
+        with patch.object(app_module, "_same_filesystem", return_value=False):
+            app_module.commit_staged(job_id, app_module.os.path.join(folder, "Clip.mp4"))
+        app_module._jobs.pop(job_id)
+        after = app_module.staging_commit_stats()
+        assert after["files"] == before["files"] + 1
+        assert after["bytes"] == before["bytes"] + len("Clip.mp4")
+        assert after["free_gb"] is not None
+
+    def test_archive_records_final_path(self, library, tmp_path):
+        report = tmp_path / "report.txt"
+        staged = app_module.os.path.join(app_module._staging_dir("job-x"), "Uploader", "a.mp4")
+        report.write_text(f"Youtube vid00000001 {staged}\n")
+        app_module._collect_archive_report(str(report))
+        assert app_module.get_archived("vid00000001")["filepath"] == str(library / "Uploader" / "a.mp4")
+
+    def test_stats_route(self, client):
+        assert "mb_per_s" in client.get("/staging/stats").get_json()
+
+
+class TestEjsCache:
+    @pytest.fixture(autouse=True)
+    def _ejs(self, tmp_path):
+        with patch.dict(app_module._ejs_state, {"path": None}), \
+             patch.object(app_module, "EJS_CACHE_DIR", str(tmp_path / "ejs")), \
+             patch.object(app_module.importlib.metadata, "version", return_value="2026.01.01"), \
+             patch.object(app_module.importlib.metadata, "requires",
+                          return_value=['yt-dlp-ejs==0.4.0; extra == "default"', "requests>=2"]):
+            yield tmp_path / "ejs"
+
+    @staticmethod
+    def _fake_pip(cmd, **kwargs):
+        target = cmd[cmd.index("--target") + 1]
+        app_module.os.makedirs(app_module.os.path.join(target, "yt_dlp_ejs"))
+        return MagicMock(returncode=0, stderr="")
+
+    def test_requirement_is_pinned_by_yt_dlp(self):
+        assert app_module._ejs_requirement() == ("2026.01.01", "yt-dlp-ejs==0.4.0")
+
+    def test_refresh_installs_once_per_version(self, _ejs):
+        (_ejs / "2025.12.01" / "yt_dlp_ejs").mkdir(parents=True)
+        with patch("app.subprocess.run", side_effect=self._fake_pip) as pip:
+            path = app_module.refresh_ejs_cache()
+            assert app_module.refresh_ejs_cache() == path
+        pip.assert_called_once()
+        assert "yt-dlp-ejs==0.4.0" in pip.call_args[0][0]
+        assert path == str(_ejs / "2026.01.01")
+        assert not (_ejs / "2025.12.01").exists()
+
+    def test_failed_install_falls_back_to_github(self):
+        with patch("app.subprocess.run", return_value=MagicMock(returncode=1, stderr="offline")):
+            assert app_module.refresh_ejs_cache() is None
+        assert app_module._ejs_args() == ["--remote-components", "ejs:github"]
+        assert app_module._ytdlp_env() is None
+
+    def test_runs_use_cache_when_warm(self):
+        with patch("app.subprocess.run", side_effect=self._fake_pip):
+            path = app_module.refresh_ejs_cache()
+        job_id = "job-ejs"
+        app_module._jobs[job_id] = app_module._new_job()
+        proc = MagicMock(returncode=0)
+        proc.stdout = iter([])
+        with patch("app.subprocess.Popen", return_value=proc) as popen:
+            app_module._execute_ytdlp(job_id, ["https://www.youtube.com/watch?v=x"])
+        app_module._jobs.pop(job_id)
+        assert "--remote-components" not in popen.call_args[0][0]
+        assert popen.call_args.kwargs["env"]["PYTHONPATH"].split(app_module.os.pathsep)[0] == path
+
+
+class TestUploadFeed:
+    CHANNEL_ID = "UC" + "a" * 22
+    PAGE = '<html><script>var d = {"externalId":"%s"};</script></html>' % CHANNEL_ID
+
+    def _watch(self, server, sample_watch, **state):
+        watch = dict(sample_watch, channel_url=f"{server.url}/@TestChannel")
+        app_module.add_watch(watch)
+        if state:
+            app_module.set_watch_state(watch["id"], **state)
+        return app_module.get_watch(watch["id"])
+
+    def test_channel_url_needs_no_request(self, feed_server):
+        url = f"https://www.youtube.com/channel/{self.CHANNEL_ID}"
+        assert app_module.resolve_channel_id(url) == self.CHANNEL_ID
+        assert feed_server.requests == []
+
+    def test_handle_resolution_is_cached(self, feed_server):
+        feed_server.pages["/@TestChannel"] = self.PAGE
+        url = f"{feed_server.url}/@TestChannel/"
+        assert app_module.resolve_channel_id(url) == self.CHANNEL_ID
+        assert app_module.resolve_channel_id(url) == self.CHANNEL_ID
+        assert feed_server.requests == ["/@TestChannel"]
+
+    def test_unresolvable_handle(self, feed_server):
+        assert app_module.resolve_channel_id(f"{feed_server.url}/@Missing") is None
+        assert app_module.fetch_feed(f"{feed_server.url}/@Missing") is None
+
+    def test_fetch_feed(self, feed_server):
+        feed_server.pages["/@TestChannel"] = self.PAGE
+        feed_server.add_feed(self.CHANNEL_ID, ["vid00000002", "vid00000001"])
+        assert app_module.fetch_feed(f"{feed_server.url}/@TestChannel") == ["vid00000002", "vid00000001"]
+
+    def test_fetch_playlist_feed(self, feed_server):
+        feed_server.pages["/feeds/videos.xml?playlist_id=PL123"] = feed_server.feed_xml(["vid00000001"])
+        assert app_module.fetch_feed("https://www.youtube.com/playlist?list=PL123") == ["vid00000001"]
+
+    def _run(self, watch, tmp_path):
+        job_id = "job-feed"
+        app_module._jobs[job_id] = app_module._new_job(watch_id=watch["id"])
+        with patch("app.subprocess.Popen") as popen, \
+             patch.object(app_module, "_list_entries", return_value=[]) as listing, \
+             patch.object(app_module, "ARCHIVES_DIR", str(tmp_path)):
+            app_module._run_watch(watch, job_id=job_id)
+        return app_module._jobs.pop(job_id), listing, popen
+
+    def test_unchanged_feed_skips_yt_dlp(self, feed_server, sample_watch, tmp_path):
+        feed_server.pages["/@TestChannel"] = self.PAGE
+        feed_server.add_feed(self.CHANNEL_ID, ["vid00000002", "vid00000001"])
+        watch = self._watch(feed_server, sample_watch, feed_seen="vid00000003 vid00000002 vid00000001",
+                            last_full_sweep=datetime.now(timezone.utc).isoformat())
+        job, listing, popen = self._run(watch, tmp_path)
+        assert job["status"] == "done"
+        listing.assert_not_called()
+        popen.assert_not_called()
+
+    def test_new_upload_runs_and_records_feed(self, feed_server, sample_watch, tmp_path):
+        feed_server.pages["/@TestChannel"] = self.PAGE
+        feed_server.add_feed(self.CHANNEL_ID, ["vid00000003", "vid00000002"])
+        watch = self._watch(feed_server, sample_watch, feed_seen="vid00000002",
+                            last_full_sweep=datetime.now(timezone.utc).isoformat())
+        job, listing, _ = self._run(watch, tmp_path)
+        assert job["status"] == "done"
+        listing.assert_called_once()
+        assert app_module.get_watch(watch["id"])["feed_seen"] == "vid00000003 vid00000002"
+
+    def test_full_sweep_ignores_feed(self, feed_server, sample_watch, tmp_path):
+        feed_server.pages["/@TestChannel"] = self.PAGE
+        feed_server.add_feed(self.CHANNEL_ID, ["vid00000001"])
+        watch = self._watch(feed_server, sample_watch, feed_seen="vid00000001")
+        _, listing, _ = self._run(watch, tmp_path)
+        listing.assert_called_once()
+
+    def test_feed_failure_runs_anyway(self, feed_server, sample_watch, tmp_path):
+        watch = self._watch(feed_server, sample_watch, feed_seen="vid00000001",
+                            last_full_sweep=datetime.now(timezone.utc).isoformat())
+        _, listing, _ = self._run(watch, tmp_path)
+        listing.assert_called_once()
 
 
 # ── Scheduler logic ──────────────────────────────────────────
@@ -388,21 +1941,597 @@ class TestSchedulerLogic:
         assert self._run_one_cycle([sample_watch]) == ["Test Watch"]
 
 
+class TestComputeDue:
+    NOW = datetime(2026, 2, 22, 12, 0, tzinfo=timezone.utc)
+
+    @pytest.fixture(autouse=True)
+    def _no_jitter(self):
+        with patch.object(app_module, "SCHEDULER_JITTER", 0):
+            yield
+
+    def test_never_run_is_due_now(self, sample_watch):
+        assert app_module._compute_due(sample_watch, self.NOW) == self.NOW
+
+    def test_due_after_interval(self, sample_watch):
+        sample_watch["last_run"] = "2026-02-22T11:00:00+00:00"
+        due = app_module._compute_due(sample_watch, self.NOW)
+        assert due == datetime(2026, 2, 22, 15, 0, tzinfo=timezone.utc)
+
+    def test_disabled(self, sample_watch):
+        sample_watch["enabled"] = False
+        assert app_module._compute_due(sample_watch, self.NOW) is None
+
+    def test_waits_for_window_start(self, sample_watch):
+        sample_watch["start_date"] = "2026-03-01"
+        due = app_module._compute_due(sample_watch, self.NOW)
+        assert due == datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+    def test_after_window_end(self, sample_watch):
+        sample_watch["end_date"] = "2026-02-21"
+        assert app_module._compute_due(sample_watch, self.NOW) is None
+
+    def test_next_run_past_window_end(self, sample_watch):
+        sample_watch["end_date"] = "2026-02-22"
+        sample_watch["last_run"] = "2026-02-22T22:00:00+00:00"
+        assert app_module._compute_due(sample_watch, self.NOW) is None
+
+    def test_jitter_stays_within_bounds(self, sample_watch):
+        sample_watch["last_run"] = "2026-02-22T11:00:00+00:00"
+        offsets = set()
+        with patch.object(app_module, "SCHEDULER_JITTER", 0.1):
+            for i in range(50):
+                sample_watch["id"] = f"watch-{i}"
+                due = app_module._compute_due(sample_watch, self.NOW)
+                offset = (due - datetime(2026, 2, 22, 15, 0, tzinfo=timezone.utc)).total_seconds()
+                assert abs(offset) <= 0.1 * 4 * 3600
+                offsets.add(offset)
+        assert len(offsets) > 1
+
+    def test_jitter_is_stable_per_watch(self, sample_watch):
+        sample_watch["last_run"] = "2026-02-22T11:00:00+00:00"
+        with patch.object(app_module, "SCHEDULER_JITTER", 0.1):
+            first = app_module._compute_due(sample_watch, self.NOW)
+            assert app_module._compute_due(sample_watch, self.NOW) == first
+            sample_watch["last_run"] = "2026-02-22T15:00:00+00:00"
+            later = app_module._compute_due(sample_watch, self.NOW)
+        assert later - first == timedelta(hours=4)
+
+    def test_overdue_watches_spread_forward(self, sample_watch):
+        with patch.object(app_module, "SCHEDULER_JITTER", 0.1):
+            due = app_module._compute_due(sample_watch, self.NOW)
+        assert self.NOW <= due <= self.NOW + timedelta(hours=0.4)
+
+
+class TestSchedulerTick:
+    @pytest.fixture(autouse=True)
+    def _clean_schedule(self, tmp_watches_file):
+        with patch.object(app_module, "SCHEDULER_JITTER", 0), \
+             patch.object(app_module, "_schedule", []), \
+             patch.object(app_module, "_schedule_due", {}):
+            yield
+
+    def test_starts_due_watch_and_records_last_run(self, sample_watch):
+        app_module.save_watches([sample_watch])
+        now = datetime.now(timezone.utc)
+        with patch.object(app_module, "start_watch_job", return_value=("j", True)) as mock_start:
+            timeout = app_module._scheduler_tick(now)
+        mock_start.assert_called_once()
+        assert timeout == 0
+        assert app_module.load_watches()[0]["last_run"] == now.isoformat(timespec="seconds")
+
+    def test_sleeps_until_next_deadline(self, sample_watch):
+        now = datetime.now(timezone.utc)
+        sample_watch["last_run"] = (now - timedelta(hours=3)).isoformat()
+        app_module.save_watches([sample_watch])
+        with patch.object(app_module, "start_watch_job") as mock_start:
+            timeout = app_module._scheduler_tick(now)
+        mock_start.assert_not_called()
+        assert timeout == pytest.approx(3600)
+
+    def test_skips_running_watch(self, sample_watch):
+        app_module.save_watches([sample_watch])
+        with app_module._watch_jobs_lock:
+            app_module._watch_jobs[sample_watch["id"]] = "in-flight"
+        try:
+            with patch.object(app_module, "start_watch_job") as mock_start:
+                timeout = app_module._scheduler_tick(datetime.now(timezone.utc))
+        finally:
+            with app_module._watch_jobs_lock:
+                app_module._watch_jobs.pop(sample_watch["id"], None)
+        mock_start.assert_not_called()
+        assert timeout == app_module.SCHEDULER_MAX_SLEEP
+
+    def test_groups_watches_on_same_channel(self, sample_watch):
+        now = datetime.now(timezone.utc)
+        soon = dict(sample_watch, id="soon", name="Soon",
+                    last_run=(now - timedelta(hours=4) + timedelta(minutes=5)).isoformat())
+        later = dict(sample_watch, id="later", name="Later",
+                     last_run=(now - timedelta(hours=2)).isoformat())
+        other = dict(sample_watch, id="other", name="Other", channel_url="https://www.youtube.com/@Other",
+                     last_run=soon["last_run"])
+        app_module.save_watches([sample_watch, soon, later, other])
+        with patch.object(app_module, "start_watch_group",
+                          side_effect=lambda ws: [(w, "j") for w in ws]) as mock_group, \
+             patch.object(app_module, "start_watch_job") as mock_start:
+            app_module._scheduler_tick(now)
+        mock_start.assert_not_called()
+        assert [w["id"] for w in mock_group.call_args[0][0]] == ["test-id-123", "soon"]
+        assert app_module.get_watch("soon")["last_run"] == now.isoformat(timespec="seconds")
+        assert app_module.get_watch("other")["last_run"] == other["last_run"]
+
+    def test_edit_wakes_scheduler(self, client, sample_watch):
+        app_module.save_watches([sample_watch])
+        app_module._scheduler_wake.clear()
+        client.post(f"/watches/{sample_watch['id']}/delete")
+        assert app_module._scheduler_wake.is_set()
+
+
 # ── trigger_jellyfin_scan ────────────────────────────────────
 
+class TestPhaseTiming:
+    def test_line_phase(self):
+        assert app_module._line_phase("[youtube] abc: Downloading webpage") == "extract"
+        assert app_module._line_phase("[download]  50.0% of 10MiB") == "download"
+        assert app_module._line_phase('[Merger] Merging formats into "x.mp4"') == "merge"
+        assert app_module._line_phase("[SponsorBlock] Found 2 segments") == "sponsorblock"
+        assert app_module._line_phase("[EmbedThumbnail] ffmpeg: Adding thumbnail") == "embed"
+        assert app_module._line_phase("[archive] 0 of 1 videos") is None
+        assert app_module._line_phase("plain text") is None
+
+    def test_output_markers_build_timeline(self):
+        job_id = "job-phases"
+        job = app_module._jobs[job_id] = app_module._new_job()
+        job["created"] = 1000.0
+        clock = {}
+        lines = [(1001.0, "[youtube] abc: Downloading webpage"),
+                 (1003.0, "[download] Destination: /yt/x.f137.mp4"),
+                 (1004.0, progress_line(status="downloading", downloaded_bytes=1, total_bytes=2)),
+                 (1013.0, '[Merger] Merging formats into "x.mp4"')]
+        for now, line in lines:
+            with patch.object(app_module.time, "time", return_value=now):
+                app_module._handle_output_line(job_id, line, set(), clock)
+        app_module._end_phase(job_id, clock, now=1015.0)
+        app_module._jobs.pop(job_id)
+        assert job["phase_seconds"] == {"extract": 2.0, "download": 10.0, "merge": 2.0}
+        assert job["timeline"] == [
+            {"phase": "extract", "start": 1.0, "end": 3.0},
+            {"phase": "download", "start": 3.0, "end": 13.0},
+            {"phase": "merge", "start": 13.0, "end": 15.0},
+        ]
+
+    def test_api_postprocess_events_mark_phases(self):
+        job_id = "job-api-phases"
+        job = app_module._jobs[job_id] = app_module._new_job()
+        clock = {}
+        app_module._apply_api_event(job_id, {"type": "download", "status": "downloading"}, set(), clock)
+        assert clock["phase"] == "download"
+        app_module._apply_api_event(job_id, {"type": "postprocess", "postprocessor": "SponsorBlock"},
+                                    set(), clock)
+        assert clock["phase"] == "sponsorblock"
+        app_module._jobs.pop(job_id)
+        assert "download" in job["phase_seconds"]
+
+    def test_job_api_live_and_from_history(self, client):
+        job_id = "job-api-detail"
+        app_module._jobs[job_id] = app_module._new_job(status="queued")
+        app_module._job_started(job_id)
+        app_module._record_phase(job_id, "download", app_module.time.time(), app_module.time.time() + 5)
+        live = client.get(f"/jobs/{job_id}").get_json()
+        assert live["status"] == "running"
+        assert live["phase_seconds"]["download"] == 5.0
+        assert [s["phase"] for s in live["timeline"]] == ["queued", "download"]
+
+        app_module._jobs[job_id]["status"] = "done"
+        app_module._finish_job(job_id)
+        app_module._jobs.pop(job_id)
+        past = client.get(f"/jobs/{job_id}").get_json()
+        assert past["phase_seconds"]["download"] == 5.0
+        assert past["timeline"][1]["phase"] == "download"
+        assert client.get("/jobs/nope").status_code == 404
+
+    def test_watch_summary(self, client):
+        for i, seconds in enumerate(({"queued": 900, "download": 60, "embed": 30},
+                                     {"queued": 100, "download": 120, "embed": 10})):
+            job_id = f"job-summary-{i}"
+            job = app_module._jobs[job_id] = app_module._new_job(status="done", watch_id="w-sum")
+            job["phase_seconds"] = seconds
+            app_module._finish_job(job_id)
+            app_module._jobs.pop(job_id)
+        summary = client.get("/watches/w-sum/phases").get_json()
+        assert summary["runs"] == 2
+        assert summary["mean_seconds"] == {"queued": 500.0, "download": 90.0, "embed": 20.0}
+        assert summary["slowest"] == "download"
+
+
+class TestJobLogs:
+    def _job(self, job_id):
+        app_module._jobs[job_id] = app_module._new_job()
+        return job_id
+
+    def test_every_line_reaches_the_file(self):
+        job_id = self._job("job-log-all")
+        for i in range(60):
+            app_module._append_log(job_id, f"line {i}")
+        assert len(app_module._jobs[job_id]["log"]) == 50
+        first, size = app_module.job_log_extent(job_id)
+        text = app_module.read_job_log(job_id, first, size).decode()
+        assert text.splitlines() == [f"line {i}" for i in range(60)]
+
+    def test_rotation_caps_size_and_keeps_offsets(self):
+        job_id = self._job("job-log-rotate")
+        with patch.object(app_module, "JOB_LOG_MAX_MB", 400 / 1024 ** 2):
+            for i in range(100):
+                app_module._append_log(job_id, f"line {i:03d}")   # 9 bytes each
+        first, size = app_module.job_log_extent(job_id)
+        assert size == 900
+        assert size - first <= 400
+        assert len(app_module._job_log_segments(job_id)) == app_module.JOB_LOG_SEGMENTS
+        assert app_module.read_job_log(job_id, 891, 900) == b"line 099\n"
+        assert app_module.read_job_log(job_id, first, first + 9) == f"line {first // 9:03d}\n".encode()
+
+    def test_finished_job_closes_and_reopens(self):
+        job_id = self._job("job-log-reopen")
+        app_module._append_log(job_id, "before")
+        app_module._jobs[job_id]["status"] = "done"
+        app_module._finish_job(job_id)
+        assert job_id not in app_module._job_logs
+        app_module._jobs[job_id] = app_module._new_job()
+        app_module._append_log(job_id, "after")
+        assert app_module.read_job_log(job_id, 0, 100) == b"before\nafter\n"
+
+    def test_prune_old_logs(self):
+        job_id = self._job("job-log-old")
+        app_module._append_log(job_id, "x")
+        app_module._close_job_log(job_id)
+        app_module._prune_job_logs(app_module.time.time() + 2 * 86400)
+        assert app_module.job_log_extent(job_id) is not None
+        app_module._prune_job_logs(app_module.time.time() + (app_module.JOB_LOG_RETENTION_DAYS + 1) * 86400)
+        assert app_module.job_log_extent(job_id) is None
+
+    def test_offset_and_tail(self, client):
+        job_id = self._job("job-log-route")
+        for i in range(10):
+            app_module._append_log(job_id, f"line {i}")   # 7 bytes each
+        resp = client.get(f"/jobs/{job_id}/log?offset=7&limit=14")
+        assert resp.status_code == 200
+        assert resp.data == b"line 1\nline 2\n"
+        assert resp.headers["X-Log-Offset"] == "7"
+        assert resp.headers["X-Log-Next"] == "21"
+        assert resp.headers["X-Log-End"] == "70"
+        tail = client.get(f"/jobs/{job_id}/log?offset=-7")
+        assert tail.data == b"line 9\n"
+        assert client.get(f"/jobs/{job_id}/log?offset=70").data == b""
+        assert client.get(f"/jobs/{job_id}/log?offset=x").status_code == 400
+
+    def test_range_requests(self, client):
+        job_id = self._job("job-log-range")
+        for i in range(10):
+            app_module._append_log(job_id, f"line {i}")
+        resp = client.get(f"/jobs/{job_id}/log", headers={"Range": "bytes=0-13"})
+        assert resp.status_code == 206
+        assert resp.data == b"line 0\nline 1\n"
+        assert resp.headers["Content-Range"] == "bytes 0-13/70"
+        resp = client.get(f"/jobs/{job_id}/log", headers={"Range": "bytes=-7"})
+        assert (resp.status_code, resp.data) == (206, b"line 9\n")
+        resp = client.get(f"/jobs/{job_id}/log", headers={"Range": "bytes=70-"})
+        assert resp.status_code == 416
+        assert resp.headers["Content-Range"] == "bytes */70"
+
+    def test_unknown_job(self, client):
+        assert client.get("/jobs/nope/log").status_code == 404
+        assert client.get("/jobs/..%2F..%2Fetc/log").status_code == 404
+
+
+class TestServing:
+    # Capacity target documented in the README: this many concurrent
+    # progress streams on one process, each woken promptly by a job change.
+    SSE_CLIENTS = 500
+
+    def test_background_threads_start_once(self):
+        starters = ("start_ejs_refresher", "start_scan_dispatcher",
+                    "start_download_workers", "start_scheduler")
+        with patch.dict(app_module._background_state, started=False), \
+             patch.multiple(app_module, **{name: MagicMock() for name in starters}):
+            assert app_module.start_background() is True
+            assert app_module.start_background() is False
+            for name in starters:
+                getattr(app_module, name).assert_called_once_with()
+
+    @staticmethod
+    def _read_until(socks, token, timeout):
+        """Read every socket until its output contains *token*; return how many did."""
+        buffers = {sock: b"" for sock in socks}
+        pending = set(socks)
+        deadline = time.monotonic() + timeout
+        with selectors.DefaultSelector() as sel:
+            for sock in socks:
+                sel.register(sock, selectors.EVENT_READ)
+            while pending and time.monotonic() < deadline:
+                for key, _ in sel.select(timeout=0.5):
+                    sock = key.fileobj
+                    buffers[sock] += sock.recv(65536)
+                    if token in buffers[sock]:
+                        pending.discard(sock)
+                        sel.unregister(sock)
+        return len(socks) - len(pending)
+
+    def test_sse_capacity(self, gevent_server):
+        job_id = "job-load"
+        app_module._jobs[job_id] = app_module._new_job()
+        threads_before = threading.active_count()
+        request = f"GET /progress/{job_id}/stream HTTP/1.1\r\nHost: localhost\r\n\r\n".encode()
+        clients = []
+        try:
+            for _ in range(self.SSE_CLIENTS):
+                sock = socket.create_connection(("127.0.0.1", gevent_server))
+                sock.sendall(request)
+                clients.append(sock)
+            assert self._read_until(clients, b"data: ", 30) == self.SSE_CLIENTS
+            # Streams are greenlets; only the handler threadpool adds threads.
+            assert threading.active_count() <= threads_before + app_module.HTTP_THREADS + 2
+
+            for path in ("/stages", "/jobs", "/watches/running"):
+                started = time.monotonic()
+                resp = requests.get(f"http://127.0.0.1:{gevent_server}{path}", timeout=5)
+                assert resp.status_code == 200
+                assert time.monotonic() - started < 1
+
+            # A change made on another thread reaches every stream.
+            started = time.monotonic()
+            app_module._append_log(job_id, "load-test-line")
+            app_module._notify_job(job_id)
+            assert self._read_until(clients, b"load-test-line", 10) == self.SSE_CLIENTS
+            assert time.monotonic() - started < 5
+        finally:
+            for sock in clients:
+                sock.close()
+            app_module._jobs.pop(job_id, None)
+
+    @staticmethod
+    def _returns_promptly(fn, *args):
+        result = []
+        reader = threading.Thread(target=lambda: result.append(fn(*args)), daemon=True)
+        reader.start()
+        reader.join(1)
+        return bool(result)
+
+    def test_slow_log_write_does_not_block_streams(self):
+        job_id = "job-slow-disk"
+        job = app_module._jobs[job_id] = app_module._new_job()
+        writing, release = threading.Event(), threading.Event()
+
+        def slow_open(*args):
+            writing.set()
+            release.wait(5)
+            raise OSError("slow disk")
+
+        with patch.object(app_module, "_open_job_log", side_effect=slow_open):
+            writer = threading.Thread(target=app_module._append_log, args=(job_id, "line"))
+            writer.start()
+            assert writing.wait(5)
+            try:
+                assert self._returns_promptly(app_module._log_since, job_id, job, 0)
+            finally:
+                release.set()
+                writer.join(5)
+
+    def test_slow_queue_write_does_not_block_streams(self, tmp_queue):
+        job_id = app_module.enqueue_download("https://youtube.com/watch?v=a")
+        writing, release = threading.Event(), threading.Event()
+
+        def slow_dump(*args, **kwargs):
+            writing.set()
+            release.wait(5)
+
+        with patch.object(app_module.json, "dump", side_effect=slow_dump):
+            writer = threading.Thread(target=app_module.enqueue_download,
+                                      args=("https://youtube.com/watch?v=b",))
+            writer.start()
+            assert writing.wait(5)
+            try:
+                assert self._returns_promptly(app_module.queue_position, job_id)
+            finally:
+                release.set()
+                writer.join(5)
+
+    def test_blocking_handler_leaves_loop_free(self, gevent_server):
+        def slow_stats():
+            time.sleep(2)
+            return {}
+
+        base = f"http://127.0.0.1:{gevent_server}"
+        with patch.object(app_module, "metadata_cache_stats", side_effect=slow_stats):
+            slow = threading.Thread(target=requests.get, args=(f"{base}/cache/stats",))
+            slow.start()
+            time.sleep(0.2)
+            started = time.monotonic()
+            assert requests.get(f"{base}/stages", timeout=5).status_code == 200
+            assert time.monotonic() - started < 1
+            slow.join(5)
+
+    def test_request_body_reaches_handler(self, gevent_server):
+        with patch.object(app_module, "reprioritize_job", return_value=True) as reprioritize, \
+             patch.object(app_module, "queue_position", return_value=1):
+            resp = requests.post(f"http://127.0.0.1:{gevent_server}/jobs/job-x/priority",
+                                 data={"priority": "7"}, timeout=5)
+        assert resp.json() == {"position": 1}
+        reprioritize.assert_called_once_with("job-x", 7)
+
+
+class TestMetrics:
+    @pytest.fixture(autouse=True)
+    def _fresh_metrics(self):
+        with patch.object(app_module, "_metric_values", {}):
+            yield
+
+    def test_counter_and_histogram_render(self):
+        app_module.count_metric("downloader_ytdlp_exit_codes_total", stage="download", code=1)
+        app_module.count_metric("downloader_ytdlp_exit_codes_total", stage="download", code=1)
+        app_module.observe_metric("downloader_jellyfin_scan_seconds", 0.3)
+        text = app_module.render_metrics()
+        assert 'downloader_ytdlp_exit_codes_total{code="1",stage="download"} 2' in text
+        assert 'downloader_jellyfin_scan_seconds_bucket{le="0.25"} 0' in text
+        assert 'downloader_jellyfin_scan_seconds_bucket{le="0.5"} 1' in text
+        assert 'downloader_jellyfin_scan_seconds_bucket{le="+Inf"} 1' in text
+        assert "downloader_jellyfin_scan_seconds_count 1" in text
+        assert "# TYPE downloader_job_duration_seconds histogram" in text
+
+    def test_undeclared_metric_is_rejected(self):
+        with pytest.raises(KeyError):
+            app_module.count_metric("downloader_typo_total")
+
+    def test_label_values_are_escaped(self):
+        app_module.set_metric("downloader_scheduler_last_lag_seconds", 1.5, watch_id='a"b')
+        assert 'downloader_scheduler_last_lag_seconds{watch_id="a\\"b"} 1.5' in app_module.render_metrics()
+
+    def test_finished_job_is_counted(self):
+        job_id = "job-metrics"
+        job = app_module._jobs[job_id] = app_module._new_job(status="done", watch_id="w1")
+        job["started"] = app_module.time.time() - 42
+        job["bytes"] = 1000
+        app_module._finish_job(job_id)
+        app_module._jobs.pop(job_id)
+        text = app_module.render_metrics()
+        assert 'downloader_jobs_total{kind="watch",status="done"} 1' in text
+        assert 'downloader_downloaded_bytes_total{kind="watch"} 1000' in text
+        assert 'downloader_job_duration_seconds_bucket{kind="watch",le="60"} 1' in text
+
+    def test_jellyfin_status_codes(self):
+        with patch.object(app_module._jellyfin_session, "post",
+                          return_value=MagicMock(status_code=204, content=b"", ok=True)):
+            app_module.trigger_jellyfin_scan(["/v"])
+        assert 'downloader_jellyfin_scan_responses_total{code="204"} 1' in app_module.render_metrics()
+
+    def test_scheduler_lag(self, tmp_watches_file, sample_watch):
+        app_module.save_watches([sample_watch])
+        now = datetime.now(timezone.utc)
+        with patch.object(app_module, "SCHEDULER_JITTER", 0), \
+             patch.object(app_module, "_schedule", []), \
+             patch.object(app_module, "_schedule_due", {}), \
+             patch.object(app_module, "start_watch_job", return_value=("j", True)):
+            app_module._scheduler_tick(now)
+        text = app_module.render_metrics()
+        assert "downloader_scheduler_lag_seconds_count 1" in text
+        assert f'downloader_scheduler_last_lag_seconds{{watch_id="{sample_watch["id"]}"}}' in text
+
+    def test_scheduler_lag_counts_from_due_time_not_catch_up(self, tmp_watches_file, sample_watch):
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        sample_watch["last_run"] = (now - timedelta(hours=10)).isoformat()
+        app_module.save_watches([sample_watch])
+        with patch.object(app_module, "SCHEDULER_JITTER", 0), \
+             patch.object(app_module, "_schedule", []), \
+             patch.object(app_module, "_schedule_due", {}), \
+             patch.object(app_module, "start_watch_job", return_value=("j", True)):
+            app_module._scheduler_tick(now)
+        text = app_module.render_metrics()
+        hours_late = 10 - sample_watch["interval_hours"]
+        assert (f'downloader_scheduler_last_lag_seconds{{watch_id="{sample_watch["id"]}"}} '
+                f'{hours_late * 3600.0}') in text
+
+    def test_scheduler_lag_includes_jitter(self, tmp_watches_file, sample_watch):
+        # An id whose offset makes the watch due early must not record negative lag.
+        sample_watch["id"] = next(f"w-{i}" for i in range(100)
+                                  if app_module._jitter_fraction(f"w-{i}") < -0.5)
+        sample_watch["last_run"] = "2026-02-22T08:00:00+00:00"
+        with patch.object(app_module, "SCHEDULER_JITTER", 0.1):
+            app_module.save_watches([sample_watch])
+            now = app_module._scheduled_due(sample_watch)[0]
+            with patch.object(app_module, "_schedule", []), \
+                 patch.object(app_module, "_schedule_due", {}), \
+                 patch.object(app_module, "start_watch_job", return_value=("j", True)):
+                app_module._scheduler_tick(now)
+        assert f'downloader_scheduler_last_lag_seconds{{watch_id="{sample_watch["id"]}"}} 0' \
+            in app_module.render_metrics()
+        assert "downloader_scheduler_lag_seconds_sum 0" in app_module.render_metrics()
+
+    def test_scheduler_lag_for_channel_mates(self, tmp_watches_file, sample_watch):
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        sample_watch["last_run"] = (now - timedelta(hours=10)).isoformat()
+        mate = dict(sample_watch, id="mate-id")
+        app_module.save_watches([sample_watch, mate])
+        with patch.object(app_module, "SCHEDULER_JITTER", 0), \
+             patch.object(app_module, "_schedule", []), \
+             patch.object(app_module, "_schedule_due", {}), \
+             patch.object(app_module, "start_watch_group", return_value=[]):
+            app_module._scheduler_tick(now)
+        text = app_module.render_metrics()
+        assert "downloader_scheduler_lag_seconds_count 2" in text
+        assert 'downloader_scheduler_last_lag_seconds{watch_id="mate-id"} 21600.0' in text
+
+    def test_route_includes_live_gauges(self, client):
+        resp = client.get("/metrics")
+        assert resp.mimetype == "text/plain"
+        assert 'downloader_stage_queued{stage="download"} 0' in resp.get_data(as_text=True)
+        assert "downloader_running_jobs" in resp.get_data(as_text=True)
+
+
 class TestTriggerJellyfinScan:
     def test_posts_to_jellyfin(self):
-        with patch("app.requests.post") as mock_post:
-            mock_post.return_value = MagicMock(status_code=204, content=b"")
-            app_module.trigger_jellyfin_scan()
+        with patch.object(app_module._jellyfin_session, "post") as mock_post:
+            mock_post.return_value = MagicMock(status_code=204, content=b"", ok=True)
+            assert app_module.trigger_jellyfin_scan() is True
         mock_post.assert_called_once()
         call_kwargs = mock_post.call_args
         assert "/Library/Media/Updated" in call_kwargs.args[0]
         assert "X-MediaBrowser-Token" in call_kwargs.kwargs["headers"]
 
+    def test_sends_only_given_paths(self):
+        with patch.object(app_module._jellyfin_session, "post") as mock_post:
+            mock_post.return_value = MagicMock(status_code=204, content=b"", ok=True)
+            app_module.trigger_jellyfin_scan(["/yt/A", "/yt/B"])
+        updates = mock_post.call_args.kwargs["json"]["dto"]["Updates"]
+        assert updates == [
+            {"Path": "/yt/A", "UpdateType": "Created"},
+            {"Path": "/yt/B", "UpdateType": "Created"},
+        ]
+
     def test_handles_exception(self):
-        with patch("app.requests.post", side_effect=Exception("timeout")):
-            app_module.trigger_jellyfin_scan()  # should not raise
+        with patch.object(app_module._jellyfin_session, "post", side_effect=Exception("timeout")), \
+             patch("app.time.sleep"):
+            assert app_module.trigger_jellyfin_scan() is False  # should not raise
+
+    def test_retries_server_errors(self):
+        responses = [
+            MagicMock(status_code=503, content=b"", ok=False),
+            MagicMock(status_code=204, content=b"", ok=True),
+        ]
+        with patch.object(app_module._jellyfin_session, "post", side_effect=responses) as mock_post, \
+             patch("app.time.sleep") as mock_sleep:
+            assert app_module.trigger_jellyfin_scan() is True
+        assert mock_post.call_count == 2
+        mock_sleep.assert_called_once_with(app_module.JELLYFIN_SCAN_BACKOFF)
+
+
+class TestScanDispatcher:
+    @pytest.fixture(autouse=True)
+    def _clean_pending(self):
+        with patch.object(app_module, "_scan_pending", set()), \
+             patch.object(app_module, "_scan_window", {}):
+            yield
+
+    def test_collapse_paths_drops_nested(self):
+        assert app_module._collapse_paths(["/yt/A/B", "/yt/A", "/yt/AB", "/yt/A/"]) == ["/yt/A", "/yt/AB"]
+
+    def test_requests_are_batched(self):
+        with patch.object(app_module, "JELLYFIN_SCAN_DELAY", 0):
+            app_module.request_jellyfin_scan({"/yt/A/W"})
+            app_module.request_jellyfin_scan({"/yt/B/W", "/yt/A/W"})
+            assert app_module._take_scan_batch() == ["/yt/A/W", "/yt/B/W"]
+        assert not app_module._scan_pending
+
+    def test_default_is_full_library(self):
+        with patch.object(app_module, "JELLYFIN_SCAN_DELAY", 0):
+            app_module.request_jellyfin_scan()
+            assert app_module._take_scan_batch() == [app_module.os.path.normpath(app_module.YOUTUBE_PATH)]
+
+    def test_debounce_extends_window_up_to_max(self):
+        with patch.object(app_module, "JELLYFIN_SCAN_DELAY", 30), \
+             patch.object(app_module, "JELLYFIN_SCAN_MAX_DELAY", 40), \
+             patch("app.time.monotonic", side_effect=[100, 120]):
+            app_module.request_jellyfin_scan({"/yt/A"})
+            assert app_module._scan_window["flush_at"] == 130
+            app_module.request_jellyfin_scan({"/yt/B"})
+            assert app_module._scan_window["flush_at"] == 140
 
 
 class TestWatchesHtml: